@@ -1,13 +1,124 @@
-from flask import Flask, request, abort, jsonify
+import os
+import time
+import hmac
+import hashlib
+import logging
+import threading
+from flask import Flask, Response, g, request, abort, jsonify
 from flask_restful import Api, Resource, reqparse
+from flask_restful.representations.json import output_json
 from neo4j_conn import Neo4jConn
-from traversal_util import CourseNode, create_full_tree_from_apoc, create_prerequisite_tree_from_apoc, mark_completion, course_node_to_dict, commonality_algorithm
+from cache import LRUCache
+from graph_backend import Neo4jBackend, FallbackBackend, CachingBackend, approximate_subgraph_size
+from graph_snapshot import GraphSnapshot
+from local_backend import LocalBackend
+import output
+from circuit import CircuitCache, backend_version
+from batch import evaluate_batch, batch_results
+from traversal_util import commonality_from_course_codes, CourseNotFound
+from fast_json import encode_course_response, dumps
+from compact import CompactTrees
+import instrumentation
+from instrumentation import phase
+import metrics
+import profiling
+import compression
+from worker_commands import WorkerCommands
 
 app = Flask(__name__)
 api = Api(app)
 
-# Initialize neo4j connection
-neo4j = Neo4jConn()
+# DEBUG also logs every node and relationship of the prerequisite trees (traversal_util logger)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger(__name__)
+
+# "neo4j" to build trees from the database, "local" to build them from output.py without any database
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")
+# Use output.py whenever Neo4j fails
+GRAPH_FALLBACK_LOCAL = os.getenv("GRAPH_FALLBACK_LOCAL", "0") == "1"
+
+# In-memory snapshot of the course graph, loaded once per worker. Trees are built from it instead of querying Neo4j on every request
+USE_GRAPH_SNAPSHOT = os.getenv("USE_GRAPH_SNAPSHOT", "1") == "1"
+# Token of the X-Reload-Token header of POST /snapshot/, DELETE /cache/ and DELETE /timing/, they are disabled if it is not set
+SNAPSHOT_RELOAD_TOKEN = os.getenv("SNAPSHOT_RELOAD_TOKEN")
+
+# Cache of the subgraphs fetched from the backend when the snapshot is not used (0 entries disables it)
+SUBGRAPH_CACHE_MAX_ENTRIES = int(os.getenv("SUBGRAPH_CACHE_MAX_ENTRIES", "1024"))
+SUBGRAPH_CACHE_MAX_BYTES = int(os.getenv("SUBGRAPH_CACHE_MAX_BYTES", "0")) or None
+SUBGRAPH_CACHE_TTL = float(os.getenv("SUBGRAPH_CACHE_TTL", "3600")) or None
+
+# Cache of the trees compiled into circuits, by (course_code, tree_choice)
+CIRCUIT_CACHE_MAX_ENTRIES = int(os.getenv("CIRCUIT_CACHE_MAX_ENTRIES", "1024"))
+CIRCUIT_CACHE_TTL = float(os.getenv("CIRCUIT_CACHE_TTL", "3600")) or None
+
+# Cache of the encoded /course/ responses, bounded by their total bytes (0 disables it)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600")) or None
+
+# max-age of the GET /course/<code> responses, 0 makes browsers and CDNs revalidate them (ETag) every time
+COURSE_CACHE_MAX_AGE = int(os.getenv("COURSE_CACHE_MAX_AGE", "0"))
+
+# Threads fetching the trees of the desired courses at the same time, one Neo4j session per course (0 fetches them with one batched query).
+# Shared by the requests of a worker, keep it below N4J_MAX_CONNECTION_POOL_SIZE
+NEO4J_FANOUT_THREADS = int(os.getenv("NEO4J_FANOUT_THREADS", "0"))
+
+# Fetch the trees with a Cypher projection of small lists ([id, kind, code, index] nodes, [start, end] relationships) instead of full Node and Relationship objects
+NEO4J_LEAN_QUERIES = os.getenv("NEO4J_LEAN_QUERIES", "0") == "1"
+# Where the full names of the lean trees come from: "database" (fetched once) or "local" (output_titles_dict of output.py, the database is only asked for courses missing from it)
+NEO4J_LEAN_TITLES = os.getenv("NEO4J_LEAN_TITLES", "database")
+
+# "background" connects to Neo4j and loads the snapshot in a thread as soon as a worker starts, "request" on the first request of the worker (which waits for it)
+NEO4J_WARM_UP = os.getenv("NEO4J_WARM_UP", "background")
+# Seconds between two connection attempts of the background warm-up while Neo4j is unreachable
+NEO4J_WARM_UP_RETRY = float(os.getenv("NEO4J_WARM_UP_RETRY", "5"))
+
+# Maximum number of students in one /course/batch/ request
+BATCH_MAX_STUDENTS = int(os.getenv("BATCH_MAX_STUDENTS", "10000"))
+
+if GRAPH_BACKEND == "local":
+    neo4j = None
+    backend = LocalBackend()
+else:
+    # The driver is created by each worker on first use (see start_warm_up), nothing connects at import
+    neo4j = Neo4jConn(lazy=True)
+    backend = Neo4jBackend(
+        neo4j,
+        on_query=metrics.observe_neo4j_query,
+        fanout_threads=NEO4J_FANOUT_THREADS,
+        lean=NEO4J_LEAN_QUERIES,
+        titles=output.output_titles_dict if NEO4J_LEAN_TITLES == "local" else None
+    )
+    if GRAPH_FALLBACK_LOCAL:
+        backend = FallbackBackend(backend, LocalBackend())
+    if SUBGRAPH_CACHE_MAX_ENTRIES > 0:
+        backend = CachingBackend(backend, LRUCache(
+            max_entries=SUBGRAPH_CACHE_MAX_ENTRIES,
+            max_size=SUBGRAPH_CACHE_MAX_BYTES,
+            ttl=SUBGRAPH_CACHE_TTL,
+            sizeof=approximate_subgraph_size,
+            on_event=metrics.cache_event_hook("subgraph")
+        ))
+
+# Loaded by the warm-up of each worker
+snapshot = GraphSnapshot()
+
+circuits = CircuitCache(LRUCache(
+    max_entries=CIRCUIT_CACHE_MAX_ENTRIES,
+    ttl=CIRCUIT_CACHE_TTL,
+    on_event=metrics.cache_event_hook("circuit")
+))
+
+responses = LRUCache(
+    max_entries=None,
+    max_size=RESPONSE_CACHE_MAX_BYTES,
+    ttl=RESPONSE_CACHE_TTL,
+    sizeof=len,
+    on_event=metrics.cache_event_hook("response")
+) if RESPONSE_CACHE_MAX_BYTES > 0 else None
+
+# Snapshot reloads (and cache clears, timing resets) reach every worker of the server through it
+worker_commands = WorkerCommands()
 
 # Testing put args from request parser to parse the body of the request
 person_put_args = reqparse.RequestParser()
@@ -71,6 +182,155 @@ class Helloworld(Resource):
 
 tree = {}
 
+def tree_backend():
+    """
+    The backend to build trees from: the graph snapshot if it is loaded, otherwise the configured backend
+    """
+    return snapshot if snapshot.loaded else backend
+
+
+# Process that started the warm-up (a forked worker starts its own), whether it is still running and time.monotonic() of its last attempt
+_warm_up = {"pid": None, "running": False, "attempted_at": 0.0}
+_warm_up_lock = threading.Lock()
+
+
+def start_warm_up():
+    """
+    Warm this worker up once: in a background thread (NEO4J_WARM_UP = "background") or right away ("request").
+    Called by gunicorn after a worker started (gunicorn.conf.py) and before every request, so servers without the hook warm up on the first request
+    """
+    if neo4j is None or _warm_up["pid"] == os.getpid():
+        return
+    with _warm_up_lock:
+        if _warm_up["pid"] == os.getpid():
+            return
+        _warm_up["pid"] = os.getpid()
+        if NEO4J_WARM_UP == "background":
+            start_warm_up_thread(retry=True)
+            return
+
+    warm_up()
+
+
+def start_warm_up_thread(retry: bool = False):
+    """
+    Run warm_up in a background thread. Called with _warm_up_lock held, running is set before the thread starts so no other warm-up is started meanwhile
+    """
+    _warm_up["running"] = True
+    threading.Thread(target=warm_up, kwargs={"retry": retry}, name="neo4j-warm-up", daemon=True).start()
+
+
+def warm_up(retry: bool = False):
+    """
+    Connect to Neo4j (the first connection of the pool) and load the graph snapshot (USE_GRAPH_SNAPSHOT)
+
+    Args:
+    - retry (bool): Whether to keep trying to connect every NEO4J_WARM_UP_RETRY seconds until Neo4j is reachable
+
+    Notes:
+    - Requests are served while the worker warms up, they query Neo4j (connecting on their own) until the snapshot is loaded
+    """
+    _warm_up["running"] = True
+    try:
+        attempts = 0
+        while True:
+            try:
+                _warm_up["attempted_at"] = time.monotonic()
+                neo4j.verify_connectivity()
+                break
+            except Exception as e:
+                # Only the first failure is a warning, the retries would fill the log while Neo4j is down
+                logger.log(logging.WARNING if attempts == 0 else logging.DEBUG, "Could not connect to Neo4j: %s", e)
+                if not retry:
+                    return
+                attempts += 1
+                time.sleep(NEO4J_WARM_UP_RETRY)
+
+        if USE_GRAPH_SNAPSHOT and not snapshot.loaded:
+            try:
+                load_snapshot()
+            except Exception as e:
+                # Requests fall back to querying Neo4j until the snapshot is reloaded
+                logger.warning("Could not load the graph snapshot: %s", e)
+    finally:
+        _warm_up["running"] = False
+
+
+# The warm-up and the reloads published by other workers can overlap, a worker loads one snapshot at a time
+_snapshot_lock = threading.Lock()
+
+
+def load_snapshot(version: int = None) -> bool:
+    """
+    (Re)load the graph snapshot from Neo4j
+
+    Args:
+    - version (int): The version of the snapshot, the same in every worker: the number of reloads published so far + 1 if None (see SnapshotQuery.post)
+
+    Returns:
+    - bool: Whether the snapshot was loaded, False if this worker already has this version or a later one
+    """
+    with _snapshot_lock:
+        if version is None:
+            version = worker_commands.count("snapshot") + 1
+        if snapshot.version >= version:
+            return False
+
+        started_at = time.perf_counter()
+        with neo4j.session() as session:
+            snapshot.reload(session, version)
+        metrics.observe_neo4j_query("snapshot", time.perf_counter() - started_at)
+    return True
+
+
+def reload_snapshot(version: int):
+    """
+    Reload the graph snapshot of this worker after another worker published a reload, and clear the caches built from the previous one
+    """
+    try:
+        if load_snapshot(version):
+            clear_caches()
+    except Exception as e:
+        # The worker keeps its previous snapshot
+        logger.warning("Could not reload the graph snapshot: %s", e)
+
+
+def clear_caches(course_code: str = None):
+    """
+    Clear the subgraph cache and the compiled circuits of this worker (only those of one course if course_code is given), and every cached response
+    """
+    if isinstance(backend, CachingBackend):
+        backend.invalidate(course_code)
+    circuits.invalidate(course_code)
+    if responses is not None:
+        responses.invalidate()
+
+
+def run_worker_command(command: dict):
+    """
+    Run a command published by another worker (see worker_commands.py)
+
+    Args:
+    - command (dict): ({action: str, count: int, ...arguments}) as returned by WorkerCommands.poll
+    """
+    if command["action"] == "snapshot" and neo4j is not None:
+        # In the background, requests keep using the previous snapshot until the new one is swapped in
+        threading.Thread(target=reload_snapshot, args=(command["count"] + 1,), name="snapshot-reload", daemon=True).start()
+    elif command["action"] == "cache":
+        clear_caches(command["course"])
+    elif command["action"] == "timing":
+        instrumentation.aggregates.reset()
+
+
+def is_ready() -> bool:
+    """
+    Whether this worker is warmed up: connected to Neo4j, with the snapshot loaded if USE_GRAPH_SNAPSHOT (always with GRAPH_BACKEND = "local")
+    """
+    if neo4j is None:
+        return True
+    return neo4j.connected and (snapshot.loaded or not USE_GRAPH_SNAPSHOT)
+
+
 class CourseQuery(Resource):
     """
     This is the endpoint for UofT Course Queries to Neo4J
@@ -87,34 +347,34 @@ class CourseQuery(Resource):
             dict: ({
                 code: str
                 full_name: str
-            }): Details about the course
+            }): Details about the course, with a strong ETag. 304 (no body) if If-None-Match has the ETag
+
+        Raises:
+            404: Course doesn't exist
         """
 
-        result = neo4j._driver.execute_query(
-            """
-            MATCH (c:Course {code: $code})
-            RETURN count(c) as count
-            """,
-            code=course_name
-        )
-        count = result.records[0]["count"]
-        if count == 0:
+        # Known before looking the course up when the catalog has a fingerprint
+        etag = course_etag(course_name)
+        if etag is not None:
+            matched = compression.matching_etag(request.if_none_match, etag)
+            if matched is not None:
+                return not_modified(matched)
+
+        with phase("find_course"):
+            course = tree_backend().find_course(course_name)
+        if course is None:
             abort(404, description="Course not found")
-        else:
-            # Get the full name of the course
-            result = neo4j._driver.execute_query(
-                """
-                MATCH (c:Course {code: $code})
-                RETURN c.full_name as full_name
-                """,
-                code=course_name
-            )
-            full_name = result.records[0]["full_name"]
-            
-            return {
-                "code": course_name,
-                "full_name": full_name
-            }
+
+        # Through Flask-RESTful like the other resources, which sets the application/json Content-Type
+        response = api.make_response(course, 200)
+        if etag is None:
+            etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+            matched = compression.matching_etag(request.if_none_match, etag)
+            if matched is not None:
+                return not_modified(matched)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = course_cache_control()
+        return response
 
 
     @app.route("/course/")
@@ -134,15 +394,26 @@ class CourseQuery(Resource):
         - desired_courses (list[str]): List of course codes to generate trees for.
         - tree_choice (str): Type of tree to generate. Must be either "full" or "prerequisite".
 
+        Query parameters:
+        - stream=1: Return the trees as NDJSON (application/x-ndjson) as soon as each one is ready, see stream_course_trees
+        - format=compact: Return the trees as one table of unique nodes and an edge list per tree, see CompactTrees (ignored with stream=1)
+
 
         Returns:
         dict: ({
             course_trees: [dict]
             commonality: dict
+        }), or with format=compact ({
+            format: "compact"
+            nodes: [[int, str or int, int]]
+            titles: {str: str}
+            course_trees: [{code: str, root: int, edges: [[int, int]]}]
+            commonality: dict
         })
 
         Raises:
         400: Bad Request - Invalid JSON or no data provided
+        404: One of the desired courses doesn't exist (with stream=1, an error line is sent instead)
 
         """
 
@@ -150,39 +421,609 @@ class CourseQuery(Resource):
         if not data:
             abort(400, description="Invalid JSON or no data provided")
         
-        completed_courses = data.get("completed_courses", [])
-        desired_courses = data.get("desired_courses", [])
+        completed_courses = course_code_list(data.get("completed_courses", []), "completed_courses")
+        desired_courses = course_code_list(data.get("desired_courses", []), "desired_courses")
         tree_choice = data.get("tree_choice", "full")
+        g.tree_choice = metrics_tree_choice(tree_choice)
 
-        arr_of_dicts = []
-        
-        arr_tree_nodes = []
-
-        with neo4j._driver.session() as session:
-            for course in desired_courses:
-                if tree_choice == "full":
-                    tree = create_full_tree_from_apoc(session, course)
-                    arr_tree_nodes.append(tree)
-                    mark_completion(tree, completed_courses)
-                    dict_of_node = course_node_to_dict(tree)
-                    arr_of_dicts.append(dict_of_node)
-                else:
-                    tree = create_prerequisite_tree_from_apoc(session, course)
-                    arr_tree_nodes.append(tree)
-                    mark_completion(tree, completed_courses)
-                    dict_of_node = course_node_to_dict(tree)
-                    arr_of_dicts.append(dict_of_node)
-        
-        commonality_dict = commonality_algorithm(arr_tree_nodes)
-        
+        if request.args.get("stream") == "1":
+            return Response(
+                stream_course_trees(completed_courses, desired_courses, tree_choice),
+                status=200,
+                mimetype="application/x-ndjson",
+                # Tells proxies (e.g. nginx) not to buffer the lines
+                headers={"X-Accel-Buffering": "no"}
+            )
+
+        response_format = "compact" if request.args.get("format") == "compact" else "nested"
+
+        # The catalog the circuits come from and the one in the response key are read once, so a response is never cached under a newer catalog than its trees
+        graph = tree_backend()
+        version = backend_version(graph)
+        response_key = course_response_key(completed_courses, desired_courses, tree_choice, response_format, version)
+        if responses is not None:
+            encoded = responses.get(response_key)
+            if encoded is not None:
+                return Response(encoded, status=200, mimetype="application/json")
+
+        started_at = time.perf_counter()
+
+        # Compiled trees are cached, the ones that aren't are built with one round trip (or none with the snapshot)
+        try:
+            course_circuits = circuits.circuits(graph, desired_courses, tree_choice, version)
+        except CourseNotFound as e:
+            abort(404, description=f"Course not found: {e.course_code}")
+
+        encoded = build_course_response(course_circuits, completed_courses, tree_choice, response_format, started_at)
+        if responses is not None:
+            responses.set(response_key, encoded)
+        return Response(encoded, status=200, mimetype="application/json")
+
+
+def course_response_key(completed_courses: list[str], desired_courses: list[str], tree_choice: str, response_format: str, version: int) -> tuple:
+    """
+    The key of a /course/ response in the response cache: same body (up to the order and duplicates of the completed courses),
+    same format and same catalog, same response
+
+    Args:
+    - version (int): The version of the catalog the circuits of the response come from (the version passed to CircuitCache.circuits)
+    """
+    return (
+        tuple(sorted(set(completed_courses))),
+        tuple(desired_courses),
+        metrics_tree_choice(tree_choice),
+        response_format,
+        version
+    )
+
+
+def build_course_response(course_circuits: list, completed_courses: list[str], tree_choice: str, response_format: str, started_at: float) -> bytes:
+    """
+    Mark the circuits of the desired courses, compute their commonality and encode the /course/ response
+
+    Args:
+    - course_circuits (list[PrerequisiteCircuit]): The circuit of each desired course, in request order
+    - completed_courses (list[str]): List of course codes already completed
+    - tree_choice (str): "full" or "prerequisite"
+    - response_format (str): "compact" or "nested"
+    - started_at (float): time.perf_counter() before the circuits were fetched, for the summary log line
+
+    Returns:
+    - bytes: The JSON of the response
+    """
+    tree_jsons = []
+    compact_trees = CompactTrees() if response_format == "compact" else None
+    trees_done_at = time.perf_counter()
+
+    # The completed courses become one bitmask, every tree is marked with it
+    completed_mask = circuits.completed_mask(completed_courses)
+    course_codes = {}
+    for circuit in course_circuits:
+        with phase("mark"):
+            state = circuit.evaluate(completed_mask)
+        # Encoded straight to JSON bytes, without building the dicts of the tree
+        with phase("encode"):
+            if compact_trees is not None:
+                compact_trees.add_tree(circuit.root_code, circuit.tree, state)
+            else:
+                tree_jsons.append(circuit.to_json(state))
+        course_codes[circuit.root_code] = circuit.course_codes
+    mark_done_at = time.perf_counter()
+
+    for circuit in course_circuits:
+        metrics.TREE_NODES.labels(tree_choice=metrics_tree_choice(tree_choice)).observe(len(circuit.tree))
+    metrics.COMMONALITY_COURSES.observe(len(course_codes))
+    metrics.COMMONALITY_CODES.observe(sum(len(codes) for codes in course_codes.values()))
+
+    with phase("commonality"):
+        commonality_dict = commonality_from_course_codes(course_codes)
+    commonality_done_at = time.perf_counter()
+
+    logger.info(
+        "course_query courses=%d nodes=%d tree_choice=%s trees_ms=%.2f mark_ms=%.2f commonality_ms=%.2f",
+        len(course_circuits), sum(len(circuit.tree) for circuit in course_circuits), tree_choice,
+        (trees_done_at - started_at) * 1000, (mark_done_at - trees_done_at) * 1000, (commonality_done_at - mark_done_at) * 1000
+    )
+
+    with phase("encode"):
+        if compact_trees is not None:
+            return dumps({"format": "compact", **compact_trees.to_dict(), "commonality": commonality_dict})
+        return encode_course_response(tree_jsons, commonality_dict)
+
+
+def stream_course_trees(completed_courses: list[str], desired_courses: list[str], tree_choice: str):
+    """
+    Generate the /course/ response as NDJSON, one line per course tree as soon as it is built and marked, then the commonality
+
+    Args:
+    - completed_courses (list[str]): List of course codes already completed
+    - desired_courses (list[str]): List of course codes to generate trees for
+    - tree_choice (str): "full" or "prerequisite"
+
+    Yields:
+    - bytes: A {"course_tree": dict} line for every desired course (same trees as course_trees, in the same order),
+    then a {"commonality": dict} line. If a course doesn't exist, a {"error": str} line is the last line instead
+
+    Notes:
+    - Each course is fetched on its own (no batched round trip), so the first line is sent without waiting for the other courses
+    - Streamed responses are not cached
+    """
+    # Read once, the circuits of every course are looked up for the same catalog version
+    graph = tree_backend()
+    version = backend_version(graph)
+    course_codes = {}
+    for course_code in desired_courses:
+        try:
+            circuit = circuits.circuits(graph, [course_code], tree_choice, version)[0]
+        except CourseNotFound as e:
+            yield dumps({"error": f"Course not found: {e.course_code}"}) + b"\n"
+            return
+
+        # After the course is compiled, so the completed courses in its tree have a bit
+        state = circuit.evaluate(circuits.completed_mask(completed_courses))
+        yield b'{"course_tree":' + circuit.to_json(state) + b"}\n"
+        course_codes[circuit.root_code] = circuit.course_codes
+
+    yield dumps({"commonality": commonality_from_course_codes(course_codes)}) + b"\n"
+
+
+class CourseBatchQuery(Resource):
+    """
+    This is the endpoint to evaluate the same courses for many students at once (e.g. what-if reports for a cohort)
+    """
+
+    def post(self):
+        """
+        Evaluate the trees of the desired courses for every list of completed courses.
+
+        Request body:
+        {
+            completed_courses_lists: [[str]]
+            desired_courses: [str]
+            tree_choice: str
+        }
+
+        Required Fields:
+        - completed_courses_lists (list[list[str]]): The course codes completed by each student.
+        - desired_courses (list[str]): List of course codes to evaluate.
+        - tree_choice (str): Type of tree to evaluate. Must be either "full" or "prerequisite".
+
+        Returns:
+        dict: ({
+            courses: [{code: str, nodes: [dict]}]
+            students: [[{completed: [int], marked: [int], ready_to_take: [int]}]]
+        }): The nodes of each tree once (the root is the last node, children are node positions),
+        and for each student and each course the positions of the completed, marked and ready to take nodes
+
+        Raises:
+        400: Bad Request - Invalid JSON, no data provided, fields that are not lists of course codes, or more than BATCH_MAX_STUDENTS students
+        404: One of the desired courses doesn't exist
+        """
+
+        data = request.json
+        if not data or not isinstance(data, dict):
+            abort(400, description="Invalid JSON or no data provided")
+
+        completed_courses_lists = data.get("completed_courses_lists", [])
+        if not isinstance(completed_courses_lists, list):
+            abort(400, description="completed_courses_lists must be a list of lists of course codes")
+        if len(completed_courses_lists) > BATCH_MAX_STUDENTS:
+            abort(400, description=f"At most {BATCH_MAX_STUDENTS} students per request")
+
+        # Checked and uppercased like the fields of /course/
+        completed_courses_lists = [
+            course_code_list(completed_courses, f"completed_courses_lists[{student}]")
+            for student, completed_courses in enumerate(completed_courses_lists)
+        ]
+        desired_courses = course_code_list(data.get("desired_courses", []), "desired_courses")
+        tree_choice = data.get("tree_choice", "full")
+        g.tree_choice = metrics_tree_choice(tree_choice)
+
+        started_at = time.perf_counter()
+        try:
+            course_circuits, states = evaluate_batch(circuits, tree_backend(), completed_courses_lists, desired_courses, tree_choice)
+        except CourseNotFound as e:
+            abort(404, description=f"Course not found: {e.course_code}")
+        evaluate_done_at = time.perf_counter()
+
+        with phase("results"):
+            results = batch_results(course_circuits, states, len(completed_courses_lists))
+        results_done_at = time.perf_counter()
+
+        logger.info(
+            "course_batch_query students=%d courses=%d nodes=%d tree_choice=%s evaluate_ms=%.2f results_ms=%.2f",
+            len(completed_courses_lists), len(course_circuits), sum(len(circuit.tree) for circuit in course_circuits), tree_choice,
+            (evaluate_done_at - started_at) * 1000, (results_done_at - evaluate_done_at) * 1000
+        )
+
+        return results, 200
+
+
+
+class SnapshotQuery(Resource):
+    """
+    This is the endpoint to inspect and reload the in-memory graph snapshot
+    """
+
+    def get(self):
+        """
+        Get details about the graph snapshot
+
+        Returns:
+            dict: ({
+                loaded: bool
+                version: int
+                loaded_at: float
+                node_count: int
+            }): Details about the snapshot
+        """
+        return {
+            "loaded": snapshot.loaded,
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "node_count": snapshot.node_count()
+        }
+
+    def post(self):
+        """
+        Reload the graph snapshot from Neo4j, e.g. after the catalog was updated. The request needs an X-Reload-Token header matching SNAPSHOT_RELOAD_TOKEN.
+        This worker reloads right away, the other workers of the server reload in the background before their next request (see worker_commands.py)
+
+        Returns:
+            dict: Details about the reloaded snapshot (same as GET)
+
+        Raises:
+            403: SNAPSHOT_RELOAD_TOKEN is not set, or missing or wrong X-Reload-Token
+            400: There is no Neo4j database to reload from
+        """
+        check_reload_token()
+        if neo4j is None:
+            abort(400, description="No Neo4j database to reload the snapshot from")
+
+        version = worker_commands.publish("snapshot") + 1
+        load_snapshot(version)
+        clear_caches()
+        return self.get()
+
+
+class CacheQuery(Resource):
+    """
+    This is the endpoint to inspect and clear the subgraph cache
+    """
+
+    def get(self):
+        """
+        Get the counters of the subgraph cache and of the compiled circuits cache
+
+        Returns:
+            dict: ({
+                enabled: bool
+                entries: int
+                size: int
+                hits: int
+                misses: int
+                evictions: int
+                hit_ratio: float
+                circuits: dict
+                responses: dict
+            }): Counters of the subgraph cache, and the same counters for the circuits and the /course/ responses
+        """
+        other_caches = {
+            "circuits": circuits.cache.stats(),
+            "responses": responses.stats() if responses is not None else {"enabled": False}
+        }
+        if not isinstance(backend, CachingBackend):
+            return {"enabled": False, **other_caches}
+        return {"enabled": True, **backend.cache.stats(), **other_caches}
+
+    def delete(self):
+        """
+        Clear the subgraph cache and the compiled circuits, or only those of one course with ?course=<code>. The cached responses are always all cleared.
+        The request needs an X-Reload-Token header matching SNAPSHOT_RELOAD_TOKEN. The other workers of the server clear theirs before their next request
+
+        Returns:
+            dict: Counters of the cache of this worker (same as GET)
+
+        Raises:
+            403: SNAPSHOT_RELOAD_TOKEN is not set, or missing or wrong X-Reload-Token
+        """
+        check_reload_token()
+        course_code = request.args.get("course")
+        worker_commands.publish("cache", course=course_code)
+        clear_caches(course_code)
+        return self.get()
+
+
+class TimingQuery(Resource):
+    """
+    This is the endpoint to inspect the phase timings aggregated by this worker (SERVER_TIMING = "1")
+    """
+
+    def get(self):
+        """
+        Get the phase timings of the requests handled by this worker process
+
+        Returns:
+            dict: ({
+                enabled: bool
+                pid: int
+                endpoints: {endpoint: {requests: int, phases: {phase: {count: int, total_ms: float, mean_ms: float, max_ms: float}}}}
+            }): The aggregates of this worker
+        """
         return {
-            "course_trees": arr_of_dicts,
-            "commonality": commonality_dict
-        }, 200
-    
+            "enabled": instrumentation.SERVER_TIMING,
+            "pid": os.getpid(),
+            "endpoints": instrumentation.aggregates.stats()
+        }
+
+    def delete(self):
+        """
+        Reset the phase timings of every worker of the server (the other workers reset theirs before their next request).
+        The request needs an X-Reload-Token header matching SNAPSHOT_RELOAD_TOKEN.
+
+        Returns:
+            dict: The aggregates of this worker (same as GET)
+
+        Raises:
+            403: SNAPSHOT_RELOAD_TOKEN is not set, or missing or wrong X-Reload-Token
+        """
+        check_reload_token()
+        worker_commands.publish("timing")
+        instrumentation.aggregates.reset()
+        return self.get()
+
+
+@api.representation("application/json")
+def output_timed_json(data, code, headers=None):
+    """
+    Flask-RESTful's JSON representation, timed as the "encode" phase.
+    Use it through api.make_response, output_json alone doesn't set the Content-Type
+    """
+    with phase("encode"):
+        return output_json(data, code, headers)
+
+
+@app.before_request
+def warm_up_worker():
+    start_warm_up()
+
+
+@app.before_request
+def run_worker_commands():
+    """
+    Run the commands the other workers published since the last request of this worker (one os.stat when there is none)
+    """
+    for command in worker_commands.poll():
+        run_worker_command(command)
+
+
+@app.before_request
+def start_timing():
+    g.started_at = time.perf_counter()
+    instrumentation.start_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Add the Server-Timing header of the request, if it was timed. A streamed response is aggregated once its body is done instead
+    """
+    endpoint = f"{request.method} {request.endpoint}"
+    if response.is_streamed:
+        finish = instrumentation.finish_streamed_request(endpoint)
+        if finish is not None:
+            response.call_on_close(finish)
+        return response
+
+    server_timing = instrumentation.finish_request(endpoint)
+    if server_timing is not None:
+        response.headers["Server-Timing"] = server_timing
+        # Lets the frontend (another origin) read the timings in the browser devtools
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+@app.before_request
+def start_profile():
+    """
+    Profile the request with cProfile if PROFILE_DIR is set, and it has an X-Profile header or is sampled (PROFILE_SAMPLE_RATE)
+    """
+    g.profile = None
+    if profiling.should_profile(request.headers.get("X-Profile")):
+        g.profile = profiling.start_profile(f"{request.method}-{request.endpoint or 'unknown'}")
+
+
+@app.after_request
+def add_profile_path(response):
+    """
+    Stop the profile of the request (of a streamed response, once its body is done), and send the name of its pstats file (in PROFILE_DIR) in the X-Profile-File header
+    """
+    profile = g.get("profile")
+    if profile is not None:
+        g.profile = None
+        # Only the file name, the directories of the server stay private
+        response.headers["X-Profile-File"] = profile.file_name
+        if response.is_streamed:
+            response.call_on_close(profile.stop)
+        else:
+            profile.stop()
+    return response
+
+
+@app.teardown_request
+def stop_profile(exception=None):
+    # The profile is still running if the request failed before after_request
+    profile = g.get("profile")
+    if profile is not None:
+        g.profile = None
+        profile.stop()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Observe the latency of the request (of a streamed response, once its body is done), and the Neo4j pool connections of this worker
+    """
+    latency = metrics.REQUEST_LATENCY.labels(
+        endpoint=request.endpoint or "unknown",
+        method=request.method,
+        tree_choice=g.get("tree_choice", "none"),
+        status=str(response.status_code)
+    )
+    started_at = g.get("started_at", time.perf_counter())
+    if response.is_streamed:
+        response.call_on_close(lambda: latency.observe(time.perf_counter() - started_at))
+    else:
+        latency.observe(time.perf_counter() - started_at)
+    metrics.update_pool_gauges(neo4j.driver_if_created() if neo4j is not None else None)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress the response with br or gzip if the client accepts it (see compression.compress_response).
+    Registered last so it runs first, the latency metrics and the Server-Timing header include it
+    """
+    with phase("compress"):
+        return compression.compress_response(response, request.accept_encodings)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus metrics of every worker (PROMETHEUS_MULTIPROC_DIR), or of this worker only
+    """
+    body, content_type = metrics.generate_metrics()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/healthz")
+def healthz():
+    """
+    Liveness: the worker is up and answering. Always 200, with the state of its Neo4j connection pool
+    """
+    return jsonify({"status": "ok", "pid": os.getpid(), "neo4j": neo4j_state()})
+
+
+@app.route("/readyz")
+def readyz():
+    """
+    Readiness: 200 once the worker is warmed up (see is_ready), 503 before.
+    If the warm-up failed and isn't running anymore, it is retried in the background (at most every NEO4J_WARM_UP_RETRY seconds), so the probe recovers once Neo4j is back.
+    The probe never waits for it
+    """
+    if not is_ready():
+        with _warm_up_lock:
+            retry_due = time.monotonic() - _warm_up["attempted_at"] >= NEO4J_WARM_UP_RETRY
+            if not _warm_up["running"] and _warm_up["pid"] == os.getpid() and retry_due:
+                _warm_up["attempted_at"] = time.monotonic()
+                start_warm_up_thread()
+
+    ready = is_ready()
+    return jsonify({
+        "status": "ready" if ready else "warming_up",
+        "pid": os.getpid(),
+        "neo4j": neo4j_state(),
+        "snapshot": {"enabled": USE_GRAPH_SNAPSHOT, "loaded": snapshot.loaded, "version": snapshot.version}
+    }), 200 if ready else 503
+
+
+def neo4j_state() -> dict:
+    """
+    The state of the Neo4j connection of this worker, for /healthz and /readyz
+
+    Returns:
+    - dict: ({connected: bool, error: str, pool: {in_use: int, idle: int, max: int}}), pool is None before the driver is created. None with GRAPH_BACKEND = "local"
+    """
+    if neo4j is None:
+        return None
+    return {
+        "connected": neo4j.connected,
+        "error": neo4j.error,
+        "pool": metrics.pool_state(neo4j.driver_if_created())
+    }
+
+
+def course_code_list(value, field: str) -> list[str]:
+    """
+    Check that a field of the request body is a list of course codes, and uppercase them (the codes of the catalog are uppercase)
+
+    Args:
+    - value: The value of the field
+    - field (str): The name of the field, for the error message
+
+    Returns:
+    - list[str]: The uppercased course codes, in the same order
+    """
+    if not isinstance(value, list) or not all(isinstance(code, str) for code in value):
+        abort(400, description=f"{field} must be a list of course codes")
+    return [code.strip().upper() for code in value]
+
+
+def course_etag(course_code: str) -> str:
+    """
+    The strong ETag of GET /course/<code>, from the fingerprint of the catalog (GraphSnapshot.fingerprint).
+    The same in every worker that loaded the same catalog, and it changes whenever the catalog changes
+
+    Args:
+    - course_code (str): The course code of the request
+
+    Returns:
+    - str: The ETag without the quotes, None for backends without a fingerprint (the ETag is then hashed from the response)
+    """
+    fingerprint = getattr(tree_backend(), "fingerprint", None)
+    if fingerprint is None:
+        return None
+    return hashlib.sha256(f"{fingerprint}:{course_code}".encode("utf-8")).hexdigest()[:32]
+
+
+def course_cache_control() -> str:
+    """
+    The Cache-Control header of GET /course/<code> (COURSE_CACHE_MAX_AGE)
+    """
+    if COURSE_CACHE_MAX_AGE > 0:
+        return f"public, max-age={COURSE_CACHE_MAX_AGE}"
+    return "public, no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    """
+    The 304 response of a GET /course/<code> the client already has
+
+    Args:
+    - etag (str): The ETag that matched If-None-Match, without the quotes
+    """
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = course_cache_control()
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def metrics_tree_choice(tree_choice) -> str:
+    """
+    The tree_choice label of the metrics of a request, only "full" or "prerequisite" so clients can't create new labels
+    """
+    return "full" if tree_choice == "full" else "prerequisite"
+
+
+def check_reload_token():
+    """
+    Abort with 403 if SNAPSHOT_RELOAD_TOKEN is not set (the endpoints changing the state of the workers are disabled), or the request doesn't have a matching X-Reload-Token header
+    """
+    if not SNAPSHOT_RELOAD_TOKEN:
+        abort(403, description="Disabled, SNAPSHOT_RELOAD_TOKEN is not set")
+    if not hmac.compare_digest(request.headers.get("X-Reload-Token", "").encode("utf-8"), SNAPSHOT_RELOAD_TOKEN.encode("utf-8")):
+        abort(403, description="Invalid reload token")
+
 
 api.add_resource(Helloworld, "/helloworld/<string:name>")
 api.add_resource(CourseQuery, "/course/", "/course/<string:course_name>")
+api.add_resource(CourseBatchQuery, "/course/batch/")
+api.add_resource(SnapshotQuery, "/snapshot/")
+api.add_resource(CacheQuery, "/cache/")
+api.add_resource(TimingQuery, "/timing/")
 
  
 if __name__ == "__main__":
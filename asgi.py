@@ -0,0 +1,191 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort
+from neo4j import AsyncGraphDatabase
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_accept_header
+from werkzeug.wrappers import Response
+import app as wsgi
+import compression
+import instrumentation
+import metrics
+import output
+from circuit import backend_version
+from graph_backend import AsyncNeo4jBackend, AsyncFallbackBackend, AsyncCachingBackend, CachingBackend
+from instrumentation import phase
+from local_backend import LocalBackend
+from traversal_util import CourseNotFound
+from neo4j_conn import URI, AUTH, driver_config
+
+# The Flask app, for every route the async path doesn't handle
+flask_app = WsgiToAsgi(wsgi.app)
+
+# The async backend of this worker, created on the first request that needs it (the async driver belongs to the event loop)
+_state = {"backend": None}
+
+
+def async_backend():
+    """
+    The async backend of this worker, None if trees are not built from Neo4j (GRAPH_BACKEND = "local").
+    Configured like the backend of app.py: NEO4J_LEAN_QUERIES, GRAPH_FALLBACK_LOCAL and the subgraph cache (the same LRUCache, so it is cleared with it)
+    """
+    if wsgi.neo4j is None:
+        return None
+    if _state["backend"] is None:
+        backend = AsyncNeo4jBackend(
+            AsyncGraphDatabase.driver(URI, auth=AUTH, **driver_config()),
+            on_query=metrics.observe_neo4j_query,
+            lean=wsgi.NEO4J_LEAN_QUERIES,
+            titles=output.output_titles_dict if wsgi.NEO4J_LEAN_TITLES == "local" else None
+        )
+        if wsgi.GRAPH_FALLBACK_LOCAL:
+            backend = AsyncFallbackBackend(backend, LocalBackend())
+        if isinstance(wsgi.backend, CachingBackend):
+            backend = AsyncCachingBackend(backend, wsgi.backend.cache)
+        _state["backend"] = backend
+    return _state["backend"]
+
+
+async def application(scope, receive, send):
+    """
+    ASGI entry point, run it with e.g. uvicorn asgi:application (or gunicorn -k uvicorn.workers.UvicornWorker asgi:application)
+
+    POST /course/ is served on the event loop: the trees that are not cached are fetched with the async Neo4j driver,
+    every course at the same time (AsyncNeo4jBackend), and the worker serves other requests while it waits for the database.
+    Every other route (and POST /course/?stream=1) goes to the Flask app of app.py, with the same caches, snapshot and metrics.
+
+    Notes:
+    - The worker warms up (Neo4j connection and graph snapshot, see app.start_warm_up) on lifespan.startup, keep the lifespan protocol on (uvicorn --lifespan auto or on)
+    - The async backend follows NEO4J_LEAN_QUERIES, GRAPH_FALLBACK_LOCAL and shares the subgraph cache of app.py. NEO4J_FANOUT_THREADS doesn't apply:
+    the courses are always fetched at the same time, one session each, on the event loop instead of threads
+    - The async driver has its own connection pool, next to the pool of neo4j_conn used by the warm-up, the snapshot and the Flask routes.
+    N4J_MAX_CONNECTION_POOL_SIZE bounds each of them, so a worker can hold up to twice as many connections
+    - The Flask routes run on one thread of asgiref (WsgiToAsgi), use gunicorn with app:app when most of the traffic is not POST /course/
+    - Marking, commonality and encoding still run on the event loop, they take a few ms even for large trees
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin1"))
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/course/" and query.get("stream") != ["1"]:
+        await course_query(scope, receive, send, query)
+        return
+
+    await flask_app(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    """
+    Handle the ASGI lifespan messages: start warming the worker up on startup, close the async driver on shutdown
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # In a thread, with NEO4J_WARM_UP = "request" the warm-up runs before startup completes
+            await asyncio.to_thread(wsgi.start_warm_up)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _state["backend"] is not None:
+                await _state["backend"].close()
+                _state["backend"] = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def course_query(scope, receive, send, query: dict):
+    """
+    Async version of CourseQuery.post, same request body, query parameters, response and errors
+    """
+    started_at = time.perf_counter()
+    wsgi.run_worker_commands()
+    instrumentation.start_request()
+    headers = {key.decode("latin1").lower(): value.decode("latin1") for key, value in scope["headers"]}
+
+    tree_choice = "full"
+    try:
+        body = await read_body(receive)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        if not data or not isinstance(data, dict):
+            abort(400, description="Invalid JSON or no data provided")
+
+        completed_courses = wsgi.course_code_list(data.get("completed_courses", []), "completed_courses")
+        desired_courses = wsgi.course_code_list(data.get("desired_courses", []), "desired_courses")
+        tree_choice = data.get("tree_choice", "full")
+        response_format = "compact" if query.get("format") == ["compact"] else "nested"
+
+        # Read once, same as CourseQuery.post
+        graph = wsgi.tree_backend()
+        version = backend_version(graph)
+        response_key = wsgi.course_response_key(completed_courses, desired_courses, tree_choice, response_format, version)
+        encoded = wsgi.responses.get(response_key) if wsgi.responses is not None else None
+        if encoded is None:
+            try:
+                # The snapshot (and the local backend) are in memory, only Neo4j is awaited
+                backend = async_backend()
+                if graph is wsgi.snapshot or backend is None:
+                    course_circuits = wsgi.circuits.circuits(graph, desired_courses, tree_choice, version)
+                else:
+                    course_circuits = await wsgi.circuits.circuits_async(backend, desired_courses, tree_choice, version)
+            except CourseNotFound as e:
+                abort(404, description=f"Course not found: {e.course_code}")
+
+            encoded = wsgi.build_course_response(course_circuits, completed_courses, tree_choice, response_format, started_at)
+            if wsgi.responses is not None:
+                wsgi.responses.set(response_key, encoded)
+
+        response = Response(encoded, status=200, mimetype="application/json")
+    except HTTPException as e:
+        response = Response(json.dumps({"message": e.description}) + "\n", status=e.code, mimetype="application/json")
+
+    with phase("compress"):
+        compression.compress_response(response, parse_accept_header(headers.get("accept-encoding")))
+
+    server_timing = instrumentation.finish_request("POST coursequery")
+    if server_timing is not None:
+        response.headers["Server-Timing"] = server_timing
+        response.headers["Timing-Allow-Origin"] = "*"
+
+    metrics.REQUEST_LATENCY.labels(
+        endpoint="coursequery",
+        method="POST",
+        tree_choice=wsgi.metrics_tree_choice(tree_choice),
+        status=str(response.status_code)
+    ).observe(time.perf_counter() - started_at)
+
+    await send_response(send, response)
+
+
+async def read_body(receive) -> bytes:
+    """
+    Read the whole body of an HTTP request
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def send_response(send, response: Response):
+    """
+    Send a (non streamed) werkzeug Response
+    """
+    body = response.get_data()
+    response.headers["Content-Length"] = str(len(body))
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(key.lower().encode("latin1"), value.encode("latin1")) for key, value in response.headers.items()]
+    })
+    await send({"type": "http.response.body", "body": body})
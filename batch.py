@@ -0,0 +1,159 @@
+import numpy as np
+from flat_tree import COMPLETED, MARKED, READY_TO_TAKE, COURSE_KIND, AND_KIND, OR_KIND
+from circuit import CircuitCache, PrerequisiteCircuit
+from instrumentation import phase
+
+
+def completed_matrix(circuit_cache: CircuitCache, completed_courses_lists: list[list[str]], columns: dict) -> np.ndarray:
+    """
+    Turn the completed courses of many students into a boolean matrix
+
+    Args:
+    - circuit_cache (CircuitCache): The cache whose course index gives the bits of the course codes
+    - completed_courses_lists (list[list[str]]): The completed course codes of each student
+    - columns (dict[int, int]): The column of each course bit that is used (see evaluate_batch)
+
+    Returns:
+    - np.ndarray: (students x columns) matrix, True where a student completed the course of the column
+    """
+    rows = []
+    cols = []
+    for row, completed_courses in enumerate(completed_courses_lists):
+        for bit in circuit_cache.course_index.bits_of(completed_courses):
+            col = columns.get(bit)
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
+
+    matrix = np.zeros((len(completed_courses_lists), len(columns)), dtype=bool)
+    matrix[rows, cols] = True
+    return matrix
+
+
+def evaluate_circuit_batch(circuit: PrerequisiteCircuit, completed: np.ndarray, columns: dict) -> np.ndarray:
+    """
+    Same as PrerequisiteCircuit.evaluate, for many students at once. Each node is evaluated for every student with one vectorized operation
+
+    Args:
+    - circuit (PrerequisiteCircuit): The circuit of the course
+    - completed (np.ndarray): (students x columns) matrix of the completed courses (see completed_matrix)
+    - columns (dict[int, int]): The column of each course bit in completed
+
+    Returns:
+    - np.ndarray: (students x nodes) uint8 matrix, each row is the state evaluate would return for the student
+    """
+    tree = circuit.tree
+    kinds = tree.kinds
+    offsets = tree.child_offsets
+    children = tree.children
+    student_count = completed.shape[0]
+
+    course_positions = [i for i, kind in enumerate(kinds) if kind == COURSE_KIND]
+    course_columns = [columns[circuit.course_bit_ids[i]] for i in course_positions]
+
+    # A Course node is satisfied when it is completed, an AND or OR node when it is marked
+    satisfied = np.zeros((student_count, len(kinds)), dtype=bool)
+    satisfied[:, course_positions] = completed[:, course_columns]
+    ready = np.zeros((student_count, len(kinds)), dtype=bool)
+
+    # Nodes come after their children, so one pass in order is enough
+    for i, kind in enumerate(kinds):
+        start = offsets[i]
+        end = offsets[i + 1]
+        if start == end:
+            # Nothing to satisfy: a Course is ready to take and an AND is marked (an empty OR is not), same as evaluate
+            if kind == COURSE_KIND:
+                ready[:, i] = True
+            elif kind == AND_KIND:
+                satisfied[:, i] = True
+            continue
+
+        child_satisfied = satisfied[:, children[start:end]]
+        if kind == OR_KIND:
+            result = child_satisfied.any(axis=1)
+        else:
+            result = child_satisfied.all(axis=1)
+
+        if kind == COURSE_KIND:
+            ready[:, i] = result
+        else:
+            satisfied[:, i] = result
+
+    state = np.zeros((student_count, len(kinds)), dtype=np.uint8)
+    is_course = np.zeros(len(kinds), dtype=bool)
+    is_course[course_positions] = True
+    state[:, is_course] = np.where(satisfied[:, is_course], COMPLETED, 0) | np.where(ready[:, is_course], READY_TO_TAKE, 0)
+    state[:, ~is_course] = np.where(satisfied[:, ~is_course], MARKED, 0)
+    return state
+
+
+def evaluate_batch(circuit_cache: CircuitCache, backend, completed_courses_lists: list[list[str]], course_codes: list[str], tree_choice: str = "full"):
+    """
+    Evaluate the trees of many courses for many students. Each tree is built (or taken from the cache) once, and marked for every student at once
+
+    Args:
+    - circuit_cache (CircuitCache): The cache of the compiled circuits
+    - backend (GraphBackend): The backend to build the missing trees from
+    - completed_courses_lists (list[list[str]]): The completed course codes of each student
+    - course_codes (list[str]): The codes of the courses to evaluate
+    - tree_choice (str): "full" for full trees, anything else for prerequisite (first level) trees
+
+    Returns:
+    - tuple(list[PrerequisiteCircuit], list[np.ndarray]): The circuit of each course, and its (students x nodes) state matrix
+
+    Notes:
+    - Raises CourseNotFound if one of the courses doesn't exist (same as create_trees_from_apoc)
+    """
+    circuits = circuit_cache.circuits(backend, course_codes, tree_choice)
+
+    # Only the courses that are in the circuits get a column
+    columns = {}
+    for circuit in circuits:
+        for bit in circuit.course_bit_ids:
+            if bit >= 0 and bit not in columns:
+                columns[bit] = len(columns)
+
+    with phase("evaluate"):
+        completed = completed_matrix(circuit_cache, completed_courses_lists, columns)
+        states = [evaluate_circuit_batch(circuit, completed, columns) for circuit in circuits]
+    return circuits, states
+
+
+def batch_results(circuits: list[PrerequisiteCircuit], states: list[np.ndarray], student_count: int) -> dict:
+    """
+    Convert the results of evaluate_batch to a compact dictionary: the nodes of each tree once, and for each student and course the positions of the nodes that are completed, marked and ready to take
+
+    Args:
+    - circuits (list[PrerequisiteCircuit]): The circuit of each course
+    - states (list[np.ndarray]): The (students x nodes) state matrix of each course
+    - student_count (int): The number of students, every student gets a row even when there is no course
+
+    Returns:
+    - dict: ({
+        courses: [{code: str, nodes: [dict]}] (see FlatTree.node_table, the root is the last node)
+        students: [[{completed: [int], marked: [int], ready_to_take: [int]}]] (for each student, for each course)
+    })
+    """
+    students = [[] for _ in range(student_count)]
+
+    for state in states:
+        completed_rows, completed_cols = np.nonzero(state & COMPLETED)
+        marked_rows, marked_cols = np.nonzero(state & MARKED)
+        ready_rows, ready_cols = np.nonzero(state & READY_TO_TAKE)
+
+        # Split the positions by student (np.nonzero returns them by row)
+        completed_split = np.split(completed_cols, np.searchsorted(completed_rows, range(1, student_count)))
+        marked_split = np.split(marked_cols, np.searchsorted(marked_rows, range(1, student_count)))
+        ready_split = np.split(ready_cols, np.searchsorted(ready_rows, range(1, student_count)))
+
+        for student in range(student_count):
+            students[student].append({
+                "completed": completed_split[student].tolist(),
+                "marked": marked_split[student].tolist(),
+                "ready_to_take": ready_split[student].tolist()
+            })
+
+    return {
+        "courses": [{"code": circuit.root_code, "nodes": circuit.tree.node_table()} for circuit in circuits],
+        "students": students
+    }
@@ -0,0 +1,54 @@
+"""
+Measure the throughput of the batch evaluation (students x courses per second) on the catalog in output.py,
+against evaluating every pair with the circuits one by one (like one /course/ request per student).
+
+Run from the repository root:
+    python -m benchmarks.bench_batch
+"""
+import random
+import time
+import output
+from cache import LRUCache
+from circuit import CircuitCache
+from local_backend import LocalBackend
+from batch import evaluate_batch, batch_results
+
+STUDENT_COUNTS = [100, 1000, 10000]
+COURSE_COUNT = 20
+MAX_COMPLETED = 60
+
+
+def main():
+    backend = LocalBackend()
+    circuit_cache = CircuitCache(LRUCache(max_entries=None))
+    codes = list(output.output_codes)
+    rng = random.Random(0)
+
+    # The biggest trees of the catalog, compiled before timing
+    courses = sorted(codes, key=lambda code: -len(circuit_cache.circuits(backend, [code])[0].tree))[:COURSE_COUNT]
+
+    print(f"{'students':>8} {'pairs':>8} {'batch eval/s':>13} {'with results eval/s':>20} {'one by one eval/s':>18}")
+    for student_count in STUDENT_COUNTS:
+        students = [rng.sample(codes, rng.randint(0, MAX_COMPLETED)) for _ in range(student_count)]
+        pairs = student_count * len(courses)
+
+        start = time.perf_counter()
+        circuits, states = evaluate_batch(circuit_cache, backend, students, courses)
+        evaluated = time.perf_counter()
+        batch_results(circuits, states, student_count)
+        converted = time.perf_counter()
+
+        for completed_courses in students:
+            completed_mask = circuit_cache.completed_mask(completed_courses)
+            for circuit in circuits:
+                circuit.evaluate(completed_mask)
+        one_by_one = time.perf_counter()
+
+        print(
+            f"{student_count:>8} {pairs:>8} {pairs / (evaluated - start):>13.0f} "
+            f"{pairs / (converted - start):>20.0f} {pairs / (one_by_one - converted):>18.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare the grouping commonality algorithm with the previous powerset based one, for 2 to 20 desired courses.
+
+Run from the repository root:
+    python -m benchmarks.bench_commonality
+"""
+import io
+import itertools
+import random
+import time
+from contextlib import redirect_stdout
+from traversal_util import commonality_from_course_codes, check_containment, construct_dict, convert_frozenset_serializable
+
+ROOT_COUNTS = range(2, 21)
+# The powerset algorithm takes minutes past this many desired courses
+POWERSET_MAX_ROOTS = 14
+POOL_SIZE = 300
+CODES_PER_TREE = 60
+
+
+def powerset_commonality(list_of_course_codes):
+    """
+    The commonality algorithm before grouping, enumerating every subset of the roots containing each shared course
+    """
+    unique_set_course_codes = {}
+    for root_code, lst in list_of_course_codes.items():
+        for code in lst:
+            unique_set_course_codes.setdefault(code, set()).add(root_code)
+
+    filtered_unique_set_course_codes = {k: v for k, v in unique_set_course_codes.items() if len(v) > 1}
+
+    combinations = {}
+    pwr_to_sub = {}
+    for code, root_set in filtered_unique_set_course_codes.items():
+        root_pwr_set = [set(combo) for r in range(len(root_set) + 1) for combo in itertools.combinations(root_set, r)]
+        filtered_root_pwr_set = [subset for subset in root_pwr_set if len(subset) > 1 and frozenset(subset) != frozenset(root_set)]
+        pwr_to_sub[frozenset(root_set)] = filtered_root_pwr_set
+
+        for set_combo in filtered_root_pwr_set:
+            combinations.setdefault(frozenset(set_combo), set()).add(code)
+        combinations.setdefault(frozenset(root_set), set()).add(code)
+
+    for intersection, subsets in pwr_to_sub.items():
+        if intersection in combinations:
+            biggest_commonality = combinations[intersection]
+            for subset in subsets:
+                if frozenset(subset) in combinations:
+                    filtered_commonality = [course for course in combinations[frozenset(subset)] if course not in biggest_commonality]
+                    if filtered_commonality:
+                        combinations[frozenset(subset)] = filtered_commonality
+                    else:
+                        del combinations[frozenset(subset)]
+
+    return construct_dict(convert_frozenset_serializable(combinations), check_containment(combinations))
+
+
+def synthetic_course_codes(root_count: int, seed: int = 0) -> dict[str, list[str]]:
+    """
+    Course codes of root_count synthetic trees. Low numbered codes are picked far more often, like first year courses that are in most trees.
+    Every root is also in the tree of the next root, so there are containment relationships.
+    """
+    rng = random.Random(seed)
+    pool = [f"SYN{i:03d}" for i in range(POOL_SIZE)]
+    weights = [1 / (i + 1) for i in range(POOL_SIZE)]
+    roots = [f"ROOT{i:02d}" for i in range(root_count)]
+
+    list_of_course_codes = {}
+    for position, root in enumerate(roots):
+        codes = [root] + list(dict.fromkeys(rng.choices(pool, weights, k=CODES_PER_TREE)))
+        if position > 0:
+            codes.append(roots[position - 1])
+        list_of_course_codes[root] = codes
+    return list_of_course_codes
+
+
+def normalized(result):
+    # The order of the keys, and of the codes in the values, depends on set iteration order
+    return (
+        {frozenset(eval(key)): frozenset(value) for key, value in result["commonality_list"].items()},
+        {key: frozenset(value) for key, value in result["containment_dict"].items()},
+    )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'courses':>7} {'groups':>7} {'grouping ms':>12} {'powerset ms':>12}")
+    for root_count in ROOT_COUNTS:
+        list_of_course_codes = synthetic_course_codes(root_count)
+        result, grouping_time = timed(commonality_from_course_codes, list_of_course_codes)
+
+        powerset_column = "skipped"
+        if root_count <= POWERSET_MAX_ROOTS:
+            expected, powerset_time = timed(powerset_commonality, list_of_course_codes)
+            assert normalized(result) == normalized(expected)
+            powerset_column = f"{powerset_time * 1000:.1f}"
+
+        print(f"{root_count:>7} {len(result['commonality_list']):>7} {grouping_time * 1000:>12.2f} {powerset_column:>12}")
+
+
+if __name__ == "__main__":
+    main()
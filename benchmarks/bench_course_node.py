@@ -0,0 +1,137 @@
+"""
+Compare the memory use and speed of the old dict based CourseNode, the __slots__ CourseNode and FlatTree on synthetic trees.
+
+Run from the repository root:
+    python -m benchmarks.bench_course_node
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from benchmarks.synthetic import synthetic_tree, synthetic_completed
+from flat_tree import FlatTree
+from traversal_util import mark_completion, course_node_to_dict
+
+SIZES = [1_000, 5_000, 10_000, 50_000]
+REPEAT = 5
+
+
+class DictCourseNode():
+    """
+    The CourseNode class before __slots__ (one __dict__ per node, label stored as a string)
+    """
+
+    def __init__(self, label, code=None, full_name=None, index=None):
+        self.label = label
+        self.code = code if label == "Course" else None
+        self.full_name = full_name if label == "Course" else None
+        self.index = index if label != "Course" else None
+        self.marked = False
+        self.completed = False
+        self.ready_to_take = False
+        self.children = []
+
+    def add_child(self, child):
+        self.children.append(child)
+
+
+def dict_mark_completion(root, completed_courses_list):
+    # mark_completion before NodeKind, comparing label strings
+    completed_courses = set(completed_courses_list)
+
+    def mark_completed_courses(node):
+        if node.label == "Course":
+            node.completed = node.code in completed_courses
+        for child in node.children:
+            mark_completed_courses(child)
+
+    def update_parents(node):
+        for child in node.children:
+            update_parents(child)
+        if node.label == "OR":
+            node.marked = any(child.completed or child.marked for child in node.children)
+        elif node.label == "AND":
+            node.marked = all(child.completed or child.marked for child in node.children)
+        elif node.label == "Course":
+            if all(child.completed or child.marked for child in node.children):
+                node.ready_to_take = True
+
+    mark_completed_courses(root)
+    update_parents(root)
+
+
+def dict_course_node_to_dict(node):
+    node_dict = {
+        "label": node.label,
+        "marked": node.marked,
+        "ready_to_take": node.ready_to_take,
+        "completed": node.completed,
+    }
+    if node.label == "Course":
+        node_dict["code"] = node.code
+        node_dict["full_name"] = node.full_name
+    else:
+        node_dict["index"] = node.index
+    if node.children:
+        node_dict["children"] = [dict_course_node_to_dict(child) for child in node.children]
+    return node_dict
+
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def best_time(func):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    sys.setrecursionlimit(100_000)
+    print(f"{'nodes':>7} {'variant':<12} {'memory KB':>10} {'build ms':>9} {'mark ms':>9} {'to_dict ms':>11}")
+
+    for size in SIZES:
+        dict_root, dict_bytes = measure_memory(lambda: synthetic_tree(size, node_class=DictCourseNode))
+        slots_root, slots_bytes = measure_memory(lambda: synthetic_tree(size))
+        flat, flat_bytes = measure_memory(lambda: FlatTree.from_course_node(slots_root))
+        completed = synthetic_completed(slots_root)
+
+        state = flat.mark_completion(completed)
+        mark_completion(slots_root, completed)
+        dict_mark_completion(dict_root, completed)
+        expected = json.dumps(dict_course_node_to_dict(dict_root))
+        assert json.dumps(course_node_to_dict(slots_root)) == expected
+        assert json.dumps(flat.to_dict(state)) == expected
+
+        rows = [
+            ("dict", dict_bytes,
+                best_time(lambda: synthetic_tree(size, node_class=DictCourseNode)),
+                best_time(lambda: dict_mark_completion(dict_root, completed)),
+                best_time(lambda: dict_course_node_to_dict(dict_root))),
+            ("slots", slots_bytes,
+                best_time(lambda: synthetic_tree(size)),
+                best_time(lambda: mark_completion(slots_root, completed)),
+                best_time(lambda: course_node_to_dict(slots_root))),
+            ("flat", flat_bytes,
+                best_time(lambda: FlatTree.from_course_node(slots_root)),
+                best_time(lambda: flat.mark_completion(completed)),
+                best_time(lambda: flat.to_dict(state))),
+        ]
+        for name, memory, build, mark, to_dict in rows:
+            print(f"{size:>7} {name:<12} {memory / 1024:>10.0f} {build * 1000:>9.1f} {mark * 1000:>9.1f} {to_dict * 1000:>11.1f}")
+
+    print("\nflat build is the time to flatten an existing CourseNode tree, its memory doesn't include the strings shared with the CourseNode tree")
+
+
+if __name__ == "__main__":
+    main()
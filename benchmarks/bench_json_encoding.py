@@ -0,0 +1,68 @@
+"""
+Compare the speed (output MB/s) of encoding marked trees to JSON: course_node_to_dict + json.dumps (the previous route), course_node_to_dict + orjson,
+FlatTree.to_dict + json.dumps, and the direct encoders of fast_json (with orjson if it is installed, and with the standard library).
+
+Run from the repository root:
+    python -m benchmarks.bench_json_encoding
+"""
+import json
+import time
+import fast_json
+from benchmarks.synthetic import synthetic_tree, synthetic_completed
+from circuit import CircuitCache, PrerequisiteCircuit
+from cache import LRUCache
+from traversal_util import mark_completion, course_node_to_dict
+
+SIZES = [1_000, 10_000, 50_000]
+REPEAT = 5
+
+
+def best_rate(func) -> tuple[float, int]:
+    """
+    Run func REPEAT times
+
+    Returns:
+    - tuple(float, int): (MB/s of the fastest run, size of the JSON in bytes)
+    """
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        size = len(func())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size / best / 1_000_000, size
+
+
+def main():
+    orjson = fast_json.orjson
+    circuit_cache = CircuitCache(LRUCache(max_entries=None))
+
+    print(f"{'nodes':>7} {'JSON KB':>8} {'dict+json':>10} {'dict+orjson':>12} {'flat dict+json':>15} {'CourseNode enc':>15} {'FlatTree enc':>13} {'FlatTree stdlib':>16}   (MB/s)")
+    for size in SIZES:
+        root = synthetic_tree(size, shared=True)
+        completed = synthetic_completed(root)
+        mark_completion(root, completed)
+
+        circuit = PrerequisiteCircuit.compile(root, circuit_cache.course_index)
+        state = circuit.evaluate(circuit_cache.completed_mask(completed))
+
+        dict_rate, json_size = best_rate(lambda: json.dumps(course_node_to_dict(root)).encode("utf-8"))
+        dict_orjson_rate = best_rate(lambda: orjson.dumps(course_node_to_dict(root)))[0] if orjson is not None else float("nan")
+        flat_dict_rate, _ = best_rate(lambda: json.dumps(circuit.to_dict(state)).encode("utf-8"))
+        course_node_rate, _ = best_rate(lambda: fast_json.encode_course_node(root))
+        flat_rate, _ = best_rate(lambda: circuit.to_json(state))
+
+        # Same encoder without orjson (only the code and name strings go through it)
+        fast_json.orjson = None
+        stdlib_circuit = PrerequisiteCircuit.compile(root, circuit_cache.course_index)
+        stdlib_rate, _ = best_rate(lambda: stdlib_circuit.to_json(state))
+        fast_json.orjson = orjson
+
+        print(
+            f"{size:>7} {json_size / 1000:>8.0f} {dict_rate:>10.1f} {dict_orjson_rate:>12.1f} {flat_dict_rate:>15.1f} "
+            f"{course_node_rate:>15.1f} {flat_rate:>13.1f} {stdlib_rate:>16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
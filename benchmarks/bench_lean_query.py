@@ -0,0 +1,130 @@
+"""
+Compare fetching and building trees with run_apoc_query (full Node and Relationship objects) and with run_lean_query (lists projected in Cypher, see LeanSubgraph).
+
+Needs the Neo4j database (N4J_DB_URI and N4J_DB_PASS, same as the API). Run from the repository root:
+    python -m benchmarks.bench_lean_query [COURSE ...]
+
+With --synthetic, the client side only is compared on large synthetic subgraphs: hydrating the Node and Relationship objects and building the tree,
+against building the tree from the lists (no database needed):
+    python -m benchmarks.bench_lean_query --synthetic
+"""
+import json
+import statistics
+import sys
+import time
+from neo4j.graph import Graph, Node
+from benchmarks.bench_tree_builder import synthetic_subgraph
+from traversal_util import (
+    LABEL_KINDS, TreeBuildContext, add_apoc_result_to_dicts, add_lean_result_to_dicts,
+    run_apoc_query, run_lean_query, run_titles_query, parse_node, parse_relationship
+)
+
+DEFAULT_COURSES = ["MAT351Y1", "CSC456H1", "STA414H1", "CSC373H1"]
+SYNTHETIC_SIZES = [1_000, 10_000, 50_000]
+REPEAT = 20
+
+
+def full_payload_bytes(nodes, relationships) -> int:
+    # Size of the subgraph as JSON, a stand-in for what goes over Bolt
+    return len(json.dumps({
+        "nodes": [parse_node(node) for node in nodes],
+        "relationships": [parse_relationship(rel) for rel in relationships]
+    }, default=str))
+
+
+def lean_payload_bytes(nodes, relationships) -> int:
+    return len(json.dumps({"nodes": nodes, "relationships": relationships}))
+
+
+def median_ms(func) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def compare_neo4j(course_codes: list[str]):
+    from neo4j_conn import Neo4jConn
+    driver = Neo4jConn()._driver
+
+    started_at = time.perf_counter()
+    with driver.session() as session:
+        titles = session.execute_read(run_titles_query)
+    print(f"titles: {len(titles)} courses fetched once in {(time.perf_counter() - started_at) * 1000:.1f} ms")
+
+    def full(course_code):
+        with driver.session() as session:
+            record = session.execute_read(run_apoc_query, course_code)[0]
+        add_apoc_result_to_dicts(record["nodes"], record["relationships"], TreeBuildContext())
+        return record
+
+    def lean(course_code):
+        with driver.session() as session:
+            record = session.execute_read(run_lean_query, [course_code])[0]
+        add_lean_result_to_dicts(record["nodes"], record["relationships"], titles, TreeBuildContext())
+        return record
+
+    print(f"{'course':>10} {'nodes':>6} {'rels':>6} {'full ms':>8} {'lean ms':>8} {'full KB':>8} {'lean KB':>8}")
+    for course_code in course_codes:
+        full_record = full(course_code)
+        lean_record = lean(course_code)
+        full_ms = median_ms(lambda: full(course_code))
+        lean_ms = median_ms(lambda: lean(course_code))
+        print(
+            f"{course_code:>10} {len(full_record['nodes']):>6} {len(full_record['relationships']):>6} {full_ms:>8.2f} {lean_ms:>8.2f} "
+            f"{full_payload_bytes(full_record['nodes'], full_record['relationships']) / 1000:>8.1f} "
+            f"{lean_payload_bytes(lean_record['nodes'], lean_record['relationships']) / 1000:>8.1f}"
+        )
+
+
+def compare_synthetic():
+    print(f"{'nodes':>7} {'rels':>7} {'full ms':>8} {'lean ms':>8} {'speedup':>8} {'full KB':>8} {'lean KB':>8}")
+    for size in SYNTHETIC_SIZES:
+        nodes, relationships = synthetic_subgraph(size)
+        titles = {node["code"]: node["full_name"] for node in nodes if "Course" in node.labels}
+
+        # What the driver unpacks from Bolt for each format, before hydrating objects from it
+        node_structs = [(i, list(node.labels), dict(node), node.element_id) for i, node in enumerate(nodes)]
+        relationship_structs = [
+            (i, rel.nodes[0].element_id, rel.nodes[1].element_id, dict(rel), rel.element_id) for i, rel in enumerate(relationships)
+        ]
+        lean_nodes = [[node.element_id, LABEL_KINDS[next(iter(node.labels))], node.get("code"), node.get("index")] for node in nodes]
+        lean_relationships = [[rel.nodes[0].element_id, rel.nodes[1].element_id] for rel in relationships]
+
+        def full():
+            graph = Graph()
+            contains = graph.relationship_type("Contains")
+            hydrated_nodes = {}
+            for node_id, labels, properties, element_id in node_structs:
+                hydrated_nodes[element_id] = Node(graph, element_id, node_id, labels, properties)
+            hydrated_relationships = []
+            for rel_id, start_id, end_id, properties, element_id in relationship_structs:
+                rel = contains(graph, element_id, rel_id, properties)
+                rel._start_node = hydrated_nodes[start_id]
+                rel._end_node = hydrated_nodes[end_id]
+                hydrated_relationships.append(rel)
+            add_apoc_result_to_dicts(list(hydrated_nodes.values()), hydrated_relationships, TreeBuildContext())
+
+        def lean():
+            add_lean_result_to_dicts(lean_nodes, lean_relationships, titles, TreeBuildContext())
+
+        full_ms = median_ms(full)
+        lean_ms = median_ms(lean)
+        print(
+            f"{len(nodes):>7} {len(relationships):>7} {full_ms:>8.2f} {lean_ms:>8.2f} {full_ms / lean_ms:>7.1f}x "
+            f"{full_payload_bytes(nodes, relationships) / 1000:>8.0f} {lean_payload_bytes(lean_nodes, lean_relationships) / 1000:>8.0f}"
+        )
+
+
+def main():
+    args = sys.argv[1:]
+    if "--synthetic" in args:
+        compare_synthetic()
+    else:
+        compare_neo4j(args or DEFAULT_COURSES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Compare the CPU time of marking a CourseNode tree and converting it to a dict: the two recursive passes of mark_completion before,
+the explicit-stack mark_and_serialize / course_node_to_dict that replaced them, and the current mark_completion / course_node_to_dict
+(one recursive pass, a node under many parents is only visited once).
+
+Timed on synthetic trees (with and without shared subtrees) and on every tree of the catalog in output.py.
+
+Run from the repository root:
+    python -m benchmarks.bench_marking
+"""
+import json
+import random
+import sys
+import time
+import output
+from benchmarks.synthetic import synthetic_tree, synthetic_completed
+from local_backend import LocalBackend
+from traversal_util import NodeKind, create_trees_from_apoc, KIND_LABELS, mark_completion, course_node_to_dict
+
+SIZES = [1_000, 5_000, 10_000, 50_000]
+REPEAT = 7
+
+
+def two_pass_mark_completion(root, completed_courses_list):
+    # mark_completion before, one pass for the completed courses and one for the parents
+    completed_courses = set(completed_courses_list)
+
+    def mark_completed_courses(node):
+        if node.kind is NodeKind.COURSE:
+            node.completed = node.code in completed_courses
+        for child in node.children:
+            mark_completed_courses(child)
+
+    def update_parents(node):
+        for child in node.children:
+            update_parents(child)
+        if node.kind is NodeKind.OR:
+            node.marked = any(child.completed or child.marked for child in node.children)
+        elif node.kind is NodeKind.AND:
+            node.marked = all(child.completed or child.marked for child in node.children)
+        elif node.kind is NodeKind.COURSE:
+            if all(child.completed or child.marked for child in node.children):
+                node.ready_to_take = True
+
+    mark_completed_courses(root)
+    update_parents(root)
+
+
+def recursive_course_node_to_dict(node):
+    # course_node_to_dict before, a node under many parents is converted under each of them
+    node_dict = {
+        "label": KIND_LABELS[node.kind],
+        "marked": node.marked,
+        "ready_to_take": node.ready_to_take,
+        "completed": node.completed,
+    }
+    if node.kind is NodeKind.COURSE:
+        node_dict["code"] = node.code
+        node_dict["full_name"] = node.full_name
+    else:
+        node_dict["index"] = node.index
+    if node.children:
+        node_dict["children"] = [recursive_course_node_to_dict(child) for child in node.children]
+    return node_dict
+
+
+def stack_mark_completion(root, completed_courses_list):
+    # The explicit-stack mark_and_serialize(serialize=False)
+    completed_courses = set(completed_courses_list)
+    done = {}
+    course_codes = []
+    course_code_set = set()
+
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            if id(node) in done:
+                continue
+            if node.kind is NodeKind.COURSE:
+                node.completed = node.code in completed_courses
+                if node.code not in course_code_set:
+                    course_code_set.add(node.code)
+                    course_codes.append(node.code)
+            stack.append((node, True))
+            for child in reversed(node.children):
+                stack.append((child, False))
+            continue
+
+        children = node.children
+        if node.kind is NodeKind.OR:
+            node.marked = any(child.completed or child.marked for child in children)
+        elif node.kind is NodeKind.AND:
+            node.marked = all(child.completed or child.marked for child in children)
+        elif node.kind is NodeKind.COURSE:
+            if all(child.completed or child.marked for child in children):
+                node.ready_to_take = True
+        done[id(node)] = None
+
+    return done[id(root)], course_codes
+
+
+def stack_course_node_to_dict(node):
+    # The explicit-stack course_node_to_dict
+    dicts = {}
+    stack = [(node, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if not children_done:
+            if id(current) not in dicts:
+                stack.append((current, True))
+                for child in reversed(current.children):
+                    stack.append((child, False))
+            continue
+
+        node_dict = {
+            "label": KIND_LABELS[current.kind],
+            "marked": current.marked,
+            "ready_to_take": current.ready_to_take,
+            "completed": current.completed,
+        }
+        if current.kind is NodeKind.COURSE:
+            node_dict["code"] = current.code
+            node_dict["full_name"] = current.full_name
+        else:
+            node_dict["index"] = current.index
+        if current.children:
+            node_dict["children"] = [dicts[id(child)] for child in current.children]
+        dicts[id(current)] = node_dict
+
+    return dicts[id(node)]
+
+
+def best_time(func):
+    times = []
+    for _ in range(REPEAT):
+        start = time.process_time()
+        func()
+        times.append(time.process_time() - start)
+    return min(times)
+
+
+def compare(variants, make_roots, completed) -> list[tuple[str, float, float]]:
+    """
+    Mark and convert a fresh copy of the trees with every variant, check they give the same JSON, and time them
+
+    Returns:
+    - list[tuple(str, float, float)]: (variant name, mark seconds, to_dict seconds) for each variant
+    """
+    roots = {name: make_roots() for name, _, _ in variants}
+
+    expected = None
+    for name, mark, to_dict in variants:
+        for root in roots[name]:
+            mark(root, completed)
+        result = json.dumps([to_dict(root) for root in roots[name]])
+        expected = expected or result
+        assert result == expected, name
+
+    rows = []
+    for name, mark, to_dict in variants:
+        trees = roots[name]
+        rows.append((
+            name,
+            best_time(lambda: [mark(root, completed) for root in trees]),
+            best_time(lambda: [to_dict(root) for root in trees]),
+        ))
+    return rows
+
+
+def main():
+    sys.setrecursionlimit(100_000)
+    variants = [
+        ("two-pass", two_pass_mark_completion, recursive_course_node_to_dict),
+        ("stack", stack_mark_completion, stack_course_node_to_dict),
+        ("current", mark_completion, course_node_to_dict),
+    ]
+    print(f"{'trees':<22} {'variant':<9} {'mark ms':>9} {'to_dict ms':>11}")
+
+    for size in SIZES:
+        for shared in (False, True):
+            # ready_to_take is never reset by marking, every variant gets its own trees
+            completed = synthetic_completed(synthetic_tree(size, shared=shared))
+            name = f"{size} nodes" + (" shared" if shared else "")
+            for variant, mark_time, to_dict_time in compare(variants, lambda: [synthetic_tree(size, shared=shared)], completed):
+                print(f"{name:<22} {variant:<9} {mark_time * 1000:>9.1f} {to_dict_time * 1000:>11.1f}")
+
+    backend = LocalBackend()
+    codes = list(output.output_codes)
+    completed = random.Random(0).sample(codes, 30)
+    for tree_choice in ("full", "prerequisite"):
+        name = f"catalog {tree_choice}"
+        make_roots = lambda: [create_trees_from_apoc(backend, [code], tree_choice)[0] for code in codes]
+        for variant, mark_time, to_dict_time in compare(variants, make_roots, completed):
+            print(f"{name:<22} {variant:<9} {mark_time * 1000:>9.1f} {to_dict_time * 1000:>11.1f}")
+
+    print("\nCPU time (time.process_time), best of", REPEAT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compare the payload and latency of the prerequisite (first level) fetch with the previous one, which fetched the whole subgraph and only filtered its relationships.
+
+Needs the Neo4j database (N4J_DB_URI and N4J_DB_PASS, same as the API). Run from the repository root:
+    python -m benchmarks.bench_prerequisite_fetch [COURSE ...]
+
+With --local, the same comparison is done on the graph compiled from output.py instead (node counts and in-memory traversal time only):
+    python -m benchmarks.bench_prerequisite_fetch --local [COURSE ...]
+"""
+import json
+import statistics
+import sys
+import time
+from traversal_util import run_apoc_query_first_level, parse_node, parse_relationship
+
+DEFAULT_COURSES = ["MAT351Y1", "CSC456H1", "STA414H1", "CSC373H1"]
+REPEAT = 20
+
+
+def run_previous_first_level_query(tx, course_code: str):
+    """
+    The first level query before the dedicated fetch: the whole subgraph, with the relationships filtered by root afterwards
+    """
+    query = """
+    MATCH (start:Course {code: $course_code})
+    CALL apoc.path.subgraphAll(start, {
+        relationshipFilter: "Contains>",
+        labelFilter: "+Course|AND|OR"
+    })
+    YIELD nodes, relationships
+    WITH nodes, [rel IN relationships WHERE type(rel) = 'Contains' AND rel.root = $course_code] AS filtered_relationships
+    RETURN nodes, filtered_relationships AS relationships
+    """
+    result = tx.run(query, course_code=course_code)
+    return [record for record in result]
+
+
+def payload_bytes(nodes, relationships) -> int:
+    # Size of the parsed subgraph as JSON, a stand-in for what goes over Bolt
+    parsed = {
+        "nodes": [parse_node(node) for node in nodes],
+        "relationships": [parse_relationship(rel) for rel in relationships]
+    }
+    return len(json.dumps(parsed, default=str))
+
+
+def measure(fetch, course_code: str):
+    """
+    Run fetch(course_code) REPEAT times
+
+    Returns:
+    - tuple(float, int, int, int): (median milliseconds, node count, relationship count, payload bytes)
+    """
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        nodes, relationships = fetch(course_code)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, len(nodes), len(relationships), payload_bytes(nodes, relationships)
+
+
+def neo4j_fetchers():
+    from neo4j_conn import Neo4jConn
+    driver = Neo4jConn()._driver
+
+    def fetcher(query_func):
+        def fetch(course_code):
+            with driver.session() as session:
+                records = session.execute_read(query_func, course_code)
+            if not records:
+                raise KeyError(course_code)
+            return records[0]["nodes"], records[0]["relationships"]
+        return fetch
+
+    return fetcher(run_previous_first_level_query), fetcher(run_apoc_query_first_level)
+
+
+def local_fetchers():
+    from local_backend import LocalBackend
+    backend = LocalBackend()
+
+    def previous(course_code):
+        nodes, relationships = backend.subgraph(course_code)
+        return nodes, [rel for rel in relationships if rel.get("root") == course_code]
+
+    def current(course_code):
+        return backend.subgraph(course_code, first_level=True)
+
+    return previous, current
+
+
+def main():
+    args = sys.argv[1:]
+    local = "--local" in args
+    course_codes = [arg for arg in args if arg != "--local"] or DEFAULT_COURSES
+
+    previous, current = local_fetchers() if local else neo4j_fetchers()
+
+    print(f"{'course':>9} {'fetch':>9} {'ms':>8} {'nodes':>6} {'rels':>6} {'bytes':>8}")
+    for course_code in course_codes:
+        try:
+            rows = [("previous", measure(previous, course_code)), ("current", measure(current, course_code))]
+        except (KeyError, TypeError):
+            print(f"{course_code:>9} not found")
+            continue
+
+        for name, (milliseconds, node_count, relationship_count, size) in rows:
+            print(f"{course_code:>9} {name:>9} {milliseconds:>8.3f} {node_count:>6} {relationship_count:>6} {size:>8}")
+        print(f"{course_code:>9} {'saved':>9} {1 - rows[1][1][0] / rows[0][1][0]:>8.0%} {'':>6} {'':>6} {1 - rows[1][1][3] / rows[0][1][3]:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
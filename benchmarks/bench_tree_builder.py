@@ -0,0 +1,129 @@
+"""
+Compare the previous tree builder (every node and relationship copied into dicts with parse_node/parse_relationship, then read back)
+with add_apoc_result_to_dicts reading the driver objects directly, on large synthetic subgraphs made of real neo4j.graph Node and Relationship objects.
+
+Run from the repository root:
+    python -m benchmarks.bench_tree_builder
+"""
+import gc
+import time
+import tracemalloc
+from neo4j.graph import Graph, Node
+from benchmarks.synthetic import synthetic_tree
+from traversal_util import CourseNode, NodeKind, TreeBuildContext, add_apoc_result_to_dicts, parse_node, parse_relationship
+
+SIZES = [1_000, 10_000, 50_000]
+REPEAT = 5
+
+
+def previous_builder(nodes, relationships, context: TreeBuildContext):
+    # add_apoc_result_to_dicts before it read the records directly
+    parsed_nodes = [parse_node(node) for node in nodes]
+    parsed_relationships = [parse_relationship(rel) for rel in relationships]
+
+    for node in parsed_nodes:
+        neo4j_id = node["id"]
+        node_label = node["labels"][0]
+        node_properties = node["properties"]
+
+        if node_label == "Course":
+            code = node_properties["code"]
+            course_node = CourseNode(label="Course", code=code, full_name=node_properties["full_name"], index=None)
+            context.dict_course[code] = course_node
+            context.dict_neo4j_all[neo4j_id] = course_node
+        elif node_label == "AND":
+            index = node_properties["index"]
+            and_node = CourseNode(label="AND", code=None, full_name=None, index=index)
+            context.dict_AND[index] = and_node
+            context.dict_neo4j_all[neo4j_id] = and_node
+        elif node_label == "OR":
+            index = node_properties["index"]
+            or_node = CourseNode(label="OR", code=None, full_name=None, index=index)
+            context.dict_OR[index] = or_node
+            context.dict_neo4j_all[neo4j_id] = or_node
+
+    for rel in parsed_relationships:
+        start_node_obj = context.dict_neo4j_all[rel["start_node"]]
+        end_node_obj = context.dict_neo4j_all[rel["end_node"]]
+        start_node_obj.add_child(end_node_obj)
+
+
+def synthetic_subgraph(size: int):
+    """
+    Turn a synthetic tree into the nodes and relationships the driver would return for it
+
+    Returns:
+    - tuple(list[Node], list[Relationship]): The subgraph, one Node per course code or AND/OR index and one Relationship per edge
+    """
+    root = synthetic_tree(size, shared=True)
+    graph = Graph()
+    contains = graph.relationship_type("Contains")
+    driver_nodes = {}
+    relationships = []
+
+    def driver_node(node):
+        key = node.code if node.kind is NodeKind.COURSE else (node.label, node.index)
+        if key not in driver_nodes:
+            element_id = f"4:db:{len(driver_nodes)}"
+            if node.kind is NodeKind.COURSE:
+                properties = {"code": node.code, "full_name": node.full_name}
+            else:
+                properties = {"index": node.index}
+            driver_nodes[key] = Node(graph, element_id, len(driver_nodes), [node.label], properties)
+        return driver_nodes[key]
+
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        for child in node.children:
+            rel = contains(graph, f"5:db:{len(relationships)}", len(relationships), {"root": root.code})
+            rel._start_node = driver_node(node)
+            rel._end_node = driver_node(child)
+            relationships.append(rel)
+            stack.append(child)
+
+    driver_node(root)
+    return list(driver_nodes.values()), relationships
+
+
+def measure(builder, nodes, relationships) -> tuple[float, float]:
+    """
+    Build the tree REPEAT times
+
+    Returns:
+    - tuple(float, float): (milliseconds of the fastest build, peak MB allocated during one build)
+    """
+    best = None
+    for _ in range(REPEAT):
+        gc.collect()
+        start = time.perf_counter()
+        builder(nodes, relationships, TreeBuildContext())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    builder(nodes, relationships, TreeBuildContext())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1_000_000
+
+
+def main():
+    print(f"{'nodes':>7} {'rels':>7} {'previous ms':>12} {'direct ms':>10} {'speedup':>8} {'previous MB':>12} {'direct MB':>10}")
+    for size in SIZES:
+        nodes, relationships = synthetic_subgraph(size)
+        previous_ms, previous_mb = measure(previous_builder, nodes, relationships)
+        direct_ms, direct_mb = measure(add_apoc_result_to_dicts, nodes, relationships)
+        print(
+            f"{len(nodes):>7} {len(relationships):>7} {previous_ms:>12.2f} {direct_ms:>10.2f} {previous_ms / direct_ms:>7.1f}x "
+            f"{previous_mb:>12.2f} {direct_mb:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import random
+from traversal_util import CourseNode
+
+
+def synthetic_tree(node_count: int, seed: int = 0, node_class=CourseNode, shared: bool = False):
+    """
+    Build a random course tree with about node_count nodes, shaped like the real prerequisite trees
+    (a course has an AND of ORs and courses, an OR has courses or ANDs, ...)
+
+    Args:
+    - node_count (int): Approximate number of nodes of the tree
+    - seed (int): Seed of the random generator, the same seed gives the same tree
+    - node_class (type): Class of the nodes, anything with the CourseNode constructor and add_child
+    - shared (bool): Whether a course can reuse the subtree of a course created before it (like the DAG of a full tree), instead of every node having one parent
+
+    Returns:
+    - CourseNode: The root node of the tree (a Course node)
+    """
+    rng = random.Random(seed)
+    code_count = max(node_count // 4, 2)
+    counter = {"nodes": 0, "index": 0}
+    created_courses = []
+
+    def course(depth):
+        code = f"SYN{rng.randrange(code_count):05d}"
+        if shared and created_courses and rng.random() < 0.2:
+            return rng.choice(created_courses)
+
+        node = node_class(label="Course", code=code, full_name=f"{code}: Synthetic Course")
+        counter["nodes"] += 1
+        if counter["nodes"] < node_count and depth < 12 and rng.random() < 0.6:
+            node.add_child(junction("AND", depth + 1))
+        created_courses.append(node)
+        return node
+
+    def junction(label, depth):
+        counter["index"] += 1
+        node = node_class(label=label, index=counter["index"])
+        counter["nodes"] += 1
+        for _ in range(rng.randint(2, 4)):
+            if counter["nodes"] >= node_count:
+                break
+            if depth < 12 and rng.random() < 0.3:
+                node.add_child(junction("OR" if label == "AND" else "AND", depth + 1))
+            else:
+                node.add_child(course(depth + 1))
+        return node
+
+    root = node_class(label="Course", code="ROOT000", full_name="ROOT000: Synthetic Root")
+    counter["nodes"] += 1
+    top = node_class(label="AND", index=0)
+    root.add_child(top)
+    # Keep adding subtrees to the root until the tree is big enough
+    while counter["nodes"] < node_count:
+        top.add_child(course(1))
+    return root
+
+
+def synthetic_completed(root, fraction: float = 0.3, seed: int = 0) -> list[str]:
+    """
+    Pick a random fraction of the course codes of a tree as completed
+
+    Args:
+    - root (CourseNode): The root node of the tree
+    - fraction (float): Fraction of the codes that are completed
+    - seed (int): Seed of the random generator
+
+    Returns:
+    - list[str]: The completed course codes
+    """
+    rng = random.Random(seed)
+    codes = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.code is not None:
+            codes.add(node.code)
+        stack.extend(node.children)
+    return [code for code in sorted(codes) if rng.random() < fraction]
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache():
+    """
+    Thread safe least recently used cache, bounded by a number of entries and/or a total size, with an optional time to live.
+
+    Attributes:
+    - max_entries (int): Maximum number of entries, None for no limit
+    - max_size (int): Maximum total size of the entries (as computed by sizeof), None for no limit
+    - ttl (float): Seconds an entry stays valid after it is set, None for no expiry
+    - hits (int): Number of get calls that found a valid entry
+    - misses (int): Number of get calls that didn't find a valid entry
+    - evictions (int): Number of entries removed to stay within max_entries / max_size, or because they expired
+    - on_event (function): Called with "hit", "miss" or "eviction" every time one of the counters goes up (e.g. to export them as metrics), None to do nothing
+
+    Notes:
+    - Cached values are shared between every caller, they must not be mutated
+    - on_event is called with the lock of the cache held, it must be fast and must not use the cache
+    """
+
+    def __init__(self, max_entries: int = 1024, max_size: int = None, ttl: float = None, sizeof=None, on_event=None):
+        """
+        Args:
+        - max_entries (int): Maximum number of entries, None for no limit
+        - max_size (int): Maximum total size of the entries, None for no limit
+        - ttl (float): Seconds an entry stays valid after it is set, None for no expiry
+        - sizeof (function): Function returning the size of a value (e.g. its approximate bytes), every value has size 1 if not given
+        - on_event (function): Called with "hit", "miss" or "eviction" when the matching counter goes up
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self.on_event = on_event
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> (value, size, expires_at)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+
+    def get(self, key, default=None):
+        """
+        Get the value of a key, and mark it as most recently used
+
+        Args:
+        - key (hashable): The key
+        - default: What to return if the key is not cached (or expired)
+
+        Returns:
+        - The cached value, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self.evictions += 1
+                if self.on_event is not None:
+                    self.on_event("eviction")
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                if self.on_event is not None:
+                    self.on_event("miss")
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if self.on_event is not None:
+                self.on_event("hit")
+            return entry[0]
+
+
+    def set(self, key, value):
+        """
+        Cache a value, evicting the least recently used entries if the cache is full
+
+        Args:
+        - key (hashable): The key
+        - value: The value, it must not be mutated afterwards
+        """
+        size = self.sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            # Would evict everything else and still not fit
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, size, expires_at)
+            self._size += size
+
+            while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_size is not None and self._size > self.max_size)
+            ):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+                if self.on_event is not None:
+                    self.on_event("eviction")
+
+
+    def invalidate(self, key=None):
+        """
+        Remove a key from the cache, or every key if none is given
+
+        Args:
+        - key (hashable): The key to remove, None to clear the whole cache
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._size = 0
+            elif key in self._entries:
+                self._remove(key)
+
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the cache
+
+        Returns:
+        - dict: ({entries: int, size: int, hits: int, misses: int, evictions: int, hit_ratio: float})
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def _remove(self, key):
+        # Caller holds the lock
+        value, size, expires_at = self._entries.pop(key)
+        self._size -= size
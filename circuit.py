@@ -0,0 +1,318 @@
+import threading
+from flat_tree import FlatTree, COMPLETED, MARKED, READY_TO_TAKE, COURSE_KIND, AND_KIND, OR_KIND
+from traversal_util import CourseNode, find_all_course_nodes, create_trees_from_apoc, create_trees_from_apoc_async
+from instrumentation import phase
+from fast_json import FlatTreeEncoder
+
+
+class CourseIndex():
+    """
+    Gives every course code a bit, so a list of completed courses can be turned into one int bitmask.
+    One index is shared by every circuit of the process, bits are never reassigned.
+    """
+
+    def __init__(self):
+        self._bits = {}
+        self._lock = threading.Lock()
+
+
+    def bit(self, code: str) -> int:
+        """
+        Get the bit of a course code, giving it the next free bit if it doesn't have one yet
+        """
+        bit = self._bits.get(code)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.setdefault(code, len(self._bits))
+        return bit
+
+
+    def mask(self, codes: list[str]) -> int:
+        """
+        Get the bitmask of a list of course codes. Codes that are in no circuit don't have a bit, and are left out (they can't change any result)
+        """
+        mask = 0
+        bits = self._bits
+        for code in codes:
+            bit = bits.get(code)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+
+    def bits_of(self, codes: list[str]) -> list[int]:
+        """
+        Get the bits of a list of course codes, leaving out the codes that don't have one (same as mask)
+        """
+        bits = self._bits
+        return [bits[code] for code in codes if code in bits]
+
+
+    def __len__(self):
+        return len(self._bits)
+
+
+class PrerequisiteCircuit():
+    """
+    A course tree compiled into a boolean circuit over course bits (see CourseIndex).
+    Marking a tree for a student is then a few integer operations per AND, OR and Course node, with the completed courses as a bitmask.
+
+    Attributes:
+    - tree (FlatTree): The tree the circuit was compiled from, used to convert the results back to the JSON shape of course_node_to_dict
+    - root_code (str): The code of the root course
+    - course_codes (list[str]): The course codes of the tree in pre-order, without duplicates
+    - course_bit_ids (list[int]): For each node, the bit of its course (CourseIndex.bit) if it is a Course node, -1 otherwise
+    - course_bits (list[int]): For each node, the bitmask of its course if it is a Course node, 0 otherwise
+    - course_needs (list[int]): For each node, the bitmask of the courses of its Course children
+    - gate_needs (list[int]): For each node, the bitmask of its AND and OR children, with bit gate_bits[child] for each of them
+    - encoder (FlatTreeEncoder): Encodes the results of evaluate straight to JSON bytes
+
+    Notes:
+    - A circuit is never changed after it is compiled, so it can be cached and shared between requests
+    """
+
+    def __init__(self, tree: FlatTree, root_code: str, course_codes: list[str], course_index: CourseIndex):
+        self.tree = tree
+        self.root_code = root_code
+        self.course_codes = course_codes
+
+        code_bit_ids = [course_index.bit(code) for code in tree.codes]
+        code_bits = [1 << bit for bit in code_bit_ids]
+
+        # AND and OR nodes get their own (dense) bit numbers, to keep the gate masks small
+        gate_bits = {}
+        for i, kind in enumerate(tree.kinds):
+            if kind != COURSE_KIND:
+                gate_bits[i] = len(gate_bits)
+
+        self.course_bit_ids = [code_bit_ids[tree.code_ids[i]] if kind == COURSE_KIND else -1 for i, kind in enumerate(tree.kinds)]
+        self.course_bits = []
+        self.course_needs = []
+        self.gate_needs = []
+        self.gate_bits = [gate_bits.get(i, -1) for i in range(len(tree.kinds))]
+
+        offsets = tree.child_offsets
+        for i, kind in enumerate(tree.kinds):
+            self.course_bits.append(code_bits[tree.code_ids[i]] if kind == COURSE_KIND else 0)
+
+            course_need = 0
+            gate_need = 0
+            for j in range(offsets[i], offsets[i + 1]):
+                child = tree.children[j]
+                if tree.kinds[child] == COURSE_KIND:
+                    course_need |= code_bits[tree.code_ids[child]]
+                else:
+                    gate_need |= 1 << gate_bits[child]
+            self.course_needs.append(course_need)
+            self.gate_needs.append(gate_need)
+
+        self.encoder = FlatTreeEncoder(tree)
+
+
+    @classmethod
+    def compile(cls, root: CourseNode, course_index: CourseIndex):
+        """
+        Compile a (unmarked) CourseNode tree
+
+        Args:
+        - root (CourseNode): The root node of the tree
+        - course_index (CourseIndex): The index giving the bits of the course codes
+
+        Returns:
+        - PrerequisiteCircuit: The compiled circuit
+        """
+        course_codes = list(dict.fromkeys(node.code for node in find_all_course_nodes(root)))
+        return cls(FlatTree.from_course_node(root), root.code, course_codes, course_index)
+
+
+    def evaluate(self, completed_mask: int) -> bytearray:
+        """
+        Mark the tree for a student, same as traversal_util.mark_completion
+
+        Args:
+        - completed_mask (int): The bitmask of the completed courses (CourseIndex.mask)
+
+        Returns:
+        - bytearray: The state of each node of self.tree, a combination of the COMPLETED, MARKED and READY_TO_TAKE bits (same as FlatTree.mark_completion)
+        """
+        kinds = self.tree.kinds
+        course_bits = self.course_bits
+        course_needs = self.course_needs
+        gate_needs = self.gate_needs
+        gate_bits = self.gate_bits
+
+        state = bytearray(len(kinds))
+        # Bitmask of the AND and OR nodes that are marked so far, nodes come after their children
+        marked_gates = 0
+
+        for i, kind in enumerate(kinds):
+            course_need = course_needs[i]
+            gate_need = gate_needs[i]
+
+            if kind == OR_KIND:
+                if completed_mask & course_need or marked_gates & gate_need:
+                    state[i] = MARKED
+                    marked_gates |= 1 << gate_bits[i]
+            elif kind == AND_KIND:
+                if completed_mask & course_need == course_need and marked_gates & gate_need == gate_need:
+                    state[i] = MARKED
+                    marked_gates |= 1 << gate_bits[i]
+            else:
+                node_state = COMPLETED if completed_mask & course_bits[i] else 0
+                if completed_mask & course_need == course_need and marked_gates & gate_need == gate_need:
+                    node_state |= READY_TO_TAKE
+                state[i] = node_state
+
+        return state
+
+
+    def to_dict(self, state: bytearray) -> dict:
+        """
+        Convert the results of evaluate back to the dictionary of course_node_to_dict
+
+        Args:
+        - state (bytearray): The state returned by evaluate
+
+        Returns:
+        - dict: A dictionary representation of the marked tree
+        """
+        return self.tree.to_dict(state)
+
+
+    def to_json(self, state: bytearray) -> bytes:
+        """
+        Same as to_dict, encoded straight to JSON bytes (see FlatTreeEncoder)
+
+        Args:
+        - state (bytearray): The state returned by evaluate
+
+        Returns:
+        - bytes: The JSON of the marked tree
+        """
+        return self.encoder.encode(state)
+
+
+    def nbytes(self) -> int:
+        """
+        Approximate number of bytes used by the circuit, used to bound caches of circuits by size
+        """
+        mask_bytes = sum((mask.bit_length() + 7) // 8 + 28 for mask in self.course_needs) + sum((mask.bit_length() + 7) // 8 + 28 for mask in self.gate_needs)
+        head_bytes = sum(len(head) for heads in {id(heads): heads for heads in self.encoder.heads}.values() for head in heads.values())
+        return self.tree.nbytes() + mask_bytes + head_bytes + 8 * (len(self.course_bit_ids) + len(self.course_bits) + len(self.gate_bits) + len(self.course_codes))
+
+
+class CircuitCache():
+    """
+    Compiled circuits by (course_code, tree_choice), compiled from the trees of a graph backend when they are not cached
+
+    Attributes:
+    - cache (LRUCache): The cache of the circuits, each stored with the version of the catalog it was compiled from (see backend_version)
+    - course_index (CourseIndex): The index giving the bits of the course codes of every circuit
+
+    Notes:
+    - A circuit is only returned for the version it was compiled from, so a request never pairs a new catalog version (e.g. in its response cache key)
+    with a circuit of the previous one, even while the snapshot is being swapped and before the caches are cleared
+    """
+
+    def __init__(self, cache, course_index: CourseIndex = None):
+        self.cache = cache
+        self.course_index = course_index or CourseIndex()
+
+
+    def circuits(self, backend, course_codes: list[str], tree_choice: str = "full", version: int = None) -> list[PrerequisiteCircuit]:
+        """
+        Get the circuits of many courses, building the trees of those that are not cached with one call to the backend (create_trees_from_apoc)
+
+        Args:
+        - backend (GraphBackend): The backend to build the missing trees from
+        - course_codes (list[str]): The codes of the courses
+        - tree_choice (str): "full" for full trees, anything else for prerequisite (first level) trees
+        - version (int): The version of the catalog the circuits must come from, backend_version(backend) if None.
+        Read it once per request (before the backend is used) when it is also part of another cache key
+
+        Returns:
+        - list[PrerequisiteCircuit]: The circuit of each course, in the same order as course_codes
+
+        Notes:
+        - Raises CourseNotFound if one of the courses doesn't exist (same as create_trees_from_apoc)
+        """
+        if version is None:
+            version = backend_version(backend)
+        tree_choice, circuits, missing = self._lookup(course_codes, tree_choice, version)
+        if missing:
+            self._compile(missing, create_trees_from_apoc(backend, missing, tree_choice), tree_choice, circuits, backend, version)
+        return [circuits[course_code] for course_code in course_codes]
+
+
+    async def circuits_async(self, backend, course_codes: list[str], tree_choice: str = "full", version: int = None) -> list[PrerequisiteCircuit]:
+        """
+        Same as circuits, with a backend whose methods are coroutines (AsyncNeo4jBackend, see create_trees_from_apoc_async)
+        """
+        if version is None:
+            version = backend_version(backend)
+        tree_choice, circuits, missing = self._lookup(course_codes, tree_choice, version)
+        if missing:
+            self._compile(missing, await create_trees_from_apoc_async(backend, missing, tree_choice), tree_choice, circuits, backend, version)
+        return [circuits[course_code] for course_code in course_codes]
+
+
+    def _lookup(self, course_codes: list[str], tree_choice: str, version: int):
+        """
+        Get the cached circuits of many courses, a circuit compiled from another version of the catalog counts as not cached
+
+        Returns:
+        - tuple(str, dict, list): (the normalized tree_choice, the cached circuits by course code, the codes of the courses that are not cached)
+        """
+        tree_choice = "full" if tree_choice == "full" else "prerequisite"
+
+        circuits = {}
+        missing = []
+        for course_code in dict.fromkeys(course_codes):
+            entry = self.cache.get((course_code, tree_choice))
+            if entry is None or entry[0] != version:
+                missing.append(course_code)
+            else:
+                circuits[course_code] = entry[1]
+        return tree_choice, circuits, missing
+
+
+    def _compile(self, course_codes: list[str], roots: list[CourseNode], tree_choice: str, circuits: dict, backend, version: int):
+        """
+        Compile the trees of the courses that were not cached, cache them and add them to circuits.
+        They are not cached if the backend moved to another version while the trees were built (they may come from either version)
+        """
+        with phase("compile"):
+            cacheable = backend_version(backend) == version
+            for course_code, root in zip(course_codes, roots):
+                circuit = PrerequisiteCircuit.compile(root, self.course_index)
+                if cacheable:
+                    self.cache.set((course_code, tree_choice), (version, circuit))
+                circuits[course_code] = circuit
+
+
+    def completed_mask(self, completed_courses_list: list[str]) -> int:
+        """
+        Get the bitmask of the completed courses, to evaluate the circuits with
+        """
+        return self.course_index.mask(completed_courses_list)
+
+
+    def invalidate(self, course_code: str = None):
+        """
+        Remove the cached circuits of a course, or of every course if none is given (e.g. after the catalog changed)
+
+        Args:
+        - course_code (str): The code of the course, None to clear the whole cache
+        """
+        if course_code is None:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate((course_code, "full"))
+            self.cache.invalidate((course_code, "prerequisite"))
+
+
+def backend_version(backend) -> int:
+    """
+    The version of the catalog a graph backend builds trees from (GraphSnapshot.version), 0 for backends without one
+    """
+    return getattr(backend, "version", 0)
@@ -0,0 +1,80 @@
+from flat_tree import FlatTree, COURSE_KIND
+
+
+class CompactTrees():
+    """
+    Builds the compact format of many marked trees: one table of unique nodes shared by every tree, an edge list per tree, and the course titles once.
+
+    A Course node is identified by (code, state), so a course shared by many parents or many trees is sent once, and never expanded again under each parent.
+    AND and OR nodes are identified by their position in the tree they come from: their index is only unique within a tree,
+    so two trees can have different junctions with the same index (their children are in the edges of each tree).
+
+    Attributes:
+    - nodes (list[list]): The unique nodes, [kind, code or index, state] each (kind is the NodeKind int: 0 Course, 1 AND, 2 OR, state is a combination of the COMPLETED (1), MARKED (2) and READY_TO_TAKE (4) bits)
+    - titles (dict[str, str]): The full name of every course code in nodes
+    - trees (list[dict]): ({code: str, root: int, edges: [[int, int]]}) for each added tree, the edges are (parent, child) node ids in the order of the children
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.titles = {}
+        self.trees = []
+        self._ids = {}
+
+
+    def add_tree(self, root_code: str, tree: FlatTree, state: bytearray):
+        """
+        Add a marked tree
+
+        Args:
+        - root_code (str): The code of the root course
+        - tree (FlatTree): The tree
+        - state (bytearray): The state of each node of the tree (FlatTree.mark_completion, PrerequisiteCircuit.evaluate)
+        """
+        ids = self._ids
+        nodes = self.nodes
+        titles = self.titles
+        code_ids = tree.code_ids
+        codes = tree.codes
+
+        node_ids = []
+        for i, kind in enumerate(tree.kinds):
+            if kind == COURSE_KIND:
+                code_id = code_ids[i]
+                ref = codes[code_id]
+                if ref not in titles:
+                    titles[ref] = tree.full_names[code_id]
+
+                key = (ref, state[i])
+                node_id = ids.get(key)
+                if node_id is None:
+                    node_id = ids[key] = len(nodes)
+                    nodes.append([kind, ref, state[i]])
+            else:
+                # Every junction of the FlatTree is at one position, it gets a node of its own
+                node_id = len(nodes)
+                nodes.append([kind, tree.indexes[i], state[i]])
+            node_ids.append(node_id)
+
+        # Every unique node of the tree is stored once in the FlatTree, so every edge is only listed once
+        offsets = tree.child_offsets
+        children = tree.children
+        edges = []
+        for i in range(len(node_ids)):
+            parent_id = node_ids[i]
+            for j in range(offsets[i], offsets[i + 1]):
+                edges.append([parent_id, node_ids[children[j]]])
+
+        self.trees.append({"code": root_code, "root": node_ids[-1], "edges": edges})
+
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+        - dict: ({nodes: [[int, str or int, int]], titles: {str: str}, course_trees: [{code: str, root: int, edges: [[int, int]]}]})
+        """
+        return {
+            "nodes": self.nodes,
+            "titles": self.titles,
+            "course_trees": self.trees
+        }
@@ -0,0 +1,118 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent as they are, compressing them saves less than it costs (0 disables compression)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+# Low levels: the trees are very repetitive, so they already compress ~10x, higher levels mostly add latency
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/html"}
+
+
+def available_encodings() -> list[str]:
+    """
+    The content codings the server can send, in order of preference (br only if the brotli package is installed)
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encodings) -> str:
+    """
+    Negotiate the content coding of a response
+
+    Args:
+    - accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header of the request (request.accept_encodings)
+
+    Returns:
+    - str: "br" or "gzip", None to send the response uncompressed
+
+    Notes:
+    - The coding with the highest q value is chosen, br wins ties since it is smaller at the same speed
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body
+
+    Args:
+    - body (bytes): The body
+    - encoding (str): "br" or "gzip"
+
+    Returns:
+    - bytes: The compressed body
+
+    Notes:
+    - gzip is written with mtime 0, so the same body always gives the same bytes (they are sent with strong ETags)
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a response in place if the client accepts it and it is worth it
+
+    Args:
+    - response (flask.Response): The response
+    - accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header of the request
+
+    Returns:
+    - flask.Response: The same response
+
+    Notes:
+    - Streamed responses (e.g. /course/?stream=1), responses that already have a Content-Encoding and responses smaller than COMPRESSION_MIN_BYTES are left as they are
+    - A strong ETag gets the coding appended ("<etag>-gzip"), the compressed bytes are a different representation (see matching_etag)
+    """
+    if COMPRESSION_MIN_BYTES <= 0 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    # The representation depends on Accept-Encoding, even when this one isn't compressed
+    response.vary.add("Accept-Encoding")
+
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def matching_etag(if_none_match, etag: str) -> str:
+    """
+    Find which representation of a resource a conditional request already has
+
+    Args:
+    - if_none_match (werkzeug.datastructures.ETags): The parsed If-None-Match header of the request (request.if_none_match)
+    - etag (str): The ETag of the uncompressed resource, without the quotes
+
+    Returns:
+    - str: The ETag (the uncompressed one or one of its compressed variants) that matches If-None-Match, None if none does
+    """
+    for candidate in [etag] + [f"{etag}-{encoding}" for encoding in available_encodings()]:
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
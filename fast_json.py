@@ -0,0 +1,189 @@
+import json
+from flat_tree import FlatTree, COMPLETED, MARKED, READY_TO_TAKE, COURSE_KIND
+from traversal_util import CourseNode, NodeKind, KIND_LABELS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    """
+    Encode an object to compact JSON bytes, with orjson if it is installed, the standard library otherwise
+
+    Args:
+    - obj: The object (dicts, lists, strings, numbers, booleans and None)
+
+    Returns:
+    - bytes: The UTF-8 JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _bool(value) -> bytes:
+    return b"true" if value else b"false"
+
+
+def course_head(code: str, full_name: str, completed: bool, ready_to_take: bool) -> bytes:
+    """
+    The JSON of a Course node up to its children (same keys and order as course_node_to_dict), without the closing brace
+    """
+    return (
+        b'{"label":"Course","marked":false,"ready_to_take":' + _bool(ready_to_take)
+        + b',"completed":' + _bool(completed)
+        + b',"code":' + dumps(code)
+        + b',"full_name":' + dumps(full_name)
+    )
+
+
+def junction_head(label: str, index, marked: bool) -> bytes:
+    """
+    The JSON of an AND or OR node up to its children (same keys and order as course_node_to_dict), without the closing brace
+    """
+    return (
+        b'{"label":' + dumps(label) + b',"marked":' + _bool(marked)
+        + b',"ready_to_take":false,"completed":false,"index":' + dumps(index)
+    )
+
+
+class FlatTreeEncoder():
+    """
+    Encodes a FlatTree marked with a state (FlatTree.mark_completion, PrerequisiteCircuit.evaluate) straight to JSON bytes, without building the dicts of FlatTree.to_dict
+
+    Attributes:
+    - tree (FlatTree): The tree
+    - heads (list[dict[int, bytes]]): For each node, the JSON of the node up to its children, by the state bits that change it
+
+    Notes:
+    - The JSON is the same as json.dumps(tree.to_dict(state)), without the spaces
+    - A FlatTree never changes, so the encoder of a cached tree can be cached with it (see PrerequisiteCircuit)
+    """
+
+    def __init__(self, tree: FlatTree):
+        self.tree = tree
+        self.heads = []
+
+        code_heads = {}
+        for i, kind in enumerate(tree.kinds):
+            if kind == COURSE_KIND:
+                code_id = tree.code_ids[i]
+                # Shared by every node of the same course
+                if code_id not in code_heads:
+                    code, full_name = tree.codes[code_id], tree.full_names[code_id]
+                    code_heads[code_id] = {
+                        state: course_head(code, full_name, state & COMPLETED != 0, state & READY_TO_TAKE != 0)
+                        for state in (0, COMPLETED, READY_TO_TAKE, COMPLETED | READY_TO_TAKE)
+                    }
+                self.heads.append(code_heads[code_id])
+            else:
+                label, index = KIND_LABELS[kind], tree.indexes[i]
+                self.heads.append({0: junction_head(label, index, False), MARKED: junction_head(label, index, True)})
+
+
+    def encode(self, state: bytearray = None) -> bytes:
+        """
+        Encode the tree marked with a state
+
+        Args:
+        - state (bytearray): The state of each node, every node is unmarked if not given
+
+        Returns:
+        - bytes: The JSON of the tree
+        """
+        if state is None:
+            state = bytearray(len(self.tree.kinds))
+
+        heads = self.heads
+        offsets = self.tree.child_offsets
+        children = self.tree.children
+        parts = []
+
+        # Pre-order, the pieces of JSON are added to parts in the order they are written and joined once
+        stack = [len(heads) - 1]
+        while stack:
+            item = stack.pop()
+            if item.__class__ is bytes:
+                parts.append(item)
+                continue
+
+            parts.append(heads[item][state[item]])
+            start = offsets[item]
+            end = offsets[item + 1]
+            if start == end:
+                parts.append(b"}")
+                continue
+
+            parts.append(b',"children":[')
+            stack.append(b"]}")
+            for j in range(end - 1, start, -1):
+                stack.append(children[j])
+                stack.append(b",")
+            stack.append(children[start])
+
+        return b"".join(parts)
+
+
+def encode_course_node(root: CourseNode) -> bytes:
+    """
+    Encode a (marked) CourseNode tree straight to JSON bytes, same as json.dumps(course_node_to_dict(root)) without the spaces and the intermediate dicts
+
+    Args:
+    - root (CourseNode): The root node of the tree
+
+    Returns:
+    - bytes: The JSON of the tree
+    """
+    parts = []
+    course_strings = {}
+
+    stack = [root]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is bytes:
+            parts.append(item)
+            continue
+
+        if item.kind is NodeKind.COURSE:
+            strings = course_strings.get(item.code)
+            if strings is None:
+                strings = course_strings[item.code] = b',"code":' + dumps(item.code) + b',"full_name":' + dumps(item.full_name)
+            parts.append(b'{"label":"Course","marked":')
+            parts.append(_bool(item.marked))
+            parts.append(b',"ready_to_take":')
+            parts.append(_bool(item.ready_to_take))
+            parts.append(b',"completed":')
+            parts.append(_bool(item.completed))
+            parts.append(strings)
+        else:
+            parts.append(junction_head(item.label, item.index, item.marked))
+
+        node_children = item.children
+        if not node_children:
+            parts.append(b"}")
+            continue
+
+        parts.append(b',"children":[')
+        stack.append(b"]}")
+        for child in reversed(node_children[1:]):
+            stack.append(child)
+            stack.append(b",")
+        stack.append(node_children[0])
+
+    return b"".join(parts)
+
+
+def encode_course_response(tree_jsons: list[bytes], commonality: dict) -> bytes:
+    """
+    The JSON of a /course/ response, from the already encoded trees
+
+    Args:
+    - tree_jsons (list[bytes]): The JSON of each course tree
+    - commonality (dict): The commonality dict (commonality_from_course_codes)
+
+    Returns:
+    - bytes: ({"course_trees": [...], "commonality": {...}}) as JSON
+    """
+    return b'{"course_trees":[' + b",".join(tree_jsons) + b'],"commonality":' + dumps(commonality) + b"}"
@@ -0,0 +1,238 @@
+from array import array
+from traversal_util import CourseNode, NodeKind, KIND_LABELS
+
+# Bits of the state array returned by FlatTree.mark_completion
+COMPLETED = 1
+MARKED = 2
+READY_TO_TAKE = 4
+SATISFIED = COMPLETED | MARKED
+
+# Plain ints of the NodeKinds stored in FlatTree.kinds, faster to compare in the loops
+COURSE_KIND = int(NodeKind.COURSE)
+AND_KIND = int(NodeKind.AND)
+OR_KIND = int(NodeKind.OR)
+
+
+class FlatTree():
+    """
+    Compact, immutable struct-of-arrays representation of a course tree, for trees that are kept around (e.g. cached) and marked many times.
+
+    Every unique node of the tree gets a position, nodes are stored in post-order (children before their parents), so the root is the last node.
+    The marking state is not stored in the tree, mark_completion returns it as a separate array, so the same FlatTree can be shared between requests.
+
+    Attributes:
+    - kinds (array[int]): NodeKind of each node
+    - code_ids (array[int]): Position in codes of each Course node, -1 for AND and OR nodes
+    - indexes (list[int]): Index of each AND and OR node, None for Course nodes
+    - child_offsets (array[int]): The children of node i are children[child_offsets[i]:child_offsets[i + 1]]
+    - children (array[int]): Positions of the children of every node, one node after the other
+    - codes (list[str]): Unique course codes of the tree
+    - full_names (list[str]): Full name of each code in codes
+    """
+
+    def __init__(self, kinds, code_ids, indexes, child_offsets, children, codes, full_names):
+        self.kinds = kinds
+        self.code_ids = code_ids
+        self.indexes = indexes
+        self.child_offsets = child_offsets
+        self.children = children
+        self.codes = codes
+        self.full_names = full_names
+
+
+    @classmethod
+    def from_course_node(cls, root: CourseNode):
+        """
+        Flatten a CourseNode tree. Nodes that appear under many parents (the same CourseNode object) are stored once.
+
+        Args:
+        - root (CourseNode): The root node of the tree
+
+        Returns:
+        - FlatTree: The flattened tree
+        """
+        kinds = array("b")
+        code_ids = array("i")
+        indexes = []
+        child_offsets = array("i", [0])
+        children = array("i")
+        codes = []
+        full_names = []
+        code_positions = {}
+        positions = {}
+
+        # Iterative post-order traversal, a node is added once all of its children are
+        stack = [(root, False)]
+        while stack:
+            node, children_added = stack.pop()
+            if id(node) in positions:
+                continue
+
+            if not children_added:
+                stack.append((node, True))
+                for child in reversed(node.children):
+                    if id(child) not in positions:
+                        stack.append((child, False))
+                continue
+
+            if node.kind is NodeKind.COURSE:
+                if node.code not in code_positions:
+                    code_positions[node.code] = len(codes)
+                    codes.append(node.code)
+                    full_names.append(node.full_name)
+                code_ids.append(code_positions[node.code])
+            else:
+                code_ids.append(-1)
+
+            positions[id(node)] = len(kinds)
+            kinds.append(node.kind)
+            indexes.append(node.index)
+            children.extend(positions[id(child)] for child in node.children)
+            child_offsets.append(len(children))
+
+        return cls(kinds, code_ids, indexes, child_offsets, children, codes, full_names)
+
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+    def mark_completion(self, completed_courses_list: list[str]) -> bytearray:
+        """
+        Same as traversal_util.mark_completion, but returns the state of every node instead of setting it on the nodes.
+
+        Args:
+        - completed_courses_list (list[str]): A list of course codes that have been completed
+
+        Returns:
+        - bytearray: The state of each node, a combination of the COMPLETED, MARKED and READY_TO_TAKE bits
+        """
+        completed_courses = set(completed_courses_list)
+        completed_codes = [code in completed_courses for code in self.codes]
+
+        code_ids = self.code_ids
+        offsets = self.child_offsets
+        children = self.children
+        state = bytearray(len(self.kinds))
+
+        # Children come before their parents, so one pass in order is enough
+        for i, kind in enumerate(self.kinds):
+            start = offsets[i]
+            end = offsets[i + 1]
+            if kind == OR_KIND:
+                node_state = 0
+                for j in range(start, end):
+                    if state[children[j]] & SATISFIED:
+                        node_state = MARKED
+                        break
+            else:
+                all_satisfied = True
+                for j in range(start, end):
+                    if not state[children[j]] & SATISFIED:
+                        all_satisfied = False
+                        break
+
+                if kind == AND_KIND:
+                    node_state = MARKED if all_satisfied else 0
+                else:
+                    node_state = COMPLETED if completed_codes[code_ids[i]] else 0
+                    if all_satisfied:
+                        node_state |= READY_TO_TAKE
+            state[i] = node_state
+
+        return state
+
+
+    def to_dict(self, state: bytearray = None) -> dict:
+        """
+        Same as traversal_util.course_node_to_dict, for the given state.
+
+        Args:
+        - state (bytearray): The state returned by mark_completion, every node is unmarked if not given
+
+        Returns:
+        - dict: A dictionary representation of the tree, serializing to the same JSON as course_node_to_dict
+
+        Notes:
+        - Nodes stored once are converted once, and the same dict is used under every parent
+        """
+        if state is None:
+            state = bytearray(len(self.kinds))
+
+        offsets = self.child_offsets
+        children = self.children
+        code_ids = self.code_ids
+        indexes = self.indexes
+        codes = self.codes
+        full_names = self.full_names
+        dicts = []
+
+        for i, kind in enumerate(self.kinds):
+            node_state = state[i]
+            if kind == COURSE_KIND:
+                code_id = code_ids[i]
+                node_dict = {
+                    "label": "Course",
+                    "marked": False,
+                    "ready_to_take": node_state & READY_TO_TAKE != 0,
+                    "completed": node_state & COMPLETED != 0,
+                    "code": codes[code_id],
+                    "full_name": full_names[code_id],
+                }
+            else:
+                node_dict = {
+                    "label": KIND_LABELS[kind],
+                    "marked": node_state & MARKED != 0,
+                    "ready_to_take": False,
+                    "completed": False,
+                    "index": indexes[i],
+                }
+
+            start = offsets[i]
+            end = offsets[i + 1]
+            if start != end:
+                node_dict["children"] = [dicts[children[j]] for j in range(start, end)]
+
+            dicts.append(node_dict)
+
+        return dicts[-1]
+
+
+    def node_table(self) -> list[dict]:
+        """
+        The unmarked nodes of the tree, in the order of their positions, with the positions of their children instead of the children themselves.
+        Used to send a tree once, and the states of its nodes as positions (e.g. for many students)
+
+        Returns:
+        - list[dict]: ({label: str, code: str, full_name: str} or {label: str, index: int}, and children: [int] if the node has children) for each node, the root is the last one
+        """
+        offsets = self.child_offsets
+        children = self.children
+        table = []
+
+        for i, kind in enumerate(self.kinds):
+            if kind == COURSE_KIND:
+                code_id = self.code_ids[i]
+                node = {"label": "Course", "code": self.codes[code_id], "full_name": self.full_names[code_id]}
+            else:
+                node = {"label": KIND_LABELS[kind], "index": self.indexes[i]}
+
+            if offsets[i] != offsets[i + 1]:
+                node["children"] = list(children[offsets[i]:offsets[i + 1]])
+            table.append(node)
+
+        return table
+
+
+    def nbytes(self) -> int:
+        """
+        Approximate number of bytes used by the arrays of the tree (not counting the code and full name strings, which are shared with the rest of the process)
+        """
+        return (
+            self.kinds.itemsize * len(self.kinds)
+            + self.code_ids.itemsize * len(self.code_ids)
+            + 8 * len(self.indexes)
+            + self.child_offsets.itemsize * len(self.child_offsets)
+            + self.children.itemsize * len(self.children)
+            + 8 * (len(self.codes) + len(self.full_names))
+        )
@@ -0,0 +1,524 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from traversal_util import (
+    run_apoc_query, run_apoc_query_first_level, run_apoc_query_batch, run_subgraph_query_async, run_lean_query, run_lean_query_async,
+    run_titles_query, run_titles_query_async, LeanSubgraph, NodeKind
+)
+
+logger = logging.getLogger(__name__)
+
+
+class GraphBackend():
+    """
+    Base class for the sources that the course trees are built from.
+
+    A subgraph is a (nodes, relationships) tuple, with the nodes and relationships reachable from a course, in the format
+    returned by the APOC queries (objects with element_id and labels / type and nodes, and their properties readable with obj["key"])
+    """
+
+    def subgraph(self, course_code: str, first_level: bool = False):
+        """
+        Get the subgraph reachable from a course
+
+        Args:
+        - course_code (str): The code of the course the subgraph starts from
+        - first_level (bool): Whether to only keep the relationships of the first level of the tree (the prerequisite tree)
+
+        Returns:
+        - tuple(list, list): The nodes and relationships of the subgraph, None if the course doesn't exist
+        """
+        raise NotImplementedError
+
+
+    def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        """
+        Get the subgraphs reachable from many courses. Backends that can fetch them all at once should override this.
+
+        Args:
+        - course_codes (list[str]): The codes of the courses the subgraphs start from
+        - first_level (bool): Whether to only keep the relationships of the first level of the trees
+
+        Returns:
+        - dict[str, tuple(list, list)]: The subgraph of each course, courses that don't exist are left out
+        """
+        subgraphs = {}
+        for course_code in course_codes:
+            subgraph = self.subgraph(course_code, first_level)
+            if subgraph is not None:
+                subgraphs[course_code] = subgraph
+        return subgraphs
+
+
+    def find_course(self, course_code: str):
+        """
+        Get the details of a course
+
+        Args:
+        - course_code (str): The code of the course
+
+        Returns:
+        - dict: ({code: str, full_name: str}), None if the course doesn't exist
+        """
+        raise NotImplementedError
+
+
+class Neo4jBackend(GraphBackend):
+    """
+    Backend running the APOC queries against the Neo4j database, one session per call
+
+    Attributes:
+    - _driver (GraphDatabase.driver or Neo4jConn): The Neo4j driver instance, or the Neo4jConn creating it on first use
+    - on_query (function): Called with the name of the query and its duration in seconds after every query (e.g. to export query latencies as metrics), None to do nothing
+    - fanout_threads (int): Threads fetching the subgraphs of many courses at the same time, one session per course (see subgraphs). 0 fetches them with one batched query
+    - lean (bool): Whether to fetch the subgraphs with run_lean_query (LeanSubgraph) instead of the APOC queries returning Node and Relationship objects
+    - titles (dict[str, str]): Full name by course code of the lean subgraphs. Fetched from the database when a course is missing from it
+    """
+
+    def __init__(self, driver, on_query=None, fanout_threads: int = 0, lean: bool = False, titles: dict = None):
+        self._driver = driver
+        self.on_query = on_query
+        self.fanout_threads = fanout_threads
+        self.lean = lean
+        self.titles = dict(titles or {})
+        self._titles_lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+
+    def _execute_read(self, query_name: str, query_func, *args):
+        """
+        Run a read transaction function in a new session, reporting its duration to on_query
+        """
+        started_at = time.perf_counter()
+        try:
+            with self._driver.session() as session:
+                return session.execute_read(query_func, *args)
+        finally:
+            if self.on_query is not None:
+                self.on_query(query_name, time.perf_counter() - started_at)
+
+
+    def subgraph(self, course_code: str, first_level: bool = False):
+        if self.lean:
+            return self._lean_subgraphs([course_code], first_level).get(course_code)
+
+        query_func = run_apoc_query_first_level if first_level else run_apoc_query
+        result = self._execute_read(tree_choice_of(first_level), query_func, course_code)
+
+        if not result:
+            return None
+        return result[0]["nodes"], result[0]["relationships"]
+
+
+    def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        """
+        Get the subgraphs of many courses: with one batched query, or with fanout_threads queries at a time (one per course, each in its own session).
+
+        Notes:
+        - The batched query is one round trip, but the database walks every course one after the other and the whole union comes back in one result.
+        With the fan-out, the courses are walked and sent in parallel, and the request waits for about the slowest course instead of the sum
+        - The subgraphs are returned in the order of course_codes either way
+        """
+        if not course_codes:
+            return {}
+
+        if self.fanout_threads > 0 and len(course_codes) > 1:
+            results = self._fanout_executor().map(lambda course_code: self.subgraph(course_code, first_level), course_codes)
+            return {course_code: subgraph for course_code, subgraph in zip(course_codes, results) if subgraph is not None}
+
+        if self.lean:
+            return self._lean_subgraphs(course_codes, first_level)
+
+        # One round trip for every course
+        result = self._execute_read(f"{tree_choice_of(first_level)}_batch", run_apoc_query_batch, list(course_codes), first_level)
+
+        subgraphs = {}
+        for record in result:
+            nodes_by_id = {node.element_id: node for node in record["nodes"]}
+            relationships_by_id = {rel.element_id: rel for rel in record["relationships"]}
+
+            for root in record["roots"]:
+                subgraphs[root["root"]] = (
+                    [nodes_by_id[node_id] for node_id in root["node_ids"]],
+                    [relationships_by_id[rel_id] for rel_id in root["relationship_ids"]]
+                )
+        return subgraphs
+
+
+    def _lean_subgraphs(self, course_codes: list[str], first_level: bool) -> dict:
+        """
+        Get the lean subgraphs of many courses with one round trip (run_lean_query)
+
+        Returns:
+        - dict[str, LeanSubgraph]: The subgraph of each course, in the order of course_codes, courses that don't exist are left out
+        """
+        records = self._execute_read(f"{tree_choice_of(first_level)}_lean", run_lean_query, list(course_codes), first_level)
+
+        course_codes_found = {row[2] for record in records for row in record["nodes"] if row[1] == NodeKind.COURSE}
+        titles = self._titles_of(course_codes_found)
+
+        subgraphs = {record["course_code"]: LeanSubgraph(record["nodes"], record["relationships"], titles) for record in records}
+        return {course_code: subgraphs[course_code] for course_code in course_codes if course_code in subgraphs}
+
+
+    def _titles_of(self, course_codes: set) -> dict:
+        """
+        The titles map, with every title of the database fetched again (run_titles_query) if one of the courses is missing from it (e.g. a course added since)
+        """
+        if not course_codes.issubset(self.titles.keys()):
+            with self._titles_lock:
+                if not course_codes.issubset(self.titles.keys()):
+                    self.titles.update(self._execute_read("titles", run_titles_query))
+        return self.titles
+
+
+    def _fanout_executor(self) -> ThreadPoolExecutor:
+        """
+        The thread pool of the fan-out, shared by every request of this process (its size bounds the sessions the fan-out uses at a time).
+        Created on first use, and again in a forked worker (the threads of the parent don't exist in the child)
+        """
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.fanout_threads, thread_name_prefix="neo4j-fanout")
+                    self._executor_pid = pid
+        return self._executor
+
+
+    def find_course(self, course_code: str):
+        started_at = time.perf_counter()
+        try:
+            result = self._driver.execute_query(
+                """
+                MATCH (c:Course {code: $code})
+                RETURN c.full_name as full_name
+                """,
+                code=course_code
+            )
+        finally:
+            if self.on_query is not None:
+                self.on_query("find_course", time.perf_counter() - started_at)
+        if not result.records:
+            return None
+        return {
+            "code": course_code,
+            "full_name": result.records[0]["full_name"]
+        }
+
+
+class AsyncNeo4jBackend():
+    """
+    Same as Neo4jBackend with the async Neo4j driver, every method is a coroutine (used by asgi.py)
+
+    Attributes:
+    - _driver (AsyncGraphDatabase.driver): The async Neo4j driver instance
+    - on_query (function): Called with the name of the query and its duration in seconds after every query, None to do nothing
+    - lean (bool): Whether to fetch the subgraphs with run_lean_query (LeanSubgraph), same as Neo4jBackend.lean
+    - titles (dict[str, str]): Full name by course code of the lean subgraphs. Fetched from the database when a course is missing from it
+
+    Notes:
+    - subgraphs fetches every course at the same time, one session (and pool connection) per course, instead of one batched query.
+    The request waits for the slowest course instead of the sum, and the event loop serves other requests during the waits
+    """
+
+    def __init__(self, driver, on_query=None, lean: bool = False, titles: dict = None):
+        self._driver = driver
+        self.on_query = on_query
+        self.lean = lean
+        self.titles = dict(titles or {})
+        self._titles_lock = asyncio.Lock()
+
+
+    async def _execute_read(self, query_name: str, query_func, *args):
+        """
+        Run an async read transaction function in a new session, reporting its duration to on_query
+        """
+        started_at = time.perf_counter()
+        try:
+            async with self._driver.session() as session:
+                return await session.execute_read(query_func, *args)
+        finally:
+            if self.on_query is not None:
+                self.on_query(query_name, time.perf_counter() - started_at)
+
+
+    async def subgraph(self, course_code: str, first_level: bool = False):
+        if self.lean:
+            return await self._lean_subgraph(course_code, first_level)
+
+        result = await self._execute_read(tree_choice_of(first_level), run_subgraph_query_async, course_code, first_level)
+
+        if not result:
+            return None
+        return result[0]["nodes"], result[0]["relationships"]
+
+
+    async def _lean_subgraph(self, course_code: str, first_level: bool):
+        """
+        Get the lean subgraph of a course (run_lean_query_async), None if the course doesn't exist
+        """
+        records = await self._execute_read(f"{tree_choice_of(first_level)}_lean", run_lean_query_async, [course_code], first_level)
+        if not records:
+            return None
+
+        nodes, relationships = records[0]["nodes"], records[0]["relationships"]
+        course_codes = {row[2] for row in nodes if row[1] == NodeKind.COURSE}
+        if not course_codes.issubset(self.titles.keys()):
+            async with self._titles_lock:
+                if not course_codes.issubset(self.titles.keys()):
+                    self.titles.update(await self._execute_read("titles", run_titles_query_async))
+        return LeanSubgraph(nodes, relationships, self.titles)
+
+
+    async def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        results = await asyncio.gather(*(self.subgraph(course_code, first_level) for course_code in course_codes))
+        return {course_code: subgraph for course_code, subgraph in zip(course_codes, results) if subgraph is not None}
+
+
+    async def find_course(self, course_code: str):
+        started_at = time.perf_counter()
+        try:
+            result = await self._driver.execute_query(
+                """
+                MATCH (c:Course {code: $code})
+                RETURN c.full_name as full_name
+                """,
+                code=course_code
+            )
+        finally:
+            if self.on_query is not None:
+                self.on_query("find_course", time.perf_counter() - started_at)
+        if not result.records:
+            return None
+        return {
+            "code": course_code,
+            "full_name": result.records[0]["full_name"]
+        }
+
+
+    async def close(self):
+        await self._driver.close()
+
+
+class FallbackBackend(GraphBackend):
+    """
+    Backend that uses a primary backend, and a fallback backend whenever the primary one fails (e.g. Neo4j is down or times out)
+
+    Attributes:
+    - primary (GraphBackend): The backend to use normally
+    - fallback (GraphBackend): The backend to use when the primary backend raises an exception
+    """
+
+    def __init__(self, primary: GraphBackend, fallback: GraphBackend):
+        self.primary = primary
+        self.fallback = fallback
+
+
+    def subgraph(self, course_code: str, first_level: bool = False):
+        try:
+            return self.primary.subgraph(course_code, first_level)
+        except Exception as e:
+            logger.warning("Graph backend failed, using fallback: %s", e)
+            return self.fallback.subgraph(course_code, first_level)
+
+
+    def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        try:
+            return self.primary.subgraphs(course_codes, first_level)
+        except Exception as e:
+            logger.warning("Graph backend failed, using fallback: %s", e)
+            return self.fallback.subgraphs(course_codes, first_level)
+
+
+    def find_course(self, course_code: str):
+        try:
+            return self.primary.find_course(course_code)
+        except Exception as e:
+            logger.warning("Graph backend failed, using fallback: %s", e)
+            return self.fallback.find_course(course_code)
+
+
+class CachingBackend(GraphBackend):
+    """
+    Backend caching the subgraphs of another backend by (course_code, tree_choice)
+
+    Attributes:
+    - backend (GraphBackend): The backend the subgraphs are fetched from on a cache miss
+    - cache (LRUCache): The cache of the subgraphs
+
+    Notes:
+    - The cached subgraphs are the unmarked nodes and relationships returned by the backend, which the tree builders only read.
+    Every request builds (and marks) its own CourseNode tree from them, so the cached data is never mutated.
+    """
+
+    def __init__(self, backend: GraphBackend, cache):
+        self.backend = backend
+        self.cache = cache
+
+
+    def subgraph(self, course_code: str, first_level: bool = False):
+        key = (course_code, tree_choice_of(first_level))
+        subgraph = self.cache.get(key)
+        if subgraph is None:
+            subgraph = self.backend.subgraph(course_code, first_level)
+            if subgraph is not None:
+                self.cache.set(key, subgraph)
+        return subgraph
+
+
+    def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        tree_choice = tree_choice_of(first_level)
+
+        subgraphs = {}
+        missing = []
+        for course_code in course_codes:
+            subgraph = self.cache.get((course_code, tree_choice))
+            if subgraph is None:
+                missing.append(course_code)
+            else:
+                subgraphs[course_code] = subgraph
+
+        # One call for every course that wasn't cached
+        if missing:
+            fetched = self.backend.subgraphs(missing, first_level)
+            for course_code, subgraph in fetched.items():
+                self.cache.set((course_code, tree_choice), subgraph)
+            subgraphs.update(fetched)
+
+        # Keep the order of course_codes
+        return {course_code: subgraphs[course_code] for course_code in course_codes if course_code in subgraphs}
+
+
+    def find_course(self, course_code: str):
+        return self.backend.find_course(course_code)
+
+
+    def invalidate(self, course_code: str = None):
+        """
+        Remove the cached subgraphs of a course, or of every course if none is given
+
+        Args:
+        - course_code (str): The code of the course, None to clear the whole cache
+        """
+        if course_code is None:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate((course_code, "full"))
+            self.cache.invalidate((course_code, "prerequisite"))
+
+
+class AsyncFallbackBackend():
+    """
+    Same as FallbackBackend for an async primary backend (AsyncNeo4jBackend), with a synchronous in-memory fallback backend (e.g. LocalBackend)
+
+    Attributes:
+    - primary (AsyncNeo4jBackend): The backend to use normally
+    - fallback (GraphBackend): The backend to use when the primary backend raises an exception, called without awaiting (it must not do I/O)
+    """
+
+    def __init__(self, primary, fallback: GraphBackend):
+        self.primary = primary
+        self.fallback = fallback
+
+
+    async def subgraph(self, course_code: str, first_level: bool = False):
+        try:
+            return await self.primary.subgraph(course_code, first_level)
+        except Exception as e:
+            logger.warning("Graph backend failed, using fallback: %s", e)
+            return self.fallback.subgraph(course_code, first_level)
+
+
+    async def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        try:
+            return await self.primary.subgraphs(course_codes, first_level)
+        except Exception as e:
+            logger.warning("Graph backend failed, using fallback: %s", e)
+            return self.fallback.subgraphs(course_codes, first_level)
+
+
+    async def find_course(self, course_code: str):
+        try:
+            return await self.primary.find_course(course_code)
+        except Exception as e:
+            logger.warning("Graph backend failed, using fallback: %s", e)
+            return self.fallback.find_course(course_code)
+
+
+    async def close(self):
+        await self.primary.close()
+
+
+class AsyncCachingBackend():
+    """
+    Same as CachingBackend for an async backend. It can share its cache with a CachingBackend, the keys and subgraphs are the same
+
+    Attributes:
+    - backend (AsyncNeo4jBackend or AsyncFallbackBackend): The backend the subgraphs are fetched from on a cache miss
+    - cache (LRUCache): The cache of the subgraphs
+    """
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+
+    async def subgraph(self, course_code: str, first_level: bool = False):
+        return (await self.subgraphs([course_code], first_level)).get(course_code)
+
+
+    async def subgraphs(self, course_codes: list[str], first_level: bool = False) -> dict:
+        tree_choice = tree_choice_of(first_level)
+
+        subgraphs = {}
+        missing = []
+        for course_code in course_codes:
+            subgraph = self.cache.get((course_code, tree_choice))
+            if subgraph is None:
+                missing.append(course_code)
+            else:
+                subgraphs[course_code] = subgraph
+
+        if missing:
+            fetched = await self.backend.subgraphs(missing, first_level)
+            for course_code, subgraph in fetched.items():
+                self.cache.set((course_code, tree_choice), subgraph)
+            subgraphs.update(fetched)
+
+        # Keep the order of course_codes
+        return {course_code: subgraphs[course_code] for course_code in course_codes if course_code in subgraphs}
+
+
+    async def find_course(self, course_code: str):
+        return await self.backend.find_course(course_code)
+
+
+    async def close(self):
+        await self.backend.close()
+
+
+def tree_choice_of(first_level: bool) -> str:
+    """
+    The tree_choice of the request body matching a first_level flag
+    """
+    return "prerequisite" if first_level else "full"
+
+
+def approximate_subgraph_size(subgraph) -> int:
+    """
+    Rough number of bytes a subgraph takes in memory, used to bound caches of subgraphs by size
+
+    Args:
+    - subgraph (tuple(list, list)): The nodes and relationships of the subgraph
+
+    Returns:
+    - int: The approximate size in bytes
+    """
+    nodes, relationships = subgraph
+    return 64 + 400 * len(nodes) + 300 * len(relationships)
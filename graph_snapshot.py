@@ -0,0 +1,248 @@
+import hashlib
+import threading
+import time
+from graph_backend import GraphBackend
+
+
+class SnapshotNode():
+    """
+    A copy of a Neo4j node kept in a GraphSnapshot. It behaves like neo4j.graph.Node for what traversal_util uses (element_id, labels, node["key"] and dict(node))
+
+    Attributes:
+    - element_id (str): The Neo4j element id of the node
+    - labels (frozenset[str]): The labels of the node ("Course", "AND" or "OR")
+    """
+    __slots__ = ("element_id", "labels", "_properties")
+
+    def __init__(self, element_id, labels, properties):
+        self.element_id = element_id
+        self.labels = frozenset(labels)
+        self._properties = dict(properties)
+
+    def keys(self):
+        return self._properties.keys()
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+    def __getitem__(self, key):
+        return self._properties[key]
+
+
+class SnapshotRelationship():
+    """
+    A copy of a Neo4j Contains relationship kept in a GraphSnapshot. It behaves like neo4j.graph.Relationship for what traversal_util uses (element_id, type, nodes, rel["key"] and dict(rel))
+
+    Attributes:
+    - element_id (str): The Neo4j element id of the relationship
+    - type (str): The relationship type, always "Contains"
+    - nodes (tuple[SnapshotNode, SnapshotNode]): The start and end nodes of the relationship
+    """
+    __slots__ = ("element_id", "type", "nodes", "_properties")
+
+    def __init__(self, element_id, type, start_node, end_node, properties):
+        self.element_id = element_id
+        self.type = type
+        self.nodes = (start_node, end_node)
+        self._properties = dict(properties)
+
+    @property
+    def start_node(self):
+        return self.nodes[0]
+
+    @property
+    def end_node(self):
+        return self.nodes[1]
+
+    def keys(self):
+        return self._properties.keys()
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+    def __getitem__(self, key):
+        return self._properties[key]
+
+
+class GraphSnapshot(GraphBackend):
+    """
+    In-memory snapshot of every Course, AND and OR node and every Contains relationship in the Neo4j database.
+    Trees can be built from the snapshot without going to Neo4j, Neo4j is only needed to (re)load it.
+
+    Attributes:
+    - version (int): Incremented every time the snapshot is (re)loaded (or set by load, e.g. to the same version in every worker), 0 if it was never loaded
+    - loaded_at (float): time.time() of the last (re)load, None if it was never loaded
+    - fingerprint (str): Hash of the content of the graph (see graph_fingerprint), None if it was never loaded.
+    Unlike version it is the same in every worker that loaded the same catalog, so it can be sent to clients (e.g. in ETags)
+
+    Notes:
+    - The graph is swapped in as a whole on reload, so a request that is reading the snapshot keeps seeing the old graph until it is done
+    """
+
+    def __init__(self):
+        # (nodes by element id, outgoing relationships by start node element id, element id by course code)
+        self._graph = ({}, {}, {})
+        self._lock = threading.Lock()
+        self.version = 0
+        self.loaded_at = None
+        self.fingerprint = None
+
+
+    @property
+    def loaded(self):
+        return self.version > 0
+
+
+    def load(self, session, version: int = None):
+        """
+        Load (or reload) the snapshot from the Neo4j database
+
+        Args:
+        - session (GraphDatabase.session): The Neo4j session object
+        - version (int): The version of the loaded snapshot, the next one if None
+        """
+        result = session.execute_read(run_snapshot_query)
+
+        nodes = {}
+        relationships = []
+        for record in result:
+            node = record["node"]
+            nodes[node.element_id] = SnapshotNode(node.element_id, node.labels, node)
+            relationships.extend(record["relationships"])
+
+        outgoing = {}
+        for rel in relationships:
+            start_id = rel.start_node.element_id
+            snapshot_rel = SnapshotRelationship(rel.element_id, rel.type, nodes[start_id], nodes[rel.end_node.element_id], rel)
+            outgoing.setdefault(start_id, []).append(snapshot_rel)
+
+        course_ids = {node["code"]: element_id for element_id, node in nodes.items() if "Course" in node.labels}
+
+        self.replace(nodes, outgoing, course_ids, version)
+
+
+    def reload(self, session, version: int = None):
+        """
+        Reload the snapshot from the Neo4j database, e.g. after the catalog changed. Same as load.
+
+        Args:
+        - session (GraphDatabase.session): The Neo4j session object
+        - version (int): The version of the reloaded snapshot, the next one if None
+        """
+        self.load(session, version)
+
+
+    def replace(self, nodes, outgoing, course_ids, version: int = None):
+        """
+        Swap in a new graph.
+
+        Args:
+        - nodes (dict[str, SnapshotNode]): Nodes by element id
+        - outgoing (dict[str, list[SnapshotRelationship]]): Outgoing Contains relationships by start node element id
+        - course_ids (dict[str, str]): Element ids of the Course nodes by course code
+        - version (int): The version of the new graph, the next one if None
+        """
+        fingerprint = graph_fingerprint(nodes, outgoing)
+        with self._lock:
+            self._graph = (nodes, outgoing, course_ids)
+            self.version = version if version is not None else self.version + 1
+            self.loaded_at = time.time()
+            self.fingerprint = fingerprint
+
+
+    def node_count(self):
+        return len(self._graph[0])
+
+
+    def subgraph(self, course_code: str, first_level: bool = False):
+        """
+        Find the subgraph reachable from a course, the same as the queries in traversal_util.
+
+        Args:
+        - course_code (str): The code of the course the subgraph starts from
+        - first_level (bool): Whether to only follow the relationships of the first level of the tree (rel.root == course_code), like run_apoc_query_first_level
+
+        Returns:
+        - tuple(list[SnapshotNode], list[SnapshotRelationship]): The nodes and relationships of the subgraph, None if the course is not in the snapshot
+        """
+        nodes, outgoing, course_ids = self._graph
+
+        start_id = course_ids.get(course_code)
+        if start_id is None:
+            return None
+
+        seen = {start_id}
+        subgraph_nodes = [nodes[start_id]]
+        subgraph_relationships = []
+        stack = [start_id]
+
+        while stack:
+            node_id = stack.pop()
+            for rel in outgoing.get(node_id, ()):
+                if first_level and rel.get("root") != course_code:
+                    continue
+                subgraph_relationships.append(rel)
+
+                end_id = rel.nodes[1].element_id
+                if end_id not in seen:
+                    seen.add(end_id)
+                    subgraph_nodes.append(rel.nodes[1])
+                    stack.append(end_id)
+
+        return subgraph_nodes, subgraph_relationships
+
+
+    def find_course(self, course_code: str):
+        nodes, outgoing, course_ids = self._graph
+
+        element_id = course_ids.get(course_code)
+        if element_id is None:
+            return None
+        return {
+            "code": course_code,
+            "full_name": nodes[element_id].get("full_name")
+        }
+
+
+def graph_fingerprint(nodes, outgoing) -> str:
+    """
+    Hash the content of a graph: the labels and properties of every node and the properties of every relationship
+
+    Args:
+    - nodes (dict[str, SnapshotNode]): Nodes by element id
+    - outgoing (dict[str, list[SnapshotRelationship]]): Outgoing Contains relationships by start node element id
+
+    Returns:
+    - str: The hex SHA-256 of the graph
+
+    Notes:
+    - The nodes and relationships are hashed in element id order, so the hash doesn't depend on the order the database returned them in
+    """
+    digest = hashlib.sha256()
+    for element_id in sorted(nodes):
+        node = nodes[element_id]
+        digest.update(repr((element_id, sorted(node.labels), sorted(node._properties.items()))).encode("utf-8"))
+        for rel in sorted(outgoing.get(element_id, ()), key=lambda rel: rel.element_id):
+            digest.update(repr((rel.element_id, rel.nodes[1].element_id, sorted(rel._properties.items()))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def run_snapshot_query(tx):
+    """
+    Run the query fetching every Course, AND and OR node with their outgoing Contains relationships.
+
+    Args:
+    - tx (GraphDatabase.transaction): The Neo4j transaction object
+
+    Returns:
+    - list: A list of records containing a node and its outgoing relationships
+    """
+    query = """
+    MATCH (node)
+    WHERE node:Course OR node:AND OR node:OR
+    OPTIONAL MATCH (node)-[rel:Contains]->(child)
+    WHERE child:Course OR child:AND OR child:OR
+    RETURN node, collect(rel) AS relationships
+    """
+    result = tx.run(query)
+    return [record for record in result]
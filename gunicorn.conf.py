@@ -0,0 +1,42 @@
+import os
+import glob
+
+# Loaded by gunicorn from the working directory. Aggregates the /metrics of every worker (PROMETHEUS_MULTIPROC_DIR) and warms the workers up
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server):
+    """
+    Remove the metric files of a previous run, so the counters start from 0
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """
+    Stop exporting the live gauges (e.g. the Neo4j pool connections) of a worker that exited
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """
+    Start warming the worker up (Neo4j connection and graph snapshot) as soon as it started, instead of on its first request
+    """
+    import app
+    app.start_warm_up()
+
+
+def on_exit(server):
+    """
+    Remove the file the workers shared their commands through (worker_commands.py), unless WORKER_COMMANDS_FILE chose it
+    """
+    from worker_commands import WORKER_COMMANDS_FILE, default_path
+    path = default_path(os.getpid())
+    if not WORKER_COMMANDS_FILE and os.path.exists(path):
+        os.remove(path)
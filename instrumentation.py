@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+# Time the phases of each request, sent back in a Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# PhaseTimer of the current request, None when timing is disabled or outside of a request
+_current_timer = ContextVar("current_timer", default=None)
+
+
+class PhaseTimer():
+    """
+    Durations of the phases of one request
+
+    Attributes:
+    - started_at (float): time.perf_counter() when the request started
+    - phases (dict[str, float]): Seconds spent in each phase, in the order the phases first ran. A phase that runs many times (e.g. once per tree) adds up
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+    def server_timing(self) -> str:
+        """
+        The phases as a Server-Timing header value, in milliseconds (e.g. "fetch;dur=1.20, mark;dur=0.31, total;dur=2.05")
+        """
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(entries)
+
+
+class _Phase():
+    """
+    Context manager adding the time spent in its block to a phase of a PhaseTimer
+    """
+    __slots__ = ("timer", "name", "started_at")
+
+    def __init__(self, timer: PhaseTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, time.perf_counter() - self.started_at)
+        return False
+
+
+class _NoPhase():
+    """
+    Context manager doing nothing, used when there is no PhaseTimer so disabled timing costs one ContextVar lookup
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name: str):
+    """
+    Time a block as a phase of the current request
+
+    Args:
+    - name (str): The name of the phase (a Server-Timing metric name, no spaces)
+
+    Returns:
+    - A context manager, e.g. with phase("fetch"): ...
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return _NO_PHASE
+    return _Phase(timer, name)
+
+
+class PhaseAggregates():
+    """
+    Per worker (process) totals of the phases of every timed request, by endpoint
+
+    Notes:
+    - Each worker process has its own aggregates, they are not shared between gunicorn workers
+    """
+
+    def __init__(self):
+        # endpoint -> phase -> [count, total seconds, max seconds]
+        self._phases = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+
+    def record(self, endpoint: str, timer: PhaseTimer):
+        phases = dict(timer.phases)
+        phases["total"] = timer.total()
+
+        with self._lock:
+            self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+            endpoint_phases = self._phases.setdefault(endpoint, {})
+            for name, seconds in phases.items():
+                aggregate = endpoint_phases.setdefault(name, [0, 0.0, 0.0])
+                aggregate[0] += 1
+                aggregate[1] += seconds
+                aggregate[2] = max(aggregate[2], seconds)
+
+
+    def stats(self) -> dict:
+        """
+        Get the aggregates
+
+        Returns:
+        - dict: ({endpoint: {requests: int, phases: {phase: {count: int, total_ms: float, mean_ms: float, max_ms: float}}}})
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": self._requests[endpoint],
+                    "phases": {
+                        name: {
+                            "count": count,
+                            "total_ms": total * 1000,
+                            "mean_ms": total / count * 1000,
+                            "max_ms": maximum * 1000
+                        }
+                        for name, (count, total, maximum) in endpoint_phases.items()
+                    }
+                }
+                for endpoint, endpoint_phases in self._phases.items()
+            }
+
+
+    def reset(self):
+        with self._lock:
+            self._phases.clear()
+            self._requests.clear()
+
+
+aggregates = PhaseAggregates()
+
+
+def start_request():
+    """
+    Start timing the phases of the current request, does nothing if SERVER_TIMING is disabled
+    """
+    if SERVER_TIMING:
+        _current_timer.set(PhaseTimer())
+
+
+def finish_request(endpoint: str):
+    """
+    Stop timing the current request and add its phases to the aggregates
+
+    Args:
+    - endpoint (str): The name the request is aggregated under (e.g. "POST coursequery")
+
+    Returns:
+    - str: The Server-Timing header value, None if the request was not timed
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return None
+    _current_timer.set(None)
+
+    aggregates.record(endpoint, timer)
+    return timer.server_timing()
+
+
+def finish_streamed_request(endpoint: str):
+    """
+    Same as finish_request for a streamed response, whose body is generated after the headers are sent:
+    the phases of the body keep being timed, and the request is added to the aggregates once the body is done (there is no Server-Timing header)
+
+    Args:
+    - endpoint (str): The name the request is aggregated under (e.g. "POST coursequery")
+
+    Returns:
+    - function: To call once the body is done (e.g. with response.call_on_close), None if the request was not timed
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return None
+
+    def finish():
+        if _current_timer.get() is timer:
+            _current_timer.set(None)
+        aggregates.record(endpoint, timer)
+    return finish
@@ -0,0 +1,100 @@
+import importlib
+import output
+from graph_snapshot import GraphSnapshot, SnapshotNode, SnapshotRelationship
+
+
+class LocalBackend(GraphSnapshot):
+    """
+    Graph backend built from the course definitions in output.py instead of the Neo4j database.
+    Used to run (and benchmark) the whole /course/ pipeline without a database, and as a fallback when Neo4j is unavailable.
+
+    Notes:
+    - Every course in output_codes is compiled from its *_pre definition into Course, AND and OR nodes (see compile_catalog)
+    """
+
+    def __init__(self, catalog=output):
+        super().__init__()
+        self.catalog = catalog
+        self.load_catalog(catalog)
+
+
+    def load_catalog(self, catalog):
+        """
+        Compile a catalog module (same format as output.py) and swap it in as the graph
+
+        Args:
+        - catalog (module): The catalog module
+        """
+        self.replace(*compile_catalog(catalog))
+
+
+    def reload(self, session=None):
+        """
+        Re-import output.py and recompile it. The session is not used, it is only accepted to have the same signature as GraphSnapshot.reload
+        """
+        self.catalog = importlib.reload(self.catalog)
+        self.load_catalog(self.catalog)
+
+
+def compile_catalog(catalog):
+    """
+    Compile the prerequisites in a catalog module (same format as output.py) into Course, AND and OR nodes.
+
+    Args:
+    - catalog (module): Module with a <code>_pre variable for every course (lowercase code), output_codes and output_titles_dict
+
+    Returns:
+    - tuple(dict, dict, dict): (nodes by element id, outgoing relationships by start node element id, element id by course code), the arguments of GraphSnapshot.replace
+
+    Notes:
+    - A list is an AND of its items, a tuple is an OR of its items, a string is a course code and a {"code": ..., "min_req": ...} dict is a course with a minimum grade
+    - The *_pre list of a course is the AND of its prerequisites. An AND or OR with only one item is left out, and its item is linked directly
+    - Course nodes are shared between every course that references them, AND and OR nodes belong to one course,
+    and every relationship has root set to the course whose prerequisites it is part of (like the Neo4j database)
+    - Corequisites (*_cor) are not compiled, they are not part of the prerequisite trees
+    - The min_req of a course is kept as a property of the relationship pointing to it
+    """
+    titles = getattr(catalog, "output_titles_dict", {})
+    nodes = {}
+    outgoing = {}
+    course_ids = {}
+    counter = {"index": 0, "rel": 0}
+
+    def course_node(code):
+        if code not in course_ids:
+            element_id = f"course:{code}"
+            nodes[element_id] = SnapshotNode(element_id, ["Course"], {"code": code, "full_name": titles.get(code, code)})
+            course_ids[code] = element_id
+        return nodes[course_ids[code]]
+
+    def link(start, end, root, properties=None):
+        counter["rel"] += 1
+        rel_properties = {"root": root}
+        if properties:
+            rel_properties.update(properties)
+        rel = SnapshotRelationship(f"rel:{counter['rel']}", "Contains", start, end, rel_properties)
+        outgoing.setdefault(start.element_id, []).append(rel)
+
+    def compile_requirement(parent, requirement, root):
+        if isinstance(requirement, str):
+            link(parent, course_node(requirement), root)
+        elif isinstance(requirement, dict):
+            link(parent, course_node(requirement["code"]), root, {"min_req": requirement.get("min_req")})
+        elif isinstance(requirement, (list, tuple)):
+            if len(requirement) == 1:
+                compile_requirement(parent, requirement[0], root)
+            elif requirement:
+                label = "AND" if isinstance(requirement, list) else "OR"
+                counter["index"] += 1
+                element_id = f"{label.lower()}:{counter['index']}"
+                junction = SnapshotNode(element_id, [label], {"index": counter["index"]})
+                nodes[element_id] = junction
+                link(parent, junction, root)
+                for item in requirement:
+                    compile_requirement(junction, item, root)
+
+    for code in getattr(catalog, "output_codes", []):
+        course = course_node(code)
+        compile_requirement(course, getattr(catalog, f"{code.lower()}_pre", []), code)
+
+    return nodes, outgoing, course_ids
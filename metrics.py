@@ -0,0 +1,138 @@
+import os
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+
+# Directory shared by the gunicorn workers, each worker writes its metrics to its own files in it (see gunicorn.conf.py).
+# Must be set in the environment before prometheus_client is imported, without it every worker only exports its own metrics
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+REQUEST_LATENCY = Histogram(
+    "course_api_request_duration_seconds",
+    "Time to answer a request",
+    ["endpoint", "method", "tree_choice", "status"]
+)
+TREE_NODES = Histogram(
+    "course_api_tree_nodes",
+    "Number of nodes of each tree answered",
+    ["tree_choice"],
+    buckets=(5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+COMMONALITY_COURSES = Histogram(
+    "course_api_commonality_courses",
+    "Number of desired courses given to the commonality algorithm",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30)
+)
+COMMONALITY_CODES = Histogram(
+    "course_api_commonality_course_codes",
+    "Total number of course codes (of every tree) given to the commonality algorithm",
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+NEO4J_QUERY_LATENCY = Histogram(
+    "course_api_neo4j_query_duration_seconds",
+    "Time of the Neo4j queries, including the round trip",
+    ["query"]
+)
+NEO4J_POOL_CONNECTIONS = Gauge(
+    "course_api_neo4j_pool_connections",
+    "Connections of the Neo4j driver pool, summed over the live workers",
+    ["state"],
+    multiprocess_mode="livesum"
+)
+CACHE_EVENTS = Counter(
+    "course_api_cache_events_total",
+    "Hits, misses and evictions of the caches",
+    ["cache", "event"]
+)
+
+
+def cache_event_hook(cache_name: str):
+    """
+    An on_event function for LRUCache, counting its events in CACHE_EVENTS
+
+    Args:
+    - cache_name (str): The cache label of the counters (e.g. "subgraph")
+
+    Returns:
+    - function: The on_event function
+    """
+    # Labelled once, so an event is only an increment
+    counters = {event: CACHE_EVENTS.labels(cache=cache_name, event=event) for event in ("hit", "miss", "eviction")}
+
+    def on_event(event):
+        counters[event].inc()
+
+    return on_event
+
+
+def observe_neo4j_query(query_name: str, seconds: float):
+    """
+    An on_query function for Neo4jBackend, observing the query durations in NEO4J_QUERY_LATENCY
+    """
+    NEO4J_QUERY_LATENCY.labels(query=query_name).observe(seconds)
+
+
+def pool_state(driver) -> dict:
+    """
+    Count the connections of the pool of a Neo4j driver
+
+    Args:
+    - driver (GraphDatabase.driver): The driver, None if there is no database (or no driver yet)
+
+    Returns:
+    - dict: ({in_use: int, idle: int, max: int}), max is None if it is not found. None if the pool is not found
+
+    Notes:
+    - The pool is not part of the public API of the driver, so its attributes are read defensively
+    """
+    pool = getattr(driver, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return None
+
+    in_use = 0
+    idle = 0
+    try:
+        # Copied, the pool is changed by other threads while we count
+        for address_connections in list(connections.values()):
+            for connection in list(address_connections):
+                if getattr(connection, "in_use", False):
+                    in_use += 1
+                else:
+                    idle += 1
+    except RuntimeError:
+        return None
+
+    max_size = getattr(getattr(pool, "pool_config", None), "max_connection_pool_size", None)
+    return {"in_use": in_use, "idle": idle, "max": max_size if isinstance(max_size, int) else None}
+
+
+def update_pool_gauges(driver):
+    """
+    Set the NEO4J_POOL_CONNECTIONS gauges from the connection pool of a Neo4j driver (see pool_state).
+    The gauges are left as they are if the pool is not found
+
+    Args:
+    - driver (GraphDatabase.driver): The driver, None if there is no database
+    """
+    state = pool_state(driver)
+    if state is None:
+        return
+
+    NEO4J_POOL_CONNECTIONS.labels(state="in_use").set(state["in_use"])
+    NEO4J_POOL_CONNECTIONS.labels(state="idle").set(state["idle"])
+    if state["max"] is not None:
+        NEO4J_POOL_CONNECTIONS.labels(state="max").set(state["max"])
+
+
+def generate_metrics():
+    """
+    The metrics in the Prometheus text format, aggregated over every worker when PROMETHEUS_MULTIPROC_DIR is set
+
+    Returns:
+    - tuple(bytes, str): The body and its content type
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,4 +1,5 @@
 import os
+import threading
 from dotenv import load_dotenv, dotenv_values
 load_dotenv()
 
@@ -7,27 +8,122 @@ from neo4j import GraphDatabase
 URI = os.getenv("N4J_DB_URI")
 AUTH = ("neo4j", os.getenv("N4J_DB_PASS"))
 
+# Connection pool of each worker (the defaults are the ones of the driver, except the connection timeout)
+N4J_MAX_CONNECTION_POOL_SIZE = int(os.getenv("N4J_MAX_CONNECTION_POOL_SIZE", "100"))
+# Seconds a query waits for a free connection of the pool before failing
+N4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv("N4J_CONNECTION_ACQUISITION_TIMEOUT", "60"))
+# Seconds after which a connection is closed instead of reused, keep it below the idle timeout of load balancers/firewalls in between
+N4J_MAX_CONNECTION_LIFETIME = float(os.getenv("N4J_MAX_CONNECTION_LIFETIME", "3600"))
+# Seconds to open a new connection, so an unreachable database fails the warm-up and /readyz quickly
+N4J_CONNECTION_TIMEOUT = float(os.getenv("N4J_CONNECTION_TIMEOUT", "5"))
+# Seconds a failed read transaction is retried for (e.g. while the database is unreachable) before the error reaches the request
+N4J_MAX_TRANSACTION_RETRY_TIME = float(os.getenv("N4J_MAX_TRANSACTION_RETRY_TIME", "30"))
+# Records fetched per round trip while a result is read, -1 fetches every record at once
+N4J_FETCH_SIZE = int(os.getenv("N4J_FETCH_SIZE", "1000"))
+
+
+def driver_config() -> dict:
+    """
+    The configuration of the Neo4j drivers (sync and async) from the N4J_* environment variables
+
+    Returns:
+    - dict: Keyword arguments of GraphDatabase.driver and AsyncGraphDatabase.driver
+    """
+    return {
+        "max_connection_pool_size": N4J_MAX_CONNECTION_POOL_SIZE,
+        "connection_acquisition_timeout": N4J_CONNECTION_ACQUISITION_TIMEOUT,
+        "max_connection_lifetime": N4J_MAX_CONNECTION_LIFETIME,
+        "connection_timeout": N4J_CONNECTION_TIMEOUT,
+        "max_transaction_retry_time": N4J_MAX_TRANSACTION_RETRY_TIME,
+        "fetch_size": N4J_FETCH_SIZE
+    }
+
 
 class Neo4jConn:
     """
     A class for creating the connection instance to the Neo4j database used in the Flask API
 
     Attributes:
-    - _driver (GraphDatabase.driver): The Neo4j driver instance
+    - connected (bool): Whether verify_connectivity succeeded in this process
+    - error (str): The error of the last failed verify_connectivity, None if it succeeded
 
+    Notes:
+    - The driver is created on first use, once per process. A worker forked from a process that already had a driver
+    (e.g. gunicorn --preload) creates its own, the sockets of the parent's pool are never shared between processes
     """
-    def __init__(self):
+    def __init__(self, lazy: bool = False):
         """
         Initialize the Neo4j connection instance
-        
+
+        Args:
+        - lazy (bool): Whether to wait for the first use to create the driver and connect, instead of connecting now
+
+        Raises:
+        - Exception: If the connection to the database fails (only when not lazy)
+        """
+        self._instance = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.connected = False
+        self.error = None
+        if not lazy:
+            self.verify_connectivity()
+
+    @property
+    def _driver(self):
+        """
+        The driver of this process (GraphDatabase.driver), created on first use
+        """
+        pid = os.getpid()
+        if self._instance is None or self._pid != pid:
+            with self._lock:
+                if self._instance is None or self._pid != pid:
+                    self._instance = GraphDatabase.driver(URI, auth=AUTH, **driver_config())
+                    self._pid = pid
+                    self.connected = False
+                    self.error = None
+        return self._instance
+
+    def driver_if_created(self):
+        """
+        The driver of this process, None if it wasn't created yet (to report its state without connecting)
+        """
+        return self._instance if self._pid == os.getpid() else None
+
+    def session(self, **config):
+        """
+        Open a session with the driver of this process, same as GraphDatabase.driver.session
+        """
+        return self._driver.session(**config)
+
+    def execute_query(self, query: str, *args, **kwargs):
+        """
+        Run a query with the driver of this process, same as GraphDatabase.driver.execute_query
+        """
+        return self._driver.execute_query(query, *args, **kwargs)
+
+    def verify_connectivity(self):
+        """
+        Connect to the database (opening the first connection of the pool), and set connected and error
+
         Raises:
         - Exception: If the connection to the database fails
         """
-        self._driver = GraphDatabase.driver(URI, auth=AUTH)
-        self._driver.verify_connectivity()
-    
+        try:
+            self._driver.verify_connectivity()
+        except Exception as e:
+            self.connected = False
+            self.error = str(e)
+            raise
+        self.connected = True
+        self.error = None
+
     def close(self):
         """
         Close the Neo4j connection instance. Generally never used, as the api should be hosted ongoing.
         """
-        self._driver.close()
\ No newline at end of file
+        driver = self.driver_if_created()
+        if driver is not None:
+            driver.close()
+            self._instance = None
+            self.connected = False
@@ -0,0 +1,91 @@
+import cProfile
+import hmac
+import os
+import random
+import threading
+import time
+
+# Directory the pstats files are written to, profiling is disabled if it is not set
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+# Fraction of the requests to profile without the X-Profile header (e.g. 0.001)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Value the X-Profile header must have, the header is ignored if it is not set (only sampled requests are profiled)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+
+# Only one profiler can be active at a time in a process, requests arriving while another one is profiled are not profiled
+_profile_lock = threading.Lock()
+_counter = {"profiles": 0}
+
+
+class RequestProfile():
+    """
+    A cProfile profiler running for one request
+
+    Attributes:
+    - profiler (cProfile.Profile): The profiler
+    - name (str): The name of the request, used in the file name (e.g. "POST-coursequery")
+    - file_name (str): The name of the pstats file in PROFILE_DIR, known from the start so it can be sent before a streamed body is profiled
+    """
+
+    def __init__(self, name: str):
+        self.profiler = cProfile.Profile()
+        self.name = name
+        _counter["profiles"] += 1
+        self.file_name = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{_counter['profiles']}.pstats"
+
+
+    def stop(self) -> str:
+        """
+        Stop profiling and write the stats to PROFILE_DIR
+
+        Returns:
+        - str: The path of the pstats file (read it with pstats.Stats(path) or snakeviz)
+        """
+        try:
+            self.profiler.disable()
+            path = os.path.join(PROFILE_DIR, self.file_name)
+            self.profiler.dump_stats(path)
+            return path
+        finally:
+            _profile_lock.release()
+
+
+def should_profile(profile_header: str) -> bool:
+    """
+    Whether to profile a request, from its X-Profile header and PROFILE_SAMPLE_RATE
+
+    Args:
+    - profile_header (str): The value of the X-Profile header, None if the request doesn't have one
+    """
+    if not PROFILE_DIR:
+        return False
+    if profile_header is not None and PROFILE_TOKEN:
+        return hmac.compare_digest(profile_header.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile(name: str):
+    """
+    Start profiling the current request
+
+    Args:
+    - name (str): The name of the request, used in the file name
+
+    Returns:
+    - RequestProfile: The running profile, None if another request of this process is being profiled
+
+    Notes:
+    - Everything that runs while the profile is active is included: the tree building and marking in traversal_util, the waits on the Neo4j driver and the JSON encoding.
+    Since Python 3.12 the profiler sees every thread, so requests handled at the same time by the same worker can show up in the profile too
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile = RequestProfile(name)
+        profile.profiler.enable()
+    except Exception:
+        _profile_lock.release()
+        raise
+    return profile
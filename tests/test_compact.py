@@ -0,0 +1,64 @@
+import unittest
+from compact import CompactTrees
+from flat_tree import FlatTree
+from traversal_util import CourseNode
+
+
+def tree_with_and(root_code: str, child_codes: list[str], index: int) -> FlatTree:
+    """
+    A course whose only child is an AND node (with the given index) of the child courses
+    """
+    root = CourseNode(label="Course", code=root_code, full_name=f"{root_code}: Course")
+    junction = CourseNode(label="AND", index=index)
+    for code in child_codes:
+        junction.add_child(CourseNode(label="Course", code=code, full_name=f"{code}: Course"))
+    root.add_child(junction)
+    return FlatTree.from_course_node(root)
+
+
+def tree_children(compact: dict, tree_position: int) -> dict:
+    """
+    The children of every node of one tree of the compact format, as {node: [child nodes]}
+    """
+    children = {}
+    for parent, child in compact["course_trees"][tree_position]["edges"]:
+        children.setdefault(parent, []).append(child)
+    return children
+
+
+class CompactTreesTest(unittest.TestCase):
+
+    def test_junctions_with_the_same_index_stay_apart(self):
+        first = tree_with_and("AAA100", ["BBB100", "CCC100"], index=0)
+        second = tree_with_and("DDD100", ["EEE100"], index=0)
+
+        compact_trees = CompactTrees()
+        compact_trees.add_tree("AAA100", first, first.mark_completion([]))
+        compact_trees.add_tree("DDD100", second, second.mark_completion([]))
+        compact = compact_trees.to_dict()
+
+        nodes = compact["nodes"]
+        junctions = []
+        for position, tree in enumerate(compact["course_trees"]):
+            [junction] = tree_children(compact, position)[tree["root"]]
+            junctions.append(junction)
+            child_codes = [nodes[child][1] for child in tree_children(compact, position)[junction]]
+            self.assertEqual(child_codes, ["BBB100", "CCC100"] if position == 0 else ["EEE100"])
+
+        self.assertNotEqual(junctions[0], junctions[1])
+        self.assertEqual([nodes[junction][:2] for junction in junctions], [[1, 0], [1, 0]])
+
+    def test_shared_course_is_sent_once(self):
+        first = tree_with_and("AAA100", ["BBB100"], index=0)
+        second = tree_with_and("CCC100", ["BBB100"], index=1)
+
+        compact_trees = CompactTrees()
+        compact_trees.add_tree("AAA100", first, first.mark_completion([]))
+        compact_trees.add_tree("CCC100", second, second.mark_completion([]))
+
+        codes = [node[1] for node in compact_trees.nodes if node[0] == 0]
+        self.assertEqual(codes.count("BBB100"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,31 @@
-import itertools
+import logging
+from enum import IntEnum
+from instrumentation import phase
+
+logger = logging.getLogger(__name__)
+
+
+class NodeKind(IntEnum):
+    """
+    The three types of nodes in a course tree, stored as small ints instead of label strings
+    """
+    COURSE = 0
+    AND = 1
+    OR = 2
+
+
+# Label string of each NodeKind, and the other way around
+KIND_LABELS = ("Course", "AND", "OR")
+LABEL_KINDS = {"Course": NodeKind.COURSE, "AND": NodeKind.AND, "OR": NodeKind.OR}
+
 
 class CourseNode():
     """
     CourseNode class represents a node in a course tree. Three types of nodes: Course, AND, OR
 
     Attributes:
-    - label (str): "AND", "OR", or "Course"
+    - kind (NodeKind): NodeKind.COURSE, NodeKind.AND or NodeKind.OR
+    - label (str): "AND", "OR", or "Course" (read only, derived from kind)
     - code (str): course code if label is "Course", otherwise None
     - full_name (str): full name of the course if label is "Course", otherwise None
     - index (int): index of the node if label is "AND" or "OR", otherwise None
@@ -14,7 +34,10 @@ class CourseNode():
     - ready_to_take (bool): whether the course node is ready to be taken
     - children (list): list of child nodes
 
+    Notes:
+    - Uses __slots__, as a request can create thousands of nodes for deep trees
     """
+    __slots__ = ("kind", "code", "full_name", "index", "marked", "completed", "ready_to_take", "children")
 
     def __init__(self, label, code=None, full_name=None, index=None):
         """
@@ -33,21 +56,15 @@ class CourseNode():
         - ready_to_take will only ever be true for a Course node, never for AND or OR nodes
         - children is initialized to an empty list.
         """
-        if label == "OR":
-            self.label = "OR"
-            self.index = index
-            self.code = None
-            self.full_name = None
-        elif label == "AND":
-            self.label = "AND"
-            self.index = index
-            self.code = None
-            self.full_name = None
-        elif label == "Course":
-            self.label = "Course"
+        self.kind = LABEL_KINDS[label]
+        if self.kind is NodeKind.COURSE:
             self.code = code
             self.full_name = full_name
             self.index = None
+        else:
+            self.index = index
+            self.code = None
+            self.full_name = None
 
         self.marked = False
         self.completed = False
@@ -55,6 +72,11 @@ class CourseNode():
         self.children = []
 
 
+    @property
+    def label(self):
+        return KIND_LABELS[self.kind]
+
+
     def add_child(self, child):
         """
         Add a child node to the current node.
@@ -65,27 +87,46 @@ class CourseNode():
         self.children.append(child)
 
 
-"""
-Temporary global variables to store CourseNodes
+class CourseNotFound(LookupError):
+    """
+    Raised when a requested course is not in the graph the trees are built from (the API answers it with 404, any other error is a 500)
 
-Technically, these dictionaries will not have any redundancy errors. This is because every time nodes are added in any function, they replace the previous nodes.
-This is a quick solution to storing the CourseNodes in a dictionary on a hosted API environment, as they only need to be stored in each execution of the function.
+    Attributes:
+    - course_code (str): The code of the course
+    """
 
-"""
-dict_course = {}
-dict_AND = {}
-dict_OR = {}
+    def __init__(self, course_code: str):
+        super().__init__(course_code)
+        self.course_code = course_code
 
-dict_neo4j_all = {}
 
+class TreeBuildContext():
+    """
+    Bookkeeping of the CourseNodes created while building a tree. Every build gets its own context (instead of sharing module-level dictionaries),
+    so building trees is reentrant and thread safe, and the nodes are freed together with the tree once a request is done.
 
-def create_full_tree_from_apoc(session, course_I_want: str):
+    Attributes:
+    - dict_course (dict[str, CourseNode]): Course nodes by course code
+    - dict_AND (dict[int, CourseNode]): AND nodes by index
+    - dict_OR (dict[int, CourseNode]): OR nodes by index
+    - dict_neo4j_all (dict[str, CourseNode]): Every node by Neo4j element id
     """
-    Create a full tree from the Neo4j database using the APOC library.
+
+    def __init__(self):
+        self.dict_course = {}
+        self.dict_AND = {}
+        self.dict_OR = {}
+        self.dict_neo4j_all = {}
+
+
+def create_full_tree_from_apoc(backend, course_I_want: str, context: TreeBuildContext = None):
+    """
+    Create a full tree from the subgraph returned by a graph backend (e.g. the Neo4j database using the APOC library).
 
     Args:
-    - session (GraphDatabase.session): The Neo4j session object
+    - backend (GraphBackend): The backend to get the subgraph from (Neo4jBackend, GraphSnapshot, LocalBackend, ...)
     - course_I_want (str): The code of the course for which the tree is to be created
+    - context (TreeBuildContext): The context to store the created nodes in, a new one is used if not given
 
     Returns:
     - CourseNode: The root node of the created tree
@@ -94,78 +135,225 @@ def create_full_tree_from_apoc(session, course_I_want: str):
     - This function will create a full tree from the Neo4j database using the APOC traversal library.
     
     """
-    result = session.execute_read(run_apoc_query, course_I_want)
-
-    # Parse the apoc query result into nodes and relationships
-    for record in result:
-                nodes = record["nodes"]
-                relationships = record["relationships"]
-
-                parsed_nodes = [parse_node(node) for node in nodes]
-                parsed_relationships = [parse_relationship(rel) for rel in relationships]
-                
-                for node in parsed_nodes:
-                    # print(f"  ID: {node['id']}")
-                    # print(f"  Labels: {', '.join(node['labels'])}")
-                    # print(f"  Properties: {node['properties']}")
-                    # print()
-
-                    # Operations
-                    neo4j_id = node["id"]
-                    node_label = node["labels"][0]
-                    node_properties = node["properties"]
-                    
-                    if node_label == "Course":
-                        code = node_properties["code"]
-                        full_name = node_properties["full_name"]
-                        course_node = CourseNode(
-                            label="Course",
-                            code=code,
-                            full_name=full_name,
-                            index=None
-                        )
-                        dict_course[code] = course_node
-                        dict_neo4j_all[neo4j_id] = course_node
-                    elif node_label == "AND":
-                        index = node_properties["index"]
-                        and_node = CourseNode(
-                            label="AND",
-                            code=None,
-                            full_name=None,
-                            index=index
-                        )
-                        dict_AND[index] = and_node
-                        dict_neo4j_all[neo4j_id] = and_node
-                    elif node_label == "OR":
-                        index = node_properties["index"]
-                        or_node = CourseNode(
-                            label="OR",
-                            code=None,
-                            full_name=None,
-                            index=index
-                        )
-                        dict_OR[index] = or_node
-                        dict_neo4j_all[neo4j_id] = or_node
-
-
-                for rel in parsed_relationships:
-                    # print(f"  ID: {rel['id']}")
-                    # print(f"  Type: {rel['type']}")
-                    # print(f"  Start Node: {rel['start_node']}")
-                    # print(f"  End Node: {rel['end_node']}")
-                    # print(f"  Properties: {rel['properties']}")
-                    # print()
-
-                    # Operations
-                    start_node_neo4j_id = rel["start_node"]
-                    end_node_neo4j_id = rel["end_node"]
-
-                    start_node_obj = dict_neo4j_all[start_node_neo4j_id]
-                    end_node_obj = dict_neo4j_all[end_node_neo4j_id]
-
-                    start_node_obj.add_child(end_node_obj)
-
-    return dict_course[course_I_want]
+    if context is None:
+        context = TreeBuildContext()
+
+    subgraph = backend.subgraph(course_I_want)
+    if subgraph is None:
+        raise CourseNotFound(course_I_want)
+
+    # Parse the subgraph into nodes and relationships
+    build_subgraph(subgraph, context)
+
+    return context.dict_course[course_I_want]
+
+
+def create_trees_from_apoc(backend, courses_I_want: list[str], tree_choice: str = "full") -> list[CourseNode]:
+    """
+    Create the trees of many courses with a single call to the graph backend (e.g. a single batched APOC query).
+
+    Args:
+    - backend (GraphBackend): The backend to get the subgraphs from (Neo4jBackend, GraphSnapshot, LocalBackend, ...)
+    - courses_I_want (list[str]): The codes of the courses for which the trees are to be created
+    - tree_choice (str): "full" for full trees, anything else for prerequisite (first level) trees
+
+    Returns:
+    - list[CourseNode]: The root nodes of the created trees, in the same order as courses_I_want
+
+    Notes:
+    - With Neo4jBackend, only one round trip is made no matter how many courses are requested. The query returns the union subgraph of every course, 
+    with each root tagged with the ids of its own nodes and relationships, and every tree is then built from that one result.
+    - Each tree is built from its own nodes in its own TreeBuildContext, the same way create_full_tree_from_apoc and create_prerequisite_tree_from_apoc would.
+    - Raises CourseNotFound if one of the courses doesn't exist.
+    """
+    if not courses_I_want:
+        return []
+
+    unique_courses = list(dict.fromkeys(courses_I_want))
+    with phase("fetch"):
+        subgraphs = backend.subgraphs(unique_courses, tree_choice != "full")
+
+    return trees_from_subgraphs(subgraphs, courses_I_want)
+
+
+async def create_trees_from_apoc_async(backend, courses_I_want: list[str], tree_choice: str = "full") -> list[CourseNode]:
+    """
+    Same as create_trees_from_apoc, with a backend whose subgraphs method is a coroutine (AsyncNeo4jBackend)
+
+    Args:
+    - backend (AsyncNeo4jBackend): The backend to get the subgraphs from
+    - courses_I_want (list[str]): The codes of the courses for which the trees are to be created
+    - tree_choice (str): "full" for full trees, anything else for prerequisite (first level) trees
+
+    Returns:
+    - list[CourseNode]: The root nodes of the created trees, in the same order as courses_I_want
+
+    Notes:
+    - Only the fetch is awaited, the trees are built the same way as create_trees_from_apoc once every subgraph arrived
+    - Raises CourseNotFound if one of the courses doesn't exist.
+    """
+    if not courses_I_want:
+        return []
+
+    unique_courses = list(dict.fromkeys(courses_I_want))
+    with phase("fetch"):
+        subgraphs = await backend.subgraphs(unique_courses, tree_choice != "full")
+
+    return trees_from_subgraphs(subgraphs, courses_I_want)
+
+
+def trees_from_subgraphs(subgraphs: dict, courses_I_want: list[str]) -> list[CourseNode]:
+    """
+    Build the trees of many courses from their subgraphs, each in its own TreeBuildContext
+
+    Args:
+    - subgraphs (dict[str, tuple(list, list)]): The subgraph of each course (GraphBackend.subgraphs)
+    - courses_I_want (list[str]): The codes of the courses, every one of them must be in subgraphs
+
+    Returns:
+    - list[CourseNode]: The root nodes of the created trees, in the same order as courses_I_want
+
+    Notes:
+    - Raises CourseNotFound if one of the courses is not in subgraphs (the backends leave out the courses that don't exist)
+    """
+    for course in courses_I_want:
+        if course not in subgraphs:
+            raise CourseNotFound(course)
+
+    roots = {}
+    with phase("build"):
+        for course, subgraph in subgraphs.items():
+            context = TreeBuildContext()
+            build_subgraph(subgraph, context)
+            roots[course] = context.dict_course[course]
+
+    return [roots[course] for course in courses_I_want]
+
+
+class LeanSubgraph(tuple):
+    """
+    A (nodes, relationships) subgraph in the lean format of run_lean_query: [element_id, kind, code, index] lists for the nodes (kind is the NodeKind int)
+    and [start element_id, end element_id] lists for the relationships, instead of driver Node and Relationship objects
+
+    Attributes:
+    - titles (dict[str, str]): Full name by course code, for the course nodes (shared by every subgraph of a backend, not sent with each node)
+    """
+
+    def __new__(cls, nodes: list, relationships: list, titles: dict):
+        subgraph = super().__new__(cls, (nodes, relationships))
+        subgraph.titles = titles
+        return subgraph
+
+
+def build_subgraph(subgraph, context: TreeBuildContext):
+    """
+    Create the CourseNodes of a subgraph returned by a graph backend, with the builder of its format
+
+    Args:
+    - subgraph (tuple(list, list) or LeanSubgraph): The nodes and relationships of the subgraph
+    - context (TreeBuildContext): The context to store the created nodes in
+    """
+    if isinstance(subgraph, LeanSubgraph):
+        add_lean_result_to_dicts(*subgraph, subgraph.titles, context)
+    else:
+        add_apoc_result_to_dicts(*subgraph, context)
+
+
+def add_lean_result_to_dicts(nodes: list, relationships: list, titles: dict, context: TreeBuildContext):
+    """
+    Same as add_apoc_result_to_dicts for a subgraph in the lean format (LeanSubgraph)
+
+    Args:
+    - nodes (list[list]): [element_id, kind, code, index] for each node
+    - relationships (list[list]): [start element_id, end element_id] for each relationship
+    - titles (dict[str, str]): Full name by course code
+    - context (TreeBuildContext): The context to store the created nodes in
+    """
+    dict_course = context.dict_course
+    dict_neo4j_all = context.dict_neo4j_all
+
+    for element_id, kind, code, index in nodes:
+        if kind == NodeKind.COURSE:
+            node = dict_course[code] = CourseNode("Course", code=code, full_name=titles.get(code, code))
+        elif kind == NodeKind.AND:
+            node = context.dict_AND[index] = CourseNode("AND", index=index)
+        else:
+            node = context.dict_OR[index] = CourseNode("OR", index=index)
+        dict_neo4j_all[element_id] = node
+
+    for start_id, end_id in relationships:
+        dict_neo4j_all[start_id].children.append(dict_neo4j_all[end_id])
+
+
+def add_apoc_result_to_dicts(nodes, relationships, context: TreeBuildContext):
+    """
+    Create CourseNodes for the given APOC nodes, and link them together with the given APOC relationships.
+    The one tree builder, used for full and prerequisite trees, and for every backend.
+
+    Args:
+    - nodes (list[neo4j.graph.Node]): The nodes returned by an APOC query
+    - relationships (list[neo4j.graph.Relationship]): The relationships returned by an APOC query
+    - context (TreeBuildContext): The context to store the created nodes in
+
+    Notes:
+    - The created nodes are stored in context.dict_course, context.dict_AND, context.dict_OR and context.dict_neo4j_all
+    - The nodes and relationships are read as they come from the driver (element ids, labels and the code, full_name or index property only),
+    without copying them into dicts first (parse_node, parse_relationship), so the CourseNode is the only object created per node
+    """
+    dict_course = context.dict_course
+    dict_AND = context.dict_AND
+    dict_OR = context.dict_OR
+    dict_neo4j_all = context.dict_neo4j_all
+    # Checked once, so nothing is formatted per node unless DEBUG is enabled
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for node in nodes:
+        if debug:
+            logger.debug("Node id=%s labels=%s properties=%s", node.element_id, ", ".join(node.labels), dict(node))
+
+        labels = node.labels
+        if "Course" in labels:
+            code = node["code"]
+            course_node = dict_course[code] = CourseNode("Course", code=code, full_name=node["full_name"])
+            dict_neo4j_all[node.element_id] = course_node
+        elif "AND" in labels:
+            index = node["index"]
+            and_node = dict_AND[index] = CourseNode("AND", index=index)
+            dict_neo4j_all[node.element_id] = and_node
+        elif "OR" in labels:
+            index = node["index"]
+            or_node = dict_OR[index] = CourseNode("OR", index=index)
+            dict_neo4j_all[node.element_id] = or_node
+
+    for rel in relationships:
+        start_node, end_node = rel.nodes
+        if debug:
+            logger.debug(
+                "Relationship id=%s type=%s start_node=%s end_node=%s properties=%s",
+                rel.element_id, rel.type, start_node.element_id, end_node.element_id, dict(rel)
+            )
+
+        dict_neo4j_all[start_node.element_id].children.append(dict_neo4j_all[end_node.element_id])
+
+
+# Subgraph of a course (run_apoc_query)
+APOC_QUERY = """
+MATCH (start:Course {code: $course_code})
+CALL apoc.path.subgraphAll(start, {
+    relationshipFilter: "Contains>",
+    labelFilter: "+Course|AND|OR"
+})
+YIELD nodes, relationships
+RETURN nodes, relationships
+"""
+
+# First level of the subgraph of a course (run_apoc_query_first_level)
+FIRST_LEVEL_QUERY = """
+MATCH (start:Course {code: $course_code})
+OPTIONAL MATCH path = (start)-[:Contains* {root: $course_code}]->()
+WITH start, collect(last(relationships(path))) AS relationships, collect(DISTINCT last(nodes(path))) AS nodes
+RETURN [start] + [node IN nodes WHERE node <> start] AS nodes, relationships
+"""
 
 
 def run_apoc_query(tx, course_code: str):
@@ -180,22 +368,14 @@ def run_apoc_query(tx, course_code: str):
     - list: A list of records containing the nodes and relationships of the tree
     
     """
-    query = """
-    MATCH (start:Course {code: $course_code})
-    CALL apoc.path.subgraphAll(start, {
-        relationshipFilter: "Contains>",
-        labelFilter: "+Course|AND|OR"
-    })
-    YIELD nodes, relationships
-    RETURN nodes, relationships
-    """
-    result = tx.run(query, course_code=course_code)
+    result = tx.run(APOC_QUERY, course_code=course_code)
     return [record for record in result]
 
 
 def run_apoc_query_first_level(tx, course_code: str):
     """
-    Run the APOC query to get the first level of the tree from the Neo4j database.
+    Run the query to get the first level of the tree (the prerequisite tree) from the Neo4j database.
+    Only the Contains relationships with root = course_code are followed, so only the nodes of the course's own requirements are returned.
 
     Args:
     - tx (GraphDatabase.transaction): The Neo4j transaction object (Which can be obtained by using session.run(func_name, ...params...) or session.execute_read(...) or session.execute_write(...))
@@ -204,24 +384,146 @@ def run_apoc_query_first_level(tx, course_code: str):
     Returns:
     - list: A list of records containing the nodes and relationships of the tree
 
+    Notes:
+    - The last relationship and node of each path are the ones the path adds, so every relationship is returned once
+    (the requirements of a course are a tree of its own AND and OR nodes)
+
+    """
+    result = tx.run(FIRST_LEVEL_QUERY, course_code=course_code)
+    return [record for record in result]
+
+
+async def run_subgraph_query_async(tx, course_code: str, first_level: bool = False):
+    """
+    Run the query of run_apoc_query (or of run_apoc_query_first_level) in an async transaction.
+
+    Args:
+    - tx (AsyncManagedTransaction): The async Neo4j transaction object (AsyncSession.execute_read)
+    - course_code (str): The code of the course for which the tree is to be created from
+    - first_level (bool): Whether to only fetch the first level of the tree
+
+    Returns:
+    - list: A list of records containing the nodes and relationships of the tree
     """
-    query = """
-    MATCH (start:Course {code: $course_code})
+    result = await tx.run(FIRST_LEVEL_QUERY if first_level else APOC_QUERY, course_code=course_code)
+    return [record async for record in result]
+
+
+# Subgraph (or first level of the subgraph) of each course_code of an UNWIND, from its start node (run_apoc_query_batch, run_lean_query)
+UNWOUND_SUBGRAPH = """
     CALL apoc.path.subgraphAll(start, {
         relationshipFilter: "Contains>",
         labelFilter: "+Course|AND|OR"
     })
     YIELD nodes, relationships
-    WITH nodes, [rel IN relationships WHERE type(rel) = 'Contains' AND rel.root = $course_code] AS filtered_relationships
-    RETURN nodes, filtered_relationships AS relationships
+"""
+UNWOUND_FIRST_LEVEL_SUBGRAPH = """
+    OPTIONAL MATCH path = (start)-[:Contains* {root: course_code}]->()
+    WITH course_code, start, collect(last(relationships(path))) AS relationships, collect(DISTINCT last(nodes(path))) AS nodes
+    WITH course_code, [start] + [node IN nodes WHERE node <> start] AS nodes, relationships
+"""
+
+
+def run_apoc_query_batch(tx, course_codes: list[str], first_level: bool = False):
     """
-    result = tx.run(query, course_code=course_code)
+    Run the APOC query for many courses at once, returning the union of their subgraphs.
+
+    Args:
+    - tx (GraphDatabase.transaction): The Neo4j transaction object (Which can be obtained by using session.run(func_name, ...params...) or session.execute_read(...) or session.execute_write(...))
+    - course_codes (list[str]): The codes of the courses for which the trees are to be created from
+    - first_level (bool): Whether to only fetch the first level of each tree (like run_apoc_query_first_level)
+
+    Returns:
+    - list: A list with one record, containing the union of nodes and relationships of every tree, and the roots 
+    (a list of {root, node_ids, relationship_ids} maps tagging which nodes and relationships belong to each course)
+
+    """
+    query = f"""
+    UNWIND $course_codes AS course_code
+    MATCH (start:Course {{code: course_code}})
+    {UNWOUND_FIRST_LEVEL_SUBGRAPH if first_level else UNWOUND_SUBGRAPH}
+    WITH collect({{
+        root: course_code,
+        node_ids: [node IN nodes | elementId(node)],
+        relationship_ids: [rel IN relationships | elementId(rel)]
+    }}) AS roots, collect(nodes) AS node_lists, collect(relationships) AS relationship_lists
+    RETURN roots, apoc.coll.toSet(apoc.coll.flatten(node_lists)) AS nodes, apoc.coll.toSet(apoc.coll.flatten(relationship_lists)) AS relationships
+    """
+    result = tx.run(query, course_codes=course_codes)
     return [record for record in result]
 
 
+def run_lean_query(tx, course_codes: list[str], first_level: bool = False):
+    """
+    Run the query of run_apoc_query (or run_apoc_query_first_level) for many courses, projecting the nodes and relationships to small lists in Cypher.
+    Only what the tree builder needs is sent, and the driver doesn't hydrate Node and Relationship objects with every property.
+
+    Args:
+    - tx (GraphDatabase.transaction): The Neo4j transaction object
+    - course_codes (list[str]): The codes of the courses for which the trees are to be created from
+    - first_level (bool): Whether to only fetch the first level of each tree
+
+    Returns:
+    - list: One record per course that exists, with course_code, nodes ([element_id, kind, code, index] lists, kind is the NodeKind int)
+    and relationships ([start element_id, end element_id] lists)
+
+    Notes:
+    - The full names of the courses are not sent, see run_titles_query
+    """
+    result = tx.run(lean_query(first_level), course_codes=course_codes)
+    return [record for record in result]
+
+
+async def run_lean_query_async(tx, course_codes: list[str], first_level: bool = False):
+    """
+    Same as run_lean_query in an async transaction (AsyncSession.execute_read)
+    """
+    result = await tx.run(lean_query(first_level), course_codes=course_codes)
+    return [record async for record in result]
+
+
+def lean_query(first_level: bool) -> str:
+    """
+    The Cypher query of run_lean_query
+    """
+    return f"""
+    UNWIND $course_codes AS course_code
+    MATCH (start:Course {{code: course_code}})
+    {UNWOUND_FIRST_LEVEL_SUBGRAPH if first_level else UNWOUND_SUBGRAPH}
+    RETURN course_code,
+        [node IN nodes | [elementId(node), CASE WHEN node:Course THEN 0 WHEN node:AND THEN 1 ELSE 2 END, node.code, node.index]] AS nodes,
+        [rel IN relationships | [elementId(startNode(rel)), elementId(endNode(rel))]] AS relationships
+    """
+
+
+TITLES_QUERY = "MATCH (c:Course) RETURN c.code AS code, c.full_name AS full_name"
+
+
+def run_titles_query(tx) -> dict:
+    """
+    Get the full name of every course, for the course nodes of run_lean_query
+
+    Args:
+    - tx (GraphDatabase.transaction): The Neo4j transaction object
+
+    Returns:
+    - dict[str, str]: Full name by course code
+    """
+    result = tx.run(TITLES_QUERY)
+    return {record["code"]: record["full_name"] for record in result}
+
+
+async def run_titles_query_async(tx) -> dict:
+    """
+    Same as run_titles_query in an async transaction (AsyncSession.execute_read)
+    """
+    result = await tx.run(TITLES_QUERY)
+    return {record["code"]: record["full_name"] async for record in result}
+
+
 def parse_node(node):
     """
-    Parse the node from Neo4j return format into a dictionary
+    Parse the node from Neo4j return format into a dictionary (with a copy of every property, the tree builder reads the nodes directly instead)
 
     """
     return {
@@ -233,7 +535,7 @@ def parse_node(node):
 
 def parse_relationship(rel):
     """
-    Parse the relationship from Neo4j return format into a dictionary
+    Parse the relationship from Neo4j return format into a dictionary (with a copy of every property, the tree builder reads the relationships directly instead)
 
     """
     return {
@@ -245,13 +547,14 @@ def parse_relationship(rel):
     }
 
 
-def create_prerequisite_tree_from_apoc(session, course_I_want: str):
+def create_prerequisite_tree_from_apoc(backend, course_I_want: str, context: TreeBuildContext = None):
     """
-    Create a prerequisite tree from the Neo4j database using the APOC library.
+    Create a prerequisite tree from the subgraph returned by a graph backend (e.g. the Neo4j database using the APOC library).
 
     Args:
-    - session (GraphDatabase.session): The Neo4j session object
+    - backend (GraphBackend): The backend to get the subgraph from (Neo4jBackend, GraphSnapshot, LocalBackend, ...)
     - course_I_want (str): The code of the course for which the tree is to be created
+    - context (TreeBuildContext): The context to store the created nodes in, a new one is used if not given
 
     Returns:
     - CourseNode: The root node of the created tree
@@ -260,79 +563,17 @@ def create_prerequisite_tree_from_apoc(session, course_I_want: str):
     - This function will create a prerequisite tree from the Neo4j database using the APOC traversal library.
     
     """
-    result = session.execute_read(run_apoc_query_first_level, course_I_want)
-
-    for record in result:
-                nodes = record["nodes"]
-                relationships = record["relationships"]
-
-                parsed_nodes = [parse_node(node) for node in nodes]
-                parsed_relationships = [parse_relationship(rel) for rel in relationships]
-                
-                
-                print("Nodes:")
-                for node in parsed_nodes:
-                    print(f"  ID: {node['id']}")
-                    print(f"  Labels: {', '.join(node['labels'])}")
-                    print(f"  Properties: {node['properties']}")
-                    print()
-
-                    # Operations
-                    neo4j_id = node["id"]
-                    node_label = node["labels"][0]
-                    node_properties = node["properties"]
-                    
-                    if node_label == "Course":
-                        code = node_properties["code"]
-                        full_name = node_properties["full_name"]
-                        course_node = CourseNode(
-                            label="Course",
-                            code=code,
-                            full_name=full_name,
-                            index=None
-                        )
-                        dict_course[code] = course_node
-                        dict_neo4j_all[neo4j_id] = course_node
-                    elif node_label == "AND":
-                        index = node_properties["index"]
-                        and_node = CourseNode(
-                            label="AND",
-                            code=None,
-                            full_name=None,
-                            index=index
-                        )
-                        dict_AND[index] = and_node
-                        dict_neo4j_all[neo4j_id] = and_node
-                    elif node_label == "OR":
-                        index = node_properties["index"]
-                        or_node = CourseNode(
-                            label="OR",
-                            code=None,
-                            full_name=None,
-                            index=index
-                        )
-                        dict_OR[index] = or_node
-                        dict_neo4j_all[neo4j_id] = or_node
-
-                print("Relationships:")
-                for rel in parsed_relationships:
-                    print(f"  ID: {rel['id']}")
-                    print(f"  Type: {rel['type']}")
-                    print(f"  Start Node: {rel['start_node']}")
-                    print(f"  End Node: {rel['end_node']}")
-                    print(f"  Properties: {rel['properties']}")
-                    print()
-
-                    # Operations
-                    start_node_neo4j_id = rel["start_node"]
-                    end_node_neo4j_id = rel["end_node"]
-
-                    start_node_obj = dict_neo4j_all[start_node_neo4j_id]
-                    end_node_obj = dict_neo4j_all[end_node_neo4j_id]
-
-                    start_node_obj.add_child(end_node_obj)
-
-    return dict_course[course_I_want]
+    if context is None:
+        context = TreeBuildContext()
+
+    subgraph = backend.subgraph(course_I_want, first_level=True)
+    if subgraph is None:
+        raise CourseNotFound(course_I_want)
+
+    # Same builder as the full tree, only the subgraph differs
+    build_subgraph(subgraph, context)
+
+    return context.dict_course[course_I_want]
 
 
 
@@ -355,41 +596,31 @@ def mark_completion(root: CourseNode, completed_courses_list: list[str]):
     implementation only works when the tree is fully constructed.
     """
     completed_courses = completed_courses_set(completed_courses_list)
-
-    def mark_completed_courses(node: CourseNode):
-        if node.label == "Course":
+    updated = set()
+
+    # One post-order pass: a node's completed only depends on its code, so it can be set after its children are updated.
+    # A node under many parents (the same CourseNode object) is only updated once
+    def update(node: CourseNode):
+        updated.add(id(node))
+        children = node.children
+        for child in children:
+            if id(child) not in updated:
+                update(child)
+
+        kind = node.kind
+        if kind is NodeKind.COURSE:
             node.completed = node.code in completed_courses
-        for child in node.children:
-            mark_completed_courses(child)
-
-    def update_parents(node: CourseNode):
-        # First, recursively update all children
-        for child in node.children:
-            update_parents(child)
-        
-        # Then, update the current node based on its children
-        if node.label == "OR":
-            node.marked = any(child.completed or child.marked for child in node.children)
-        elif node.label == "AND":
-            # This line marks the node as true if all children are either completed or marked
-            # It doesn't restrict children to be only all marked or all completed
-            # Instead, it allows for a mix of completed and marked children
-            node.marked = all(child.completed or child.marked for child in node.children)
-        elif node.label == "Course":
             # If a node has no children, it is ready to be taken
-            # If a node has children and all the children are marked, then the course node is ready to be taken 
-            if node.children:
-                if all(child.completed or child.marked for child in node.children):
-                    node.ready_to_take = True
-            elif not node.children:
+            # If a node has children and all the children are completed or marked, then the course node is ready to be taken
+            if all(child.completed or child.marked for child in children):
                 node.ready_to_take = True
- 
-
-    # Step 1: Mark completed courses
-    mark_completed_courses(root)
+        elif kind is NodeKind.OR:
+            node.marked = any(child.completed or child.marked for child in children)
+        else:
+            # Marked if all children are either completed or marked (a mix of both is allowed)
+            node.marked = all(child.completed or child.marked for child in children)
 
-    # Step 2: Update parent nodes from bottom up
-    update_parents(root)
+    update(root)
 
 
 def completed_courses_set(completed_courses_list: list[str]):
@@ -422,11 +653,11 @@ def tree_visualization(root: CourseNode):
         (node, count) = queue.pop(0)
 
 
-        if node.label == "Course":
+        if node.kind is NodeKind.COURSE:
             print(node.code, " - Level: ", count)
-        elif node.label == "AND":
+        elif node.kind is NodeKind.AND:
             print("AND" + " index: " + str(node.index), " - Level: ", count)
-        elif node.label == "OR":
+        elif node.kind is NodeKind.OR:
             print("OR" + " index: " + str(node.index), " - Level: ", count)
 
         # Enqueue all the children of the current node
@@ -446,25 +677,30 @@ def course_node_to_dict(node: CourseNode):
     Returns:
     - dict: A dictionary representation of the node (i.e. {"label": "Course", "code": "CSC108", "full_name": "Introduction to Computer Programming", "index": None, "children": [... nested dictionaries if has children ...]})
     """
-    node_dict = {
-        "label": node.label,
-        "marked": node.marked,
-        "ready_to_take": node.ready_to_take,
-        "completed": node.completed,
-    }
+    dicts = {}
+
+    # A node under many parents (the same CourseNode object) is only converted once, its dictionary is used under every parent
+    def convert(node: CourseNode):
+        node_dict = {
+            "label": KIND_LABELS[node.kind],
+            "marked": node.marked,
+            "ready_to_take": node.ready_to_take,
+            "completed": node.completed,
+        }
+
+        if node.kind is NodeKind.COURSE:
+            node_dict["code"] = node.code
+            node_dict["full_name"] = node.full_name
+        else:
+            node_dict["index"] = node.index
+        
+        if node.children:
+            node_dict["children"] = [dicts.get(id(child)) or convert(child) for child in node.children]
+        
+        dicts[id(node)] = node_dict
+        return node_dict
 
-    if node.label == "Course":
-        node_dict["code"] = node.code
-        node_dict["full_name"] = node.full_name
-    else:
-        node_dict["index"] = node.index
-    
-    if node.children:
-        node_dict["children"] = []
-        for child in node.children:
-            node_dict["children"].append(course_node_to_dict(child))
-    
-    return node_dict
+    return convert(node)
 
 
 
@@ -481,13 +717,14 @@ def find_all_course_nodes(root: CourseNode) -> list[CourseNode]:
     """
     all_nodes = []
 
-    def traverse(node):
-        if node.label == "Course":
+    # Iterative pre-order traversal
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.kind is NodeKind.COURSE:
             all_nodes.append(node)
-        for child in node.children:
-            traverse(child)
+        stack.extend(reversed(node.children))
 
-    traverse(root)
     return all_nodes
 
 
@@ -506,98 +743,62 @@ def commonality_algorithm(root_nodes: list[CourseNode]) -> dict[frozenset, set]:
     - List of root nodes of all course trees 
     - Find the list of course nodes that exist in every single course tree
     - For every course node, see if that same code course node exists in any other course tree
-        - set of unique course codes which map to a set containing the root nodes of the course trees that it exists in
-    - Take the intersection of the different sets
-        - e.g. if I want to take the intersection of S_1, S_2. I will loop the map, and see if each item is in both S_1 and S_2
-    - Take every possible intersection of different sets.
+        - unique course codes map to the set (a bitmask) of the root nodes of the course trees that they exist in
+    - Group the course codes by their exact set of root nodes, keeping the sets with more than one root
+        - each group is the commonality of its roots: the courses common to all of them and to no other root
+        - no subsets of the roots are enumerated, so this stays fast for many desired courses
     - Filter for desired output
     """
     list_of_course_codes = {}
     
     for root in root_nodes:
-        list_of_course_codes[root.code] = find_all_course_nodes(root)
+        list_of_course_codes[root.code] = [node.code for node in find_all_course_nodes(root)]
     
-    print(list_of_course_codes)
+    return commonality_from_course_codes(list_of_course_codes)
 
-    unique_set_course_codes = {}
 
-    # For each full list of course codes
-    for root_code, lst in list_of_course_codes.items():
-        
-        # for each node in each full list of course codes
-        for node in lst:
-            
-            if node.code not in unique_set_course_codes:
-                unique_set_course_codes[node.code] = set()
-            
-            unique_set_course_codes[node.code].add(root_code)
-    
-    
-    # filter the list of set size > 1
-    filtered_unique_set_course_codes = {k: v for k, v in unique_set_course_codes.items() if len(v) > 1}
-    
-    # Take all possible intersections of commonalities (largest to smallest)
-    combinations = {}
-    pwr_to_sub = {}
-
-    for code, root_set in filtered_unique_set_course_codes.items():
-
-        # Put all possible subsets of root_set as keys
-        root_pwr_set = powerset(root_set)
-        
-        # filter powerset to exclude length 1 and exclude itself
-        filtered_root_pwr_set = [subset for subset in root_pwr_set if len(subset) > 1 and frozenset(subset) != frozenset(root_set)]
-        
-        pwr_to_sub[frozenset(root_set)] = filtered_root_pwr_set
-
-
-        # Add code to each filtered_root_pwr_set and also the root (Since the power set excludes the root)
-        for set_combo in filtered_root_pwr_set:
-            f_set_combo = frozenset(set_combo)
-            if f_set_combo not in combinations:
-                combinations[f_set_combo] = set()
-            
-            combinations[f_set_combo].add(code)
-        
-        if frozenset(root_set) not in combinations:
-            combinations[frozenset(root_set)] = set()
-        combinations[frozenset(root_set)].add(code)
-
-
-    for k,v in pwr_to_sub.items():
-        print (k, v)
-
-    # Find the elements that appear in the root_set
-    # Find elements that appear in each of the subsets 
-    # if element appears in root_set AND subset, then delete the one in the subset
-    for intersection, subsets in pwr_to_sub.items():
-        if intersection in combinations:
-            biggest_commonality = combinations[intersection]
-            
-            for subset in subsets:
-                if frozenset(subset) in combinations:
-                    smaller_commonality = combinations[frozenset(subset)]
-                    # Remove courses from smaller_commonality that are in biggest_commonality
-                    filtered_commonality = [course for course in smaller_commonality if course not in biggest_commonality]
-                    if filtered_commonality:
-                        combinations[frozenset(subset)] = filtered_commonality
-                    else:
-                        del combinations[frozenset(subset)]
-    
-    return construct_dict(convert_frozenset_serializable(combinations), check_containment(combinations))
-
-
-def powerset(s: set) -> list[set]:
+def commonality_from_course_codes(list_of_course_codes: dict[str, list[str]]) -> dict:
     """
-    Helper function to find all possible subsets of a set
+    Same as commonality_algorithm, from the course codes of each tree instead of the trees (e.g. the codes of a PrerequisiteCircuit)
 
     Args:
-    - s (set): A set of elements
+    - list_of_course_codes (dict[str, list[str]]): The course codes of each course tree, by code of the root course
 
     Returns:
-    - list[set]: A list of all possible subsets of s
-    """
-    return [set(combo) for r in range(len(s) + 1) for combo in itertools.combinations(s, r)]
+    - dict: Same as commonality_algorithm
+    """
+    logger.debug("Course codes by root: %s", list_of_course_codes)
+
+    root_codes = list(list_of_course_codes)
+
+    # Signature of each course code: bitmask of the roots whose tree contains it (bit i for root_codes[i])
+    signatures = {}
+    for bit, root_code in enumerate(root_codes):
+        root_bit = 1 << bit
+        for code in list_of_course_codes[root_code]:
+            signatures[code] = signatures.get(code, 0) | root_bit
+
+    # Group the codes shared by more than one root by their exact signature
+    groups = {}
+    first_seen = {}
+    for position, (code, signature) in enumerate(signatures.items()):
+        if signature & (signature - 1):
+            if signature not in groups:
+                groups[signature] = []
+                first_seen[signature] = position
+            groups[signature].append(code)
+
+    # Keep the order of the old powerset algorithm: a group comes at the first code shared by (at least) all of its roots, smaller groups first
+    def group_order(signature):
+        first = min(position for other, position in first_seen.items() if other & signature == signature)
+        return (first, signature.bit_count())
+
+    combinations = {}
+    for signature in sorted(groups, key=group_order):
+        roots = frozenset(root_code for bit, root_code in enumerate(root_codes) if signature >> bit & 1)
+        combinations[roots] = groups[signature]
+    
+    return construct_dict(convert_frozenset_serializable(combinations), check_containment(combinations))
 
 
 def construct_dict(commonality_dict: dict[str, list], containment_relationships: dict[str, list]) -> dict:
@@ -0,0 +1,145 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+# File the worker processes of a server share their commands through (snapshot reloads, cache clears, timing resets).
+# Not set: one file per gunicorn master in the temporary directory. Set it when the workers don't share a parent process (e.g. several uvicorn processes on one host)
+WORKER_COMMANDS_FILE = os.getenv("WORKER_COMMANDS_FILE")
+
+
+def default_path(server_pid: int) -> str:
+    """
+    The commands file of the workers of a server process (the gunicorn master) when WORKER_COMMANDS_FILE is not set
+    """
+    return os.path.join(tempfile.gettempdir(), f"uoft_proj_api-{server_pid}.commands")
+
+
+class WorkerCommands():
+    """
+    Commands sent to every worker process of a server, through an append-only file of JSON lines.
+    The worker that receives the request (e.g. POST /snapshot/) publishes the command and runs it, the other workers read it the next time they poll (before each request)
+
+    Attributes:
+    - path (str): The path of the commands file, None to use WORKER_COMMANDS_FILE or the file of the parent process (default_path)
+
+    Notes:
+    - A worker only runs the commands published after it started (or was forked), its caches and snapshot are new anyway
+    - The file grows by one short line per command, commands are rare admin requests
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        # Process the position below belongs to, a forked worker starts over from the end of the file
+        self._pid = None
+        self._offset = 0
+        self._counts = {}
+        self._pending = []
+
+
+    def file_path(self) -> str:
+        # Resolved in the worker, the parent process of every gunicorn worker is the master
+        return self.path or WORKER_COMMANDS_FILE or default_path(os.getppid())
+
+
+    def publish(self, action: str, **arguments) -> int:
+        """
+        Send a command to the other workers
+
+        Args:
+        - action (str): The command (e.g. "snapshot", "cache", "timing")
+        - arguments: The arguments of the command, JSON serializable
+
+        Returns:
+        - int: The number of action commands published so far, this one included (e.g. the version of a snapshot reload)
+        """
+        with self._lock, self._open(fcntl.LOCK_EX) as file:
+            self._read_new(file)
+            count = self._counts.get(action, 0) + 1
+            file.write(json.dumps({"action": action, "count": count, **arguments}).encode("utf-8") + b"\n")
+            file.flush()
+            self._counts[action] = count
+            self._offset = file.tell()
+        return count
+
+
+    def poll(self) -> list[dict]:
+        """
+        The commands the other workers published since the last poll, in order
+
+        Returns:
+        - list[dict]: ({action: str, count: int, ...arguments}) for each command, empty if there is none (one os.stat when nothing changed)
+        """
+        if self._pid == os.getpid() and not self._pending:
+            try:
+                if os.stat(self.file_path()).st_size == self._offset:
+                    return []
+            except FileNotFoundError:
+                return []
+
+        with self._lock, self._open(fcntl.LOCK_SH) as file:
+            self._read_new(file)
+            commands, self._pending = self._pending, []
+        return commands
+
+
+    def count(self, action: str) -> int:
+        """
+        The number of action commands published so far by every worker (the ones this worker didn't poll yet included)
+        """
+        with self._lock, self._open(fcntl.LOCK_SH) as file:
+            self._read_new(file)
+            return self._counts.get(action, 0)
+
+
+    def _open(self, lock: int):
+        """
+        Open the commands file (created if needed) with a lock held until it is closed
+        """
+        return _LockedFile(self.file_path(), lock)
+
+
+    def _read_new(self, file):
+        """
+        Read the lines added since the last read into _pending and _counts. Called with self._lock and the file lock held
+        """
+        started = self._pid == os.getpid()
+        if not started:
+            self._pid = os.getpid()
+            self._offset = 0
+            self._counts = {}
+            self._pending = []
+
+        file.seek(self._offset)
+        for line in file:
+            command = json.loads(line)
+            self._counts[command["action"]] = command["count"]
+            if started:
+                self._pending.append(command)
+        self._offset = file.tell()
+
+
+class _LockedFile():
+    """
+    Context manager opening a file in binary append/read mode with an flock held until it is closed
+    """
+
+    def __init__(self, path: str, lock: int):
+        self.path = path
+        self.lock = lock
+        self.file = None
+
+
+    def __enter__(self):
+        self.file = open(self.path, "a+b")
+        fcntl.flock(self.file, self.lock)
+        return self.file
+
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        finally:
+            self.file.close()